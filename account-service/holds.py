@@ -0,0 +1,262 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, update
+
+from models import Account, AccountHold
+
+logger = logging.getLogger("account-service.holds")
+
+HELD = "HELD"
+CAPTURED = "CAPTURED"
+RELEASED = "RELEASED"
+EXPIRED = "EXPIRED"
+
+
+class HoldError(Exception):
+    pass
+
+
+def available_balance(account):
+    return account.balance - (account.held_amount or 0)
+
+
+def place_hold(db, account_id, amount, reference=None, ttl_seconds=3600):
+    """Reserve `amount` against the available balance; the caller commits.
+
+    The check and the reservation are one conditional UPDATE, so two holds
+    racing for the last of the balance cannot both succeed. A `reference`
+    makes the call idempotent: placing it again returns the same hold.
+    """
+    if amount <= 0:
+        raise HoldError("Hold amount must be positive")
+
+    if reference is not None:
+        # a retried placement returns the first hold; a voided reference stays void
+        existing = _hold_for_reference(db, reference)
+        if existing is not None:
+            if existing.status == HELD and existing.account_id == account_id and existing.amount == amount:
+                return existing
+            raise HoldError(f"Hold {reference} is {existing.status}")
+
+    reserved = db.query(Account).filter(
+        Account.account_id == account_id,
+        Account.status == "ACTIVE",
+        Account.balance - Account.held_amount >= amount
+    ).update(
+        {Account.held_amount: Account.held_amount + amount},
+        synchronize_session=False
+    )
+
+    if not reserved:
+        exists = db.query(Account.account_id).filter(Account.account_id == account_id).first()
+        if not exists:
+            raise LookupError(account_id)
+        raise HoldError("Insufficient funds")
+
+    now = datetime.utcnow()
+    hold = AccountHold(
+        account_id=account_id,
+        amount=amount,
+        reference=reference,
+        status=HELD,
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds)
+    )
+    db.add(hold)
+    db.flush()
+    return hold
+
+
+def _close_holds(db, holds, status, debit):
+    """Move HELD `holds` to `status`, adjusting each account once.
+
+    Per-account totals go out as one executemany UPDATE; `debit` also takes
+    the amount off the balance (capture) rather than only freeing it.
+    """
+    if not holds:
+        return
+
+    totals = defaultdict(float)
+    for hold in holds:
+        totals[hold.account_id] += hold.amount
+
+    accounts = Account.__table__
+    stmt = (
+        update(accounts)
+        .where(accounts.c.account_id == bindparam("b_account_id"))
+        .values(held_amount=accounts.c.held_amount - bindparam("b_amount"))
+    )
+    if debit:
+        stmt = stmt.values(balance=accounts.c.balance - bindparam("b_amount"))
+
+    db.execute(
+        stmt,
+        [{"b_account_id": account_id, "b_amount": amount} for account_id, amount in totals.items()]
+    )
+
+    db.query(AccountHold).filter(
+        AccountHold.hold_id.in_([hold.hold_id for hold in holds])
+    ).update(
+        {AccountHold.status: status, AccountHold.closed_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+
+
+def _hold_for_reference(db, reference):
+    # FOR UPDATE on the indexed reference also locks the gap when no row
+    # exists yet, so a placement and a void of one reference serialise
+    return (
+        db.query(AccountHold)
+        .filter(AccountHold.reference == reference)
+        .order_by(AccountHold.hold_id)
+        .with_for_update()
+        .first()
+    )
+
+
+def void_hold(db, account_id, reference):
+    """Cancel the hold placed under `reference`, whether or not it exists yet.
+
+    A HELD hold is released. When no hold exists, a RELEASED marker with no
+    amount is written so a placement still in flight is refused. Used when
+    the caller lost the reply to a placement; the caller commits.
+    """
+    hold = _hold_for_reference(db, reference)
+    if hold is None:
+        now = datetime.utcnow()
+        hold = AccountHold(
+            account_id=account_id,
+            amount=0,
+            reference=reference,
+            status=RELEASED,
+            created_at=now,
+            expires_at=now,
+            closed_at=now
+        )
+        db.add(hold)
+        db.flush()
+    elif hold.status == HELD:
+        _close_holds(db, [hold], RELEASED, debit=False)
+    return hold
+
+
+def release_hold(db, hold_id):
+    hold = db.query(AccountHold).filter(AccountHold.hold_id == hold_id).with_for_update().first()
+    if not hold:
+        raise LookupError(hold_id)
+    if hold.status != HELD:
+        raise HoldError(f"Hold is {hold.status}")
+
+    _close_holds(db, [hold], RELEASED, debit=False)
+    return hold
+
+
+def capture_holds(db, hold_ids, as_of=None):
+    """Capture a batch of holds; the caller commits.
+
+    Live holds are debited, with one balance UPDATE per account. Holds
+    already captured are reported as such so a retried settlement does
+    not fail; anything else comes back with a reason.
+    """
+    as_of = as_of or datetime.utcnow()
+    hold_ids = list(dict.fromkeys(hold_ids))
+
+    holds = (
+        db.query(AccountHold)
+        .filter(AccountHold.hold_id.in_(hold_ids))
+        .order_by(AccountHold.hold_id)
+        .with_for_update()
+        .all()
+    ) if hold_ids else []
+    by_id = {hold.hold_id: hold for hold in holds}
+
+    live = []
+    already_captured = []
+    failed = []
+    for hold_id in hold_ids:
+        hold = by_id.get(hold_id)
+        if hold is None:
+            failed.append({"hold_id": hold_id, "error": "Hold not found"})
+        elif hold.status == CAPTURED:
+            already_captured.append(hold_id)
+        elif hold.status != HELD:
+            failed.append({"hold_id": hold_id, "error": f"Hold is {hold.status}"})
+        elif hold.expires_at <= as_of:
+            failed.append({"hold_id": hold_id, "error": "Hold expired"})
+        else:
+            live.append(hold)
+
+    _close_holds(db, live, CAPTURED, debit=True)
+
+    return {
+        "captured": [hold.hold_id for hold in live],
+        "already_captured": already_captured,
+        "failed": failed
+    }
+
+
+# -------------------------------
+# EXPIRY
+# -------------------------------
+def expire_holds(session_factory, as_of=None, batch_size=1000):
+    """Free every HELD hold past its expiry, `batch_size` holds per commit."""
+    as_of = as_of or datetime.utcnow()
+    expired = 0
+
+    db = session_factory()
+    try:
+        while True:
+            batch = (
+                db.query(AccountHold)
+                .filter(AccountHold.status == HELD, AccountHold.expires_at <= as_of)
+                .order_by(AccountHold.expires_at)
+                .limit(batch_size)
+                .with_for_update()
+                .all()
+            )
+            if not batch:
+                break
+
+            _close_holds(db, batch, EXPIRED, debit=False)
+            db.commit()
+            expired += len(batch)
+
+            if len(batch) < batch_size:
+                break
+    finally:
+        db.close()
+
+    if expired:
+        logger.info("Expired %s account holds", expired)
+    return expired
+
+
+class HoldExpirer:
+    """Runs expire_holds every `interval` seconds."""
+
+    def __init__(self, session_factory, interval=60, batch_size=1000):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="hold-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _loop(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                expire_holds(self.session_factory, batch_size=self.batch_size)
+            except Exception:
+                logger.exception("Hold expiry run failed")
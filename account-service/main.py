@@ -1,14 +1,41 @@
 from fastapi import FastAPI, HTTPException
 from database import SessionLocal, engine
 from models import Base, Account
-from schemas import AccountCreate, AccountResponse, BalanceUpdateRequest
+from schemas import (
+    AccountCreate,
+    AccountResponse,
+    BalanceUpdateRequest,
+    AccountBatchRequest,
+    HoldRequest,
+    HoldVoidRequest,
+    HoldResponse,
+    HoldCaptureRequest
+)
+from holds import HoldError, HoldExpirer, available_balance, capture_holds, place_hold, release_hold, void_hold
+from migrations import migrate
+from collections import OrderedDict
+import threading
 import requests
 import random
 
 CUSTOMER_SERVICE_URL = "http://127.0.0.1:8000"
 
+# Upper bound on ids accepted by one batch lookup (single IN-list statement)
+MAX_BATCH_ACCOUNTS = 5000
+
+# Customer statuses remembered for If-None-Match revalidation
+CUSTOMER_STATUS_CACHE_SIZE = 10000
+
+# Authorisation holds
+DEFAULT_HOLD_TTL_SECONDS = 7 * 24 * 3600
+MAX_HOLD_TTL_SECONDS = 30 * 24 * 3600
+HOLD_EXPIRY_INTERVAL = 60
+HOLD_EXPIRY_BATCH_SIZE = 1000
+MAX_CAPTURE_BATCH = 5000
+
 app = FastAPI(title="Account Service")
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -20,6 +47,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# keep-alive connections to customer-service
+http = requests.Session()
+
+customer_status_cache = OrderedDict()   # customer_id -> (etag, status)
+customer_status_lock = threading.Lock()
+
+
+def fetch_customer_status(customer_id: int):
+    """Customer status via conditional GET; a 304 reuses the cached copy.
+
+    Returns None if the customer does not exist. Raises RequestException if
+    customer-service cannot be reached.
+    """
+    with customer_status_lock:
+        cached = customer_status_cache.get(customer_id)
+
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    resp = http.get(
+        f"{CUSTOMER_SERVICE_URL}/customers/{customer_id}/status",
+        headers=headers,
+        timeout=5
+    )
+
+    if resp.status_code == 304 and cached:
+        return cached[1]
+    if resp.status_code != 200:
+        return None
+
+    status = resp.json()
+    etag = resp.headers.get("ETag")
+    if etag:
+        with customer_status_lock:
+            customer_status_cache[customer_id] = (etag, status)
+            customer_status_cache.move_to_end(customer_id)
+            while len(customer_status_cache) > CUSTOMER_STATUS_CACHE_SIZE:
+                customer_status_cache.popitem(last=False)
+    return status
+
+
+hold_expirer = HoldExpirer(
+    SessionLocal,
+    interval=HOLD_EXPIRY_INTERVAL,
+    batch_size=HOLD_EXPIRY_BATCH_SIZE
+)
+
+
+@app.on_event("startup")
+def start_hold_expirer():
+    hold_expirer.start()
+
+
+@app.on_event("shutdown")
+def stop_hold_expirer():
+    hold_expirer.stop()
+
+
 @app.get("/health")
 def health_check():
     return {
@@ -36,20 +119,15 @@ def create_account(data: AccountCreate):
 
     # 🔗 Validate customer
     try:
-        resp = requests.get(
-            f"{CUSTOMER_SERVICE_URL}/customers/{data.customer_id}/status",
-            timeout=5
-        )
+        customer = fetch_customer_status(data.customer_id)
     except requests.exceptions.RequestException:
         db.close()
         raise HTTPException(status_code=503, detail="Customer service unavailable")
 
-    if resp.status_code != 200:
+    if customer is None:
         db.close()
         raise HTTPException(status_code=400, detail="Customer not found")
 
-    customer = resp.json()
-
     if customer["status"] != "ACTIVE":
         db.close()
         raise HTTPException(status_code=400, detail="Customer not active")
@@ -113,7 +191,8 @@ def update_balance(account_id: int, data: BalanceUpdateRequest):
         db.close()
         raise HTTPException(status_code=404, detail="Account not found")
 
-    if account.balance + data.amount < 0:
+    # funds under an authorisation hold cannot be spent again
+    if available_balance(account) + data.amount < 0:
         db.close()
         raise HTTPException(status_code=400, detail="Insufficient funds")
 
@@ -129,6 +208,63 @@ def update_balance(account_id: int, data: BalanceUpdateRequest):
         "new_balance": new_balance
     }
 
+def account_details(account):
+    return {
+        "account_id": account.account_id,
+        "customer_id": account.customer_id,   # 🔥 ADD THIS
+        "branch_id": account.branch_id,
+        "account_type": account.account_type,
+        "balance": account.balance,
+        "available_balance": available_balance(account),
+        "status": account.status
+    }
+
+
+# -----------------------------
+# BATCH LOOKUP (USED BY BULK CARD ISSUANCE)
+# -----------------------------
+@app.post("/accounts/batch")
+def get_accounts_batch(data: AccountBatchRequest):
+    account_ids = list(dict.fromkeys(data.account_ids))
+    if len(account_ids) > MAX_BATCH_ACCOUNTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_ACCOUNTS} accounts per request"
+        )
+
+    db = SessionLocal()
+    try:
+        accounts = db.query(Account).filter(Account.account_id.in_(account_ids)).all() if account_ids else []
+        found = [account_details(a) for a in accounts]
+    finally:
+        db.close()
+
+    found_ids = {a["account_id"] for a in found}
+    return {
+        "accounts": found,
+        "missing": [i for i in account_ids if i not in found_ids]
+    }
+
+
+# -----------------------------
+# ACCOUNTS OF A CUSTOMER (CUSTOMER 360)
+# -----------------------------
+@app.get("/accounts/customer/{customer_id}")
+def get_customer_accounts(customer_id: int, limit: int = 100):
+    db = SessionLocal()
+    try:
+        accounts = (
+            db.query(Account)
+            .filter(Account.customer_id == customer_id)
+            .order_by(Account.account_id)
+            .limit(min(max(limit, 1), 500))
+            .all()
+        )
+        return [account_details(a) for a in accounts]
+    finally:
+        db.close()
+
+
 @app.get("/accounts/{account_id}")
 def get_account(account_id: int):
     db = SessionLocal()
@@ -140,17 +276,86 @@ def get_account(account_id: int):
         db.close()
         raise HTTPException(status_code=404, detail="Account not found")
 
-    response = {
-        "account_id": account.account_id,
-        "customer_id": account.customer_id,   # 🔥 ADD THIS
-        "branch_id": account.branch_id,
-        "account_type": account.account_type,
-        "balance": account.balance,
-        "status": account.status
-    }
+    response = account_details(account)
 
     db.close()
     return response
 
 
+# -----------------------------
+# AUTHORISATION HOLDS (USED BY CARD SERVICE)
+# -----------------------------
+@app.post("/accounts/{account_id}/holds", response_model=HoldResponse)
+def create_hold(account_id: int, data: HoldRequest):
+    ttl = data.ttl_seconds or DEFAULT_HOLD_TTL_SECONDS
+    if ttl < 1 or ttl > MAX_HOLD_TTL_SECONDS:
+        raise HTTPException(status_code=400, detail="Invalid hold expiry")
 
+    db = SessionLocal()
+    try:
+        hold = place_hold(db, account_id, data.amount, reference=data.reference, ttl_seconds=ttl)
+        db.commit()
+        db.refresh(hold)
+        return hold
+    except LookupError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Account not found")
+    except HoldError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        db.close()
+
+
+@app.post("/accounts/{account_id}/holds/void", response_model=HoldResponse)
+def void_account_hold(account_id: int, data: HoldVoidRequest):
+    db = SessionLocal()
+    try:
+        hold = void_hold(db, account_id, data.reference)
+        db.commit()
+        db.refresh(hold)
+        return hold
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@app.post("/accounts/holds/{hold_id}/release", response_model=HoldResponse)
+def release_account_hold(hold_id: int):
+    db = SessionLocal()
+    try:
+        hold = release_hold(db, hold_id)
+        db.commit()
+        db.refresh(hold)
+        return hold
+    except LookupError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Hold not found")
+    except HoldError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    finally:
+        db.close()
+
+
+@app.post("/accounts/holds/capture")
+def capture_account_holds(data: HoldCaptureRequest):
+    if len(data.hold_ids) > MAX_CAPTURE_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_CAPTURE_BATCH} holds per request"
+        )
+
+    db = SessionLocal()
+    try:
+        result = capture_holds(db, data.hold_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return result
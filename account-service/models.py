@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from datetime import datetime
 from database import Base
 
@@ -6,11 +6,12 @@ class Account(Base):
     __tablename__ = "accounts"
 
     account_id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False, index=True)
 
     branch_id = Column(Integer, nullable=False)   # 🔥 will control this
     account_type = Column(String(20), nullable=False)
     balance = Column(Float, nullable=False)
+    held_amount = Column(Float, nullable=False, default=0)   # sum of HELD holds
     status = Column(String(20), nullable=False, default="ACTIVE")
 
     created_at = Column(
@@ -18,3 +19,20 @@ class Account(Base):
         default=datetime.utcnow,
         nullable=False
     )
+
+
+class AccountHold(Base):
+    __tablename__ = "account_holds"
+    __table_args__ = (
+        Index("ix_account_holds_status_expires", "status", "expires_at"),
+    )
+
+    hold_id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, nullable=False, index=True)
+    amount = Column(Float, nullable=False)
+    reference = Column(String(64), index=True)
+    status = Column(String(20), nullable=False, default="HELD")   # HELD / CAPTURED / RELEASED / EXPIRED
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    closed_at = Column(DateTime)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class AccountCreate(BaseModel):
     customer_id: int
@@ -22,3 +23,32 @@ class AccountResponse(BaseModel):
 
 class BalanceUpdateRequest(BaseModel):
     amount: float
+
+
+class AccountBatchRequest(BaseModel):
+    account_ids: List[int]
+
+
+class HoldRequest(BaseModel):
+    amount: float
+    reference: Optional[str] = None
+    ttl_seconds: Optional[int] = None
+
+
+class HoldVoidRequest(BaseModel):
+    reference: str
+
+
+class HoldResponse(BaseModel):
+    hold_id: int
+    account_id: int
+    amount: float
+    status: str
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class HoldCaptureRequest(BaseModel):
+    hold_ids: List[int]
@@ -1,12 +1,55 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+import httpx
+import re
 import requests
 from fastapi.middleware.cors import CORSMiddleware
-from routes import dashboard
+from routes import dashboard, customer360
+from services import SERVICES, close_client, get_client
+from response_cache import ResponseCache, ResponseCacheMiddleware
+from pydantic import BaseModel
+from typing import List, Optional
+
+# -------------------------------
+# GATEWAY RESPONSE CACHE
+# -------------------------------
+# GET routes served from the cache: (gateway path pattern, TTL seconds,
+# stale-while-revalidate seconds). Origin Cache-Control can only shorten these.
+# Account reads are not cached: balances change through service-to-service
+# calls that never pass the gateway, so nothing here could purge them.
+CACHE_RULES = [
+    (r"/customer/customers/\d+", 30, 60),
+    (r"/dashboard/overview", 30, 120),
+]
+CACHE_MAX_ENTRIES = 10000
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_MAX_ENTRY_BYTES = 1024 * 1024
+# A write proxied to /{service}/{collection}/{id}/... purges the cached /{service}/{collection}/{id}
+CACHE_PURGED_RESOURCE = re.compile(r"/[^/]+/[^/]+/\d+")
 
 
+class CachePurgeRequest(BaseModel):
+    service: Optional[str] = None     # paths below are then relative to that service
+    paths: List[str] = []
+    prefixes: List[str] = []
+    purge_all: bool = False
+
+
+response_cache = ResponseCache(
+    CACHE_RULES,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    max_entry_bytes=CACHE_MAX_ENTRY_BYTES
+)
+
 app = FastAPI(title="Core Banking API Gateway")
 
 app.include_router(dashboard.router)
+app.include_router(customer360.router)
+
+# added before CORS so CORS stays outermost and cached bodies carry no CORS headers
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,43 +59,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def close_service_client():
+    await close_client()
+
 # -------------------------------
-# SERVICE ROUTES
+# CACHE ADMIN (BEFORE THE CATCH-ALL PROXY)
 # -------------------------------
-SERVICES = {
-    "customer": "http://127.0.0.1:8000",
-    "account": "http://127.0.0.1:8001",
-    "transaction": "http://127.0.0.1:8002",
-    "ledger": "http://127.0.0.1:8003",
-    "card": "http://127.0.0.1:8004",
-    "complaint": "http://127.0.0.1:8005",
-    "loan": "http://127.0.0.1:8006",
-    "fraud": "http://127.0.0.1:8007"
-}
+# async: the cache is only ever touched from the event loop, never a threadpool
+@app.post("/cache/purge")
+async def purge_cache(data: CachePurgeRequest):
+    if data.service is not None and data.service not in SERVICES:
+        raise HTTPException(status_code=404, detail="Service not found")
+    if not (data.paths or data.prefixes or data.purge_all):
+        raise HTTPException(status_code=400, detail="Give paths, prefixes or purge_all")
+
+    base = f"/{data.service}" if data.service else ""
+    removed = response_cache.purge(
+        paths=[base + p for p in data.paths],
+        prefixes=[base + p for p in data.prefixes],
+        everything=data.purge_all
+    )
+    return {"status": "purged", "entries_removed": removed}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
 
 # -------------------------------
 # GENERIC PROXY HANDLER
 # -------------------------------
-@app.api_route("/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+# Connection-level headers; they describe one hop and are never forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade"
+}
+
+
+def forward_headers(raw_headers, drop=()):
+    """Raw (name, value) pairs minus hop-by-hop headers and any in `drop`."""
+    skip = set(HOP_BY_HOP_HEADERS) | set(drop)
+    for name, value in raw_headers:
+        if name.lower() == b"connection":
+            # Connection can name further per-hop headers
+            skip.update(token.strip().lower() for token in value.decode("latin-1").split(","))
+    return [
+        (name, value) for name, value in raw_headers
+        if name.decode("latin-1").lower() not in skip
+    ]
+
+
+@app.api_route("/{service}/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"])
 async def proxy(service: str, path: str, request: Request):
     if service not in SERVICES:
         raise HTTPException(status_code=404, detail="Service not found")
 
-    url = f"{SERVICES[service]}/{path}"
+    url = f"/{path}"
+    if request.url.query:
+        url += f"?{request.url.query}"
+
+    headers = forward_headers(request.headers.raw, drop=("host",))
+    if request.client:
+        headers.append((b"x-forwarded-for", request.client.host.encode("latin-1")))
+    headers.append((b"x-forwarded-proto", request.url.scheme.encode("latin-1")))
+    headers.append((b"x-forwarded-host", request.headers.get("host", "").encode("latin-1")))
+
+    # only stream a body the client actually sent; a Content-Length is kept as is
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+    client = get_client(service)
+    upstream_request = client.build_request(
+        request.method,
+        url,
+        headers=headers,
+        content=request.stream() if has_body else None
+    )
 
     try:
-        response = requests.request(
-            method=request.method,
-            url=url,
-            headers={k: v for k, v in request.headers.items() if k != "host"},
-            params=request.query_params,
-            json=await request.json() if request.method in ["POST", "PUT"] else None,
-            timeout=10
-        )
-    except requests.exceptions.RequestException:
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Service timed out")
+    except httpx.HTTPError:
         raise HTTPException(status_code=503, detail="Service unavailable")
 
-    return response.json()
+    if request.method not in ("GET", "HEAD"):
+        resource = CACHE_PURGED_RESOURCE.match(f"/{service}/{path}")
+        if resource:
+            response_cache.purge(paths=[resource.group(0)])
+
+    # raw bytes: the body (and any Content-Encoding) goes through untouched
+    response = StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        background=BackgroundTask(upstream.aclose)
+    )
+    response.raw_headers = forward_headers(upstream.headers.raw)
+    return response
 
 @app.get("/dashboard/overview")
 def dashboard_overview():
@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("api-gateway.response_cache")
+
+# Cache-Control directives that keep a response out of a shared cache
+UNCACHEABLE_DIRECTIVES = ("no-store", "private")
+# Headers a 304 may update, and the only ones replayed on a 304 to the client
+REVALIDATE_HEADERS = (b"etag", b"cache-control", b"vary", b"last-modified", b"expires")
+
+
+def parse_cache_control(value):
+    """Directive -> value (None for bare directives), names lower-cased."""
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _seconds(directives, name):
+    try:
+        return max(int(directives[name]), 0)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak = lambda tag: tag.strip().removeprefix("W/")
+    return weak(etag) in {weak(tag) for tag in if_none_match.split(",")}
+
+
+class CacheRule:
+    def __init__(self, pattern, ttl, stale):
+        self.pattern = re.compile(pattern)
+        self.ttl = ttl
+        self.stale = stale
+
+
+class CacheEntry:
+    __slots__ = ("headers", "body", "etag", "stored_at", "fresh_until", "stale_until", "size")
+
+    def __init__(self, headers, body, ttl, stale):
+        now = time.monotonic()
+        self.headers = headers
+        self.body = body
+        self.etag = _header(headers, b"etag")
+        self.stored_at = now
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+
+    def renew(self, ttl, stale):
+        now = time.monotonic()
+        self.size = len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+        self.stored_at = now
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+
+
+# -------------------------------
+# GATEWAY RESPONSE CACHE
+# -------------------------------
+class ResponseCache:
+    """Size-bounded LRU of GET responses, keyed by path, query and encoding.
+
+    Only routes matching a rule are cached, each with its own TTL and
+    stale-while-revalidate window. Origin Cache-Control wins where it is
+    stricter: no-store/private responses are never kept, max-age/s-maxage
+    shorten the TTL, no-cache forces revalidation and must-revalidate
+    disables stale serving. `purge` bumps a generation so responses still
+    in flight from before the purge are not stored.
+    """
+
+    def __init__(self, rules, max_entries=10000, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.rules = [CacheRule(*rule) for rule in rules]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counters = dict.fromkeys(
+            ("hits", "stale_hits", "misses", "revalidated", "stores", "evictions", "purged", "bypassed"), 0
+        )
+
+    def count(self, name):
+        self._counters[name] += 1
+
+    def rule_for(self, path):
+        for rule in self.rules:
+            if rule.pattern.fullmatch(path):
+                return rule
+        return None
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def policy(self, rule, status, headers):
+        """(ttl, stale) for a response, or None if it must not be stored."""
+        if status != 200 or _header(headers, b"set-cookie") is not None:
+            return None
+
+        vary = _header(headers, b"vary")
+        if vary and {v.strip().lower() for v in vary.split(",")} - {"accept-encoding"}:
+            return None
+
+        directives = parse_cache_control(_header(headers, b"cache-control"))
+        if any(d in directives for d in UNCACHEABLE_DIRECTIVES):
+            return None
+
+        ttl, stale = rule.ttl, rule.stale
+        max_age = _seconds(directives, "s-maxage")
+        if max_age is None:
+            max_age = _seconds(directives, "max-age")
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+        if "no-cache" in directives:
+            if _header(headers, b"etag") is None:
+                return None
+            ttl = 0
+        if "no-cache" in directives or "must-revalidate" in directives:
+            stale = 0
+        elif _seconds(directives, "stale-while-revalidate") is not None:
+            stale = min(stale, _seconds(directives, "stale-while-revalidate"))
+        return ttl, stale
+
+    def store(self, key, generation, rule, status, headers, body):
+        if generation != self.generation:
+            return False
+        # whatever came back supersedes the old entry, cacheable or not
+        self._drop(key)
+        policy = self.policy(rule, status, headers)
+        if policy is None or len(body) > self.max_entry_bytes:
+            return False
+
+        entry = CacheEntry(headers, body, *policy)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self.count("stores")
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.count("evictions")
+        return True
+
+    def renew(self, key, entry, rule, headers):
+        """A 304 confirmed `entry`; refresh its lifetime and validators."""
+        # headers the 304 carries replace the stored ones; the rest are kept
+        updated = [(k, v) for k, v in headers if k.lower() in REVALIDATE_HEADERS]
+        replaced = {k.lower() for k, _ in updated}
+        merged = [(k, v) for k, v in entry.headers if k.lower() not in replaced] + updated
+        policy = self.policy(rule, 200, merged)
+        if policy is None:
+            self._drop(key)
+            return
+        if self._entries.get(key) is entry:
+            size = entry.size
+            entry.headers = merged
+            entry.renew(*policy)
+            self._bytes += entry.size - size
+        else:
+            entry.headers = merged
+            entry.renew(*policy)
+        self.count("revalidated")
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def purge(self, paths=(), prefixes=(), everything=False):
+        self.generation += 1
+        if everything:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        else:
+            paths = set(paths)
+            doomed = [
+                key for key in self._entries
+                if key[0] in paths or any(key[0].startswith(p) for p in prefixes)
+            ]
+            for key in doomed:
+                self._drop(key)
+            removed = len(doomed)
+        self._counters["purged"] += removed
+        return removed
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            **self._counters
+        }
+
+
+# -------------------------------
+# ASGI MIDDLEWARE
+# -------------------------------
+def _conditional_headers(headers, etag):
+    """Request headers for a gateway-initiated fetch: the client's own
+    validators and cache directives are replaced by the cached ETag."""
+    kept = [
+        (k, v) for k, v in headers
+        if k.lower() not in (b"if-none-match", b"if-modified-since", b"cache-control")
+    ]
+    if etag:
+        kept.append((b"if-none-match", etag.encode("latin-1")))
+    return kept
+
+
+def _empty_receive():
+    """ASGI receive for a bodiless internal request that never disconnects."""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # streaming responses listen for a disconnect; wait until they are done
+        await asyncio.Event().wait()
+
+    return receive
+
+
+class ResponseCacheMiddleware:
+    """Serves cacheable GET/HEAD requests from a ResponseCache.
+
+    A miss streams the response to the client while copying it into the
+    cache. A stale entry inside its stale-while-revalidate window is served
+    at once and refreshed in the background (one refresh per key); an
+    expired entry with an ETag is revalidated with If-None-Match. Requests
+    with Authorization, or Cache-Control no-store, bypass the cache;
+    no-cache from the client forces a refetch.
+    """
+
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+        self._refreshing = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+
+        rule = self.cache.rule_for(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        headers = scope["headers"]
+        request_cc = parse_cache_control(_header(headers, b"cache-control"))
+        if "no-store" in request_cc or _header(headers, b"authorization") is not None:
+            self.cache.count("bypassed")
+            return await self.app(scope, receive, send)
+
+        key = (scope["path"], scope["query_string"], _header(headers, b"accept-encoding") or "")
+        entry = None if "no-cache" in request_cc else self.cache.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.cache.count("hits")
+                return await self._send_entry(scope, send, entry, "HIT")
+            if now < entry.stale_until:
+                self.cache.count("stale_hits")
+                self._refresh_later(key, rule, scope, entry)
+                return await self._send_entry(scope, send, entry, "STALE")
+
+        self.cache.count("misses")
+        if scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        # an expired entry with an ETag is revalidated on the way
+        validator = entry if entry is not None and entry.etag else None
+        await self._fetch_through(key, rule, scope, receive, send, validator)
+
+    # -------------------------------
+    # SERVING
+    # -------------------------------
+    async def _send_entry(self, scope, send, entry, state):
+        age = str(int(time.monotonic() - entry.stored_at)).encode()
+        extra = [(b"age", age), (b"x-cache", state.encode())]
+
+        if etag_matches(_header(scope["headers"], b"if-none-match"), entry.etag):
+            kept = [(k, v) for k, v in entry.headers if k.lower() in REVALIDATE_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": kept + extra})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({"type": "http.response.start", "status": 200, "headers": entry.headers + extra})
+        body = b"" if scope["method"] == "HEAD" else entry.body
+        await send({"type": "http.response.body", "body": body})
+
+    async def _fetch_through(self, key, rule, scope, receive, send, entry=None):
+        """Stream a miss to the client, keeping a copy if it fits.
+
+        With `entry`, the request carries its ETag; a 304 renews the entry
+        and the cached body is sent instead.
+        """
+        generation = self.cache.generation
+        captured = {"status": None, "headers": None, "chunks": [], "size": 0}
+
+        client_scope = scope
+        if entry is not None:
+            scope = dict(scope, headers=_conditional_headers(scope["headers"], entry.etag))
+
+        async def tee(message):
+            if captured["status"] == 304 and entry is not None:
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    if generation == self.cache.generation:
+                        self.cache.renew(key, entry, rule, captured["headers"])
+                    await self._send_entry(client_scope, send, entry, "REVALIDATED")
+                return
+
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+                if captured["status"] == 304 and entry is not None:
+                    return
+                message = dict(message, headers=captured["headers"] + [(b"x-cache", b"MISS")])
+            elif captured["status"] == 304:
+                # the client's own If-None-Match matched: pass it on, nothing to store
+                pass
+            elif message["type"] == "http.response.body" and captured["size"] <= self.cache.max_entry_bytes:
+                body = message.get("body", b"")
+                captured["chunks"].append(body)
+                captured["size"] += len(body)
+                if not message.get("more_body", False):
+                    self.cache.store(
+                        key, generation, rule,
+                        captured["status"], captured["headers"], b"".join(captured["chunks"])
+                    )
+            await send(message)
+
+        await self.app(scope, receive, tee)
+
+    # -------------------------------
+    # REFRESH / REVALIDATION
+    # -------------------------------
+    async def _refresh(self, key, rule, scope, entry):
+        """Background refresh of a stale entry, revalidating by ETag where possible."""
+        generation = self.cache.generation
+        status, headers, chunks = None, [], []
+
+        async def collect(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        inner = dict(scope, method="GET", headers=_conditional_headers(scope["headers"], entry.etag))
+        try:
+            await self.app(inner, _empty_receive(), collect)
+        except Exception:
+            logger.exception("Cache refresh of %s failed", key[0])
+            return
+
+        if status == 304:
+            if generation == self.cache.generation:
+                self.cache.renew(key, entry, rule, headers)
+        elif status == 200:
+            self.cache.store(key, generation, rule, status, headers, b"".join(chunks))
+        # anything else: keep serving stale until the window closes
+
+    def _refresh_later(self, key, rule, scope, entry):
+        if key in self._refreshing:
+            return
+        task = asyncio.create_task(self._refresh(key, rule, scope, entry))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
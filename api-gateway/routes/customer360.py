@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import httpx
+from fastapi import APIRouter, HTTPException
+
+from services import get_client
+
+router = APIRouter(tags=["Customer 360"])
+
+# Each service call gets this long; slower sections come back as unavailable
+CALL_DEADLINE = 1.5
+
+# Complete views are cached for CACHE_TTL, partial ones only briefly so a
+# recovered service shows up on the next view
+CACHE_TTL = 15
+PARTIAL_CACHE_TTL = 3
+CACHE_MAX_ENTRIES = 10000
+
+SECTIONS = {
+    "profile": ("customer", "/customers/{customer_id}"),
+    "accounts": ("account", "/accounts/customer/{customer_id}"),
+    "cards": ("card", "/cards/customer/{customer_id}"),
+    "loans": ("loan", "/loans/customer/{customer_id}"),
+    "complaints": ("complaint", "/complaints/customer/{customer_id}")
+}
+
+_cache = OrderedDict()   # customer_id -> (expires_at, view)
+_in_flight = {}          # customer_id -> Future, so concurrent views share one fan-out
+
+
+def _cached(customer_id):
+    entry = _cache.get(customer_id)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _cache[customer_id]
+        return None
+    _cache.move_to_end(customer_id)
+    return entry[1]
+
+
+def _store(customer_id, view):
+    ttl = PARTIAL_CACHE_TTL if view["partial"] else CACHE_TTL
+    _cache[customer_id] = (time.monotonic() + ttl, view)
+    _cache.move_to_end(customer_id)
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+async def _fetch(section, customer_id):
+    service, path = SECTIONS[section]
+    try:
+        resp = await asyncio.wait_for(
+            get_client(service).get(path.format(customer_id=customer_id)),
+            CALL_DEADLINE
+        )
+    except asyncio.TimeoutError:
+        return section, None, "timeout"
+    except httpx.HTTPError:
+        return section, None, "unreachable"
+
+    if resp.status_code != 200:
+        return section, resp.status_code, f"status {resp.status_code}"
+    try:
+        return section, resp.json(), None
+    except ValueError:
+        return section, None, "invalid response"
+
+
+async def _build(customer_id):
+    started = time.monotonic()
+    results = await asyncio.gather(*(_fetch(section, customer_id) for section in SECTIONS))
+
+    view = {"customer_id": customer_id}
+    unavailable = {}
+    for section, data, error in results:
+        if section == "profile" and data == 404:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        view[section] = data if error is None else None
+        if error is not None:
+            unavailable[section] = error
+
+    view["partial"] = bool(unavailable)
+    view["unavailable"] = unavailable
+    view["generated_at"] = datetime.utcnow().isoformat()
+    view["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return view
+
+
+# -------------------------------
+# CUSTOMER 360 VIEW
+# -------------------------------
+@router.get("/customer360/{customer_id}")
+async def customer360(customer_id: int, refresh: bool = False):
+    if not refresh:
+        view = _cached(customer_id)
+        if view is not None:
+            return {**view, "cached": True}
+
+    pending = _in_flight.get(customer_id)
+    if pending is not None:
+        try:
+            return {**(await asyncio.shield(pending)), "cached": False}
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # the request building the view went away; build it here instead
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[customer_id] = future
+    try:
+        view = await _build(customer_id)
+        _store(customer_id, view)
+        future.set_result(view)
+    except Exception as e:
+        future.set_exception(e)
+        # waiters re-raise it; mark retrieved so an unawaited one is not logged
+        future.exception()
+        raise
+    finally:
+        # a cancelled build (client disconnect) must still release the waiters
+        if not future.done():
+            future.cancel()
+        if _in_flight.get(customer_id) is future:
+            del _in_flight[customer_id]
+
+    return {**view, "cached": False}
@@ -0,0 +1,47 @@
+import httpx
+
+# -------------------------------
+# SERVICE ROUTES
+# -------------------------------
+SERVICES = {
+    "customer": "http://127.0.0.1:8000",
+    "account": "http://127.0.0.1:8001",
+    "transaction": "http://127.0.0.1:8002",
+    "ledger": "http://127.0.0.1:8003",
+    "card": "http://127.0.0.1:8004",
+    "complaint": "http://127.0.0.1:8005",
+    "loan": "http://127.0.0.1:8006",
+    "fraud": "http://127.0.0.1:8007"
+}
+
+# Keep-alive pool per service, so one slow service cannot take every connection
+MAX_CONNECTIONS_PER_SERVICE = 100
+MAX_KEEPALIVE_PER_SERVICE = 20
+KEEPALIVE_EXPIRY = 30
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 10
+
+_clients = {}
+
+
+def get_client(service):
+    """Pooled AsyncClient for one service; created on first use inside the event loop."""
+    client = _clients.get(service)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=SERVICES[service],
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS_PER_SERVICE,
+                max_keepalive_connections=MAX_KEEPALIVE_PER_SERVICE,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+        _clients[service] = client
+    return client
+
+
+async def close_client():
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+from datetime import date, timezone
+
+from models import Card
+
+logger = logging.getLogger("card-service.auth_cache")
+
+
+def business_date(at=None):
+    """Today's local date, or the local date of the naive-UTC timestamp `at`."""
+    if at is None:
+        return date.today()
+    return at.replace(tzinfo=timezone.utc).astimezone().date()
+
+
+class CardEntry:
+    __slots__ = ("card_id", "account_id", "customer_id", "branch_id", "status", "daily_limit", "loaded_at")
+
+    def __init__(self, card_id, account_id, customer_id, branch_id, status, daily_limit, loaded_at):
+        self.card_id = card_id
+        self.account_id = account_id
+        self.customer_id = customer_id
+        self.branch_id = branch_id
+        self.status = status
+        self.daily_limit = daily_limit
+        self.loaded_at = loaded_at
+
+
+# -------------------------------
+# CARD STATUS / LIMIT CACHE
+# -------------------------------
+class CardCache:
+    """card_number -> status and limits, loaded from the DB on miss.
+
+    Entries expire after `ttl` seconds so blocks and limit changes made
+    elsewhere are picked up; `invalidate` drops one immediately.
+    """
+
+    def __init__(self, session_factory, usage, ttl=30):
+        self.session_factory = session_factory
+        self.usage = usage
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, card_number):
+        entry = self._entries.get(card_number)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+
+        db = self.session_factory()
+        try:
+            card = db.query(Card).filter(Card.card_number == card_number).first()
+            if not card:
+                self._entries.pop(card_number, None)
+                return None
+
+            entry = CardEntry(
+                card_id=card.card_id,
+                account_id=card.account_id,
+                customer_id=card.customer_id,
+                branch_id=card.branch_id,
+                status=card.status,
+                daily_limit=card.daily_limit,
+                loaded_at=time.monotonic()
+            )
+            self.usage.seed(card.card_id, card.daily_used or 0, card.usage_date)
+        finally:
+            db.close()
+
+        self._entries[card_number] = entry
+        return entry
+
+    def invalidate(self, card_number):
+        self._entries.pop(card_number, None)
+
+
+# -------------------------------
+# DAILY USAGE COUNTERS
+# -------------------------------
+class UsageCounters:
+    """Atomic per-card, per-business-day usage counters with write-behind.
+
+    Usage is bucketed by (card, business date): a counter from an earlier
+    day simply reads as zero, so limits reset at midnight without any bulk
+    write. `reserve` checks and takes limit in one step under the card's
+    lock, so concurrent swipes cannot both pass the check. Changed counters
+    are written back to cards.daily_used/usage_date by a flusher thread.
+    This in-process store stands in for a shared one (e.g. Redis
+    INCRBYFLOAT on a card:date key with a day TTL); a drop-in replacement
+    only needs seed/reserve/release/used.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, session_factory, flush_interval=0.2):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+
+        self._usage = {}   # card_id -> (business_date, used)
+        self._dirty = set()
+        self._locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self._dirty_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _lock(self, card_id):
+        return self._locks[card_id % self.STRIPES]
+
+    def _current(self, card_id, day):
+        bucket = self._usage.get(card_id)
+        if bucket is None or bucket[0] != day:
+            return 0.0
+        return bucket[1]
+
+    def seed(self, card_id, used, usage_date):
+        if usage_date is None:
+            return
+        with self._lock(card_id):
+            bucket = self._usage.get(card_id)
+            if bucket is None or bucket[0] < usage_date:
+                self._usage[card_id] = (usage_date, float(used))
+
+    def used(self, card_id, day=None):
+        return self._current(card_id, day or business_date())
+
+    def reserve(self, card_id, amount, limit):
+        """Take `amount` of today's limit. Returns (ok, used_after, day)."""
+        day = business_date()
+        with self._lock(card_id):
+            used = self._current(card_id, day)
+            if used + amount > limit:
+                return False, used, day
+            used += amount
+            self._usage[card_id] = (day, used)
+        self._mark_dirty(card_id)
+        return True, used, day
+
+    def release(self, card_id, amount, day):
+        """Give back a reservation taken on business date `day`."""
+        with self._lock(card_id):
+            bucket = self._usage.get(card_id)
+            if bucket is None or bucket[0] != day:
+                # the day rolled over; that bucket no longer counts
+                return 0.0
+            used = max(bucket[1] - amount, 0.0)
+            self._usage[card_id] = (day, used)
+        self._mark_dirty(card_id)
+        return used
+
+    def _mark_dirty(self, card_id):
+        with self._dirty_lock:
+            self._dirty.add(card_id)
+
+    # -------------------------------
+    # WRITE-BEHIND
+    # -------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="card-usage-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Card usage flush failed")
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        rows = []
+        for card_id in dirty:
+            day, used = self._usage[card_id]
+            rows.append({"card_id": card_id, "daily_used": used, "usage_date": day})
+
+        db = self.session_factory()
+        try:
+            db.bulk_update_mappings(Card, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # keep them dirty for the next attempt
+            with self._dirty_lock:
+                self._dirty |= dirty
+            raise
+        finally:
+            db.close()
+
+        return len(rows)
+
+
+# -------------------------------
+# FALLBACK: CHUNKED DAILY RESET
+# -------------------------------
+def reset_stale_usage(session_factory, batch_size=1000, pause=0.05, stop=None):
+    """Zero daily_used on cards whose usage_date is before today.
+
+    Not needed for limit checks (old buckets already read as zero); it keeps
+    cards.daily_used truthful for reporting. Works through card_id ranges of
+    `batch_size`, committing and sleeping `pause` seconds between batches so
+    no statement holds many row locks.
+    """
+    today = business_date()
+    stats = {"batches": 0, "cards_reset": 0, "business_date": today}
+    started = time.monotonic()
+
+    db = session_factory()
+    try:
+        max_id = db.query(Card.card_id).order_by(Card.card_id.desc()).limit(1).scalar() or 0
+
+        for lo in range(1, max_id + 1, batch_size):
+            if stop is not None and stop.is_set():
+                break
+
+            reset = db.query(Card).filter(
+                Card.card_id.between(lo, lo + batch_size - 1),
+                Card.daily_used > 0,
+                (Card.usage_date.is_(None)) | (Card.usage_date < today)
+            ).update(
+                {Card.daily_used: 0, Card.usage_date: today},
+                synchronize_session=False
+            )
+            db.commit()
+
+            stats["batches"] += 1
+            stats["cards_reset"] += reset
+            if pause:
+                time.sleep(pause)
+    finally:
+        db.close()
+
+    stats["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    logger.info("Card usage reset: %s", stats)
+    return stats
@@ -0,0 +1,199 @@
+import logging
+import secrets
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+
+from models import Card, PooledCardNumber
+
+logger = logging.getLogger("card-service.card_numbers")
+
+# Rows per IN-list / multi-row INSERT
+CHUNK_SIZE = 1000
+
+
+class CardNumberError(Exception):
+    pass
+
+
+def luhn_check_digit(partial):
+    """Check digit that makes `partial` + digit pass the Luhn test."""
+    total = 0
+    # rightmost digit of `partial` is doubled once the check digit is appended
+    for i, ch in enumerate(reversed(partial)):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+
+def is_luhn_valid(number):
+    return number.isdigit() and luhn_check_digit(number[:-1]) == number[-1]
+
+
+def random_card_number(bin_prefix, length=16):
+    body_len = length - len(bin_prefix) - 1
+    partial = bin_prefix + str(secrets.randbelow(10 ** body_len)).zfill(body_len)
+    return partial + luhn_check_digit(partial)
+
+
+# -------------------------------
+# NUMBER POOL
+# -------------------------------
+class CardNumberPool:
+    """Luhn-valid, collision-checked card numbers generated ahead of time.
+
+    `refill` generates numbers in bulk, drops any already in the pool or on
+    a card (one IN query per chunk) and stores the rest with multi-row
+    INSERTs. `draw` claims the next `count` unallocated numbers in seq order
+    inside the caller's transaction, so a failed issuance rolls the claim
+    back with it.
+
+    Once started, a background thread keeps the pool above `low_watermark`:
+    it recounts every `interval` seconds, and sooner when draws have taken
+    the estimated free count below the watermark. Issuing a card then only
+    draws.
+    """
+
+    def __init__(self, session_factory, bin_prefix, refill_size=10000, low_watermark=2000, interval=60):
+        self.session_factory = session_factory
+        self.bin_prefix = bin_prefix
+        self.refill_size = refill_size
+        self.low_watermark = low_watermark
+        self.interval = interval
+        self._refill_lock = threading.Lock()
+
+        self._estimate = None   # free numbers as of the last count, less draws since
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="card-number-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def notify(self):
+        """Wake the refill thread now instead of at the next interval."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.ensure(0)
+            except Exception:
+                logger.exception("Card number pool refill failed")
+
+    def available(self, db):
+        return db.query(func.count(PooledCardNumber.seq)).filter(
+            PooledCardNumber.allocated_at.is_(None)
+        ).scalar()
+
+    def ensure(self, count):
+        """Top the pool up so at least `count` numbers (and the watermark) are free."""
+        db = self.session_factory()
+        try:
+            available = self.available(db)
+        finally:
+            db.close()
+
+        # draws still uncommitted elsewhere are missing from the count but
+        # not from the estimate, so go by the lower of the two
+        low = available if self._estimate is None else min(available, self._estimate)
+        self._estimate = available
+        if low >= max(count, self.low_watermark):
+            return 0
+        added = self.refill(max(count - low, 0) + self.refill_size)
+        self._estimate = available + added
+        return added
+
+    def refill(self, count):
+        with self._refill_lock:
+            added = 0
+            for _ in range(5):
+                if added >= count:
+                    break
+                try:
+                    added += self._add_numbers(count - added)
+                except IntegrityError:
+                    # another instance stored one of the same numbers first
+                    logger.warning("Card number pool refill collided, retrying")
+            if added < count:
+                raise CardNumberError("Could not refill card number pool")
+
+            logger.info("Card number pool refilled with %s numbers", added)
+            return added
+
+    def _add_numbers(self, count):
+        candidates = set()
+        while len(candidates) < count:
+            candidates.add(random_card_number(self.bin_prefix))
+        candidates = list(candidates)
+
+        db = self.session_factory()
+        try:
+            taken = set()
+            for start in range(0, len(candidates), CHUNK_SIZE):
+                chunk = candidates[start:start + CHUNK_SIZE]
+                taken.update(n for (n,) in db.query(PooledCardNumber.card_number).filter(
+                    PooledCardNumber.card_number.in_(chunk)
+                ))
+                taken.update(n for (n,) in db.query(Card.card_number).filter(
+                    Card.card_number.in_(chunk)
+                ))
+
+            fresh = [{"card_number": n} for n in candidates if n not in taken]
+            for start in range(0, len(fresh), CHUNK_SIZE):
+                db.execute(insert(PooledCardNumber).values(fresh[start:start + CHUNK_SIZE]))
+            db.commit()
+            return len(fresh)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def draw(self, db, count):
+        """Claim `count` numbers in `db`'s transaction; the caller commits."""
+        if count == 0:
+            return []
+
+        rows = (
+            db.query(PooledCardNumber.seq, PooledCardNumber.card_number)
+            .filter(PooledCardNumber.allocated_at.is_(None))
+            .order_by(PooledCardNumber.seq)
+            .limit(count)
+            .with_for_update()
+            .all()
+        )
+        if len(rows) < count:
+            self.notify()
+            raise CardNumberError("Card number pool exhausted")
+
+        if self._estimate is not None:
+            self._estimate -= count
+            if self._estimate < self.low_watermark:
+                self.notify()
+
+        seqs = [row.seq for row in rows]
+        now = datetime.utcnow()
+        for start in range(0, len(seqs), CHUNK_SIZE):
+            db.query(PooledCardNumber).filter(
+                PooledCardNumber.seq.in_(seqs[start:start + CHUNK_SIZE])
+            ).update({PooledCardNumber.allocated_at: now}, synchronize_session=False)
+
+        return [row.card_number for row in rows]
@@ -1,15 +1,57 @@
 from fastapi import FastAPI, HTTPException
 from database import SessionLocal, engine
-from models import Base, Card
-from schemas import CardCreate, CardValidateRequest, CardResponse
-import random
+from models import Base, Card, CardAuthorisation
+from schemas import CardCreate, CardValidateRequest, CardResponse, CardBulkIssueRequest, CardBulkIssueResponse
+from auth_cache import CardCache, UsageCounters, business_date, reset_stale_usage
+from card_numbers import CardNumberPool, CardNumberError, CHUNK_SIZE
+from settlement import CardSettler
+from velocity import VelocityChecker
+from migrations import migrate
+from sqlalchemy import insert
+import logging
+import threading
+import uuid
 import requests
 
+logger = logging.getLogger("card-service")
+
 ACCOUNT_SERVICE_URL = "http://127.0.0.1:8001"
 TRANSACTION_SERVICE_URL = "http://127.0.0.1:8002"
 
+# Authorisation fast path: card cache TTL and usage write-behind interval
+CARD_CACHE_TTL = 30
+USAGE_FLUSH_INTERVAL = 0.2
+
+# Fallback reset of stale daily_used values (reporting only)
+USAGE_RESET_BATCH_SIZE = 1000
+USAGE_RESET_PAUSE = 0.05
+
+# Card number pool
+CARD_BIN = "421653"
+NUMBER_POOL_REFILL_SIZE = 10000
+NUMBER_POOL_LOW_WATERMARK = 2000
+NUMBER_POOL_CHECK_INTERVAL = 60
+
+# Authorisation holds and batched capture/settlement
+CARD_HOLD_TTL_SECONDS = 7 * 24 * 3600
+SETTLEMENT_BATCH_SIZE = 500
+SETTLEMENT_INTERVAL = 5
+
+# Velocity checks: (window seconds, max swipes, max amount) and repeat amounts
+VELOCITY_WINDOWS = (
+    (600, 5, 25000),
+    (3600, 15, 50000)
+)
+REPEAT_AMOUNT_WINDOW = 600
+REPEAT_AMOUNT_MAX = 3
+VELOCITY_BUFFER_SIZE = 32
+
+# Upper bound on accounts in one bulk issuance request
+MAX_BULK_CARDS = 5000
+
 app = FastAPI(title="Card Service")
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -24,8 +66,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def generate_card_number():
-    return "".join(str(random.randint(0, 9)) for _ in range(16))
+usage_counters = UsageCounters(SessionLocal, flush_interval=USAGE_FLUSH_INTERVAL)
+card_cache = CardCache(SessionLocal, usage_counters, ttl=CARD_CACHE_TTL)
+
+number_pool = CardNumberPool(
+    SessionLocal,
+    CARD_BIN,
+    refill_size=NUMBER_POOL_REFILL_SIZE,
+    low_watermark=NUMBER_POOL_LOW_WATERMARK,
+    interval=NUMBER_POOL_CHECK_INTERVAL
+)
+
+velocity = VelocityChecker(
+    VELOCITY_WINDOWS,
+    repeat_window=REPEAT_AMOUNT_WINDOW,
+    repeat_max=REPEAT_AMOUNT_MAX,
+    capacity=VELOCITY_BUFFER_SIZE
+)
+
+# keep-alive connections to transaction-service and account-service
+http = requests.Session()
+
+def release_failed_usage(card_id, amount, authorised_at):
+    """A swipe whose hold could not be captured gives its daily limit back."""
+    usage_counters.release(card_id, amount, business_date(authorised_at))
+
+
+settler = CardSettler(
+    SessionLocal,
+    http,
+    TRANSACTION_SERVICE_URL,
+    batch_size=SETTLEMENT_BATCH_SIZE,
+    interval=SETTLEMENT_INTERVAL,
+    on_failed=release_failed_usage
+)
+
+usage_reset_stop = threading.Event()
+usage_reset_state = {"running": False, "last_run": None}
+usage_reset_lock = threading.Lock()
+
+
+@app.on_event("startup")
+def start_usage_flusher():
+    usage_counters.start()
+
+
+@app.on_event("startup")
+def fill_number_pool():
+    number_pool.ensure(0)
+    number_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_number_pool():
+    number_pool.stop()
+
+
+@app.on_event("startup")
+def start_settler():
+    settler.start()
+
+
+@app.on_event("shutdown")
+def stop_settler():
+    settler.stop()
+
+
+@app.on_event("shutdown")
+def stop_usage_flusher():
+    usage_reset_stop.set()
+    usage_counters.stop()
+
+
+def void_hold(account_id: int, reference: str):
+    """Cancel a hold whose placement timed out; True once no money is held."""
+    try:
+        resp = http.post(
+            f"{ACCOUNT_SERVICE_URL}/accounts/{account_id}/holds/void",
+            json={"reference": reference},
+            timeout=5
+        )
+    except requests.exceptions.RequestException:
+        resp = None
+
+    if resp is None or resp.status_code != 200:
+        logger.error("Could not void card hold %s on account %s", reference, account_id)
+        return False
+    return resp.json()["status"] in ("RELEASED", "EXPIRED")
 
 
 def get_account_details(account_id: int):
@@ -53,68 +180,283 @@ def issue_card(data: CardCreate):
 
     account = get_account_details(data.account_id)
 
-    card = Card(
-        account_id=data.account_id,
-        customer_id=account["customer_id"],   # 🔥 FIX
-        branch_id=account["branch_id"],        # 🔥 FIX
-        card_number=generate_card_number(),
-        daily_limit=data.daily_limit
-    )
+    try:
+        # the pool refills itself in the background
+        card_number = number_pool.draw(db, 1)[0]
+
+        card = Card(
+            account_id=data.account_id,
+            customer_id=account["customer_id"],   # 🔥 FIX
+            branch_id=account["branch_id"],        # 🔥 FIX
+            card_number=card_number,
+            daily_limit=data.daily_limit
+        )
 
-    db.add(card)
-    db.commit()
-    db.refresh(card)
-    db.close()
+        db.add(card)
+        db.commit()
+        db.refresh(card)
+    except CardNumberError as e:
+        db.rollback()
+        raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        db.close()
 
     return card
 
 
+# ------------------------------------------------
+# CARDS OF A CUSTOMER (CUSTOMER 360)
+# ------------------------------------------------
+@app.get("/cards/customer/{customer_id}")
+def get_customer_cards(customer_id: int, limit: int = 100):
+    db = SessionLocal()
+    try:
+        cards = (
+            db.query(Card)
+            .filter(Card.customer_id == customer_id)
+            .order_by(Card.card_id)
+            .limit(min(max(limit, 1), 500))
+            .all()
+        )
+        return [
+            {
+                "card_id": c.card_id,
+                "account_id": c.account_id,
+                "card_number": "XXXX-XXXX-XXXX-" + c.card_number[-4:],
+                "card_type": c.card_type,
+                "status": c.status,
+                "daily_limit": c.daily_limit,
+                "issued_at": c.issued_at
+            }
+            for c in cards
+        ]
+    finally:
+        db.close()
+
+
+# ------------------------------------------------
+# BULK ISSUE (CORPORATE / PAYROLL PROGRAMMES)
+# ------------------------------------------------
+@app.post("/cards/bulk-issue", response_model=CardBulkIssueResponse)
+def bulk_issue_cards(data: CardBulkIssueRequest):
+    account_ids = list(dict.fromkeys(data.account_ids))
+    if not account_ids:
+        raise HTTPException(status_code=400, detail="No accounts given")
+    if len(account_ids) > MAX_BULK_CARDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_CARDS} cards per request")
+
+    # one round trip for every account
+    try:
+        resp = http.post(
+            f"{ACCOUNT_SERVICE_URL}/accounts/batch",
+            json={"account_ids": account_ids},
+            timeout=30
+        )
+    except requests.exceptions.RequestException:
+        raise HTTPException(status_code=503, detail="Account service unavailable")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=400, detail="Account lookup failed")
+
+    found = {a["account_id"]: a for a in resp.json()["accounts"]}
+    errors = []
+    accounts = []
+    for account_id in account_ids:
+        account = found.get(account_id)
+        if account is None:
+            errors.append({"account_id": account_id, "error": "Account not found"})
+        elif account["status"] != "ACTIVE":
+            errors.append({"account_id": account_id, "error": "Account not active"})
+        else:
+            accounts.append(account)
+
+    cards = []
+    if accounts:
+        db = SessionLocal()
+        try:
+            number_pool.ensure(len(accounts))
+            numbers = number_pool.draw(db, len(accounts))
+
+            rows = [
+                {
+                    "account_id": account["account_id"],
+                    "customer_id": account["customer_id"],
+                    "branch_id": account["branch_id"],
+                    "card_number": number,
+                    "card_type": data.card_type,
+                    "status": "ACTIVE",
+                    "daily_limit": data.daily_limit,
+                    "daily_used": 0
+                }
+                for account, number in zip(accounts, numbers)
+            ]
+            for start in range(0, len(rows), CHUNK_SIZE):
+                db.execute(insert(Card).values(rows[start:start + CHUNK_SIZE]))
+            db.commit()
+
+            for start in range(0, len(numbers), CHUNK_SIZE):
+                cards.extend(
+                    db.query(Card)
+                    .filter(Card.card_number.in_(numbers[start:start + CHUNK_SIZE]))
+                    .order_by(Card.card_id)
+                    .all()
+                )
+        except CardNumberError as e:
+            db.rollback()
+            raise HTTPException(status_code=503, detail=str(e))
+        finally:
+            db.close()
+
+    return {
+        "requested": len(account_ids),
+        "issued": len(cards),
+        "failed": len(errors),
+        "cards": cards,
+        "errors": errors
+    }
+
+
 # ------------------------------------------------
 # VALIDATE CARD (REAL-TIME CONTROL)
 # ------------------------------------------------
 @app.post("/cards/validate")
 def validate_card(data: CardValidateRequest):
-    db = SessionLocal()
-
-    card = db.query(Card).filter(
-        Card.card_number == data.card_number
-    ).first()
+    card = card_cache.get(data.card_number)
 
     if not card:
-        db.close()
         raise HTTPException(status_code=404, detail="Card not found")
 
     if card.status != "ACTIVE":
-        db.close()
         raise HTTPException(status_code=400, detail="Card blocked")
 
-    if card.daily_used + data.amount > card.daily_limit:
-        db.close()
+    # 🚦 stop bursts before any money is held; recorded only once approved
+    reason = velocity.check(card.card_id, data.amount)
+    if reason:
+        raise HTTPException(status_code=400, detail=f"Declined: {reason}")
+
+    # 🔒 reserve limit before money moves; released if the hold fails
+    reserved, used, day = usage_counters.reserve(card.card_id, data.amount, card.daily_limit)
+    if not reserved:
         raise HTTPException(status_code=400, detail="Daily limit exceeded")
 
-    txn = requests.post(
-        f"{TRANSACTION_SERVICE_URL}/transactions/debit",
-        json={
-            "account_id": card.account_id,
-            "amount": data.amount,
-            "channel": "CARD"
-        },
-        timeout=5
-    )
+    # one call: hold the funds; capture and settlement happen in batches later
+    reference = f"card:{card.card_id}:{uuid.uuid4().hex}"
+    try:
+        resp = http.post(
+            f"{ACCOUNT_SERVICE_URL}/accounts/{card.account_id}/holds",
+            json={
+                "amount": data.amount,
+                "reference": reference,
+                "ttl_seconds": CARD_HOLD_TTL_SECONDS
+            },
+            timeout=5
+        )
+    except requests.exceptions.ConnectionError:
+        usage_counters.release(card.card_id, data.amount, day)
+        raise HTTPException(status_code=503, detail="Account service unavailable")
+    except requests.exceptions.RequestException:
+        # a hold may have been placed; void it so the swipe is declined cleanly
+        if void_hold(card.account_id, reference):
+            usage_counters.release(card.card_id, data.amount, day)
+            raise HTTPException(status_code=504, detail="Authorisation timed out")
+        raise HTTPException(status_code=504, detail="Authorisation outcome unknown")
 
-    if txn.status_code != 200:
-        db.close()
-        raise HTTPException(status_code=400, detail="Transaction failed")
+    if resp.status_code != 200:
+        usage_counters.release(card.card_id, data.amount, day)
+        detail = "Insufficient funds" if resp.status_code == 400 else "Authorisation failed"
+        raise HTTPException(status_code=400, detail=detail)
 
-    # 🔒 Persist daily usage
-    card.daily_used += data.amount
-    available_limit = card.daily_limit - card.daily_used
+    hold = resp.json()
 
-    db.commit()
-    db.close()
+    db = SessionLocal()
+    try:
+        auth = CardAuthorisation(
+            card_id=card.card_id,
+            account_id=card.account_id,
+            customer_id=card.customer_id,
+            branch_id=card.branch_id,
+            hold_id=hold["hold_id"],
+            amount=data.amount,
+            status="APPROVED"
+        )
+        db.add(auth)
+        db.commit()
+        db.refresh(auth)
+    except Exception:
+        db.rollback()
+        usage_counters.release(card.card_id, data.amount, day)
+        try:
+            http.post(f"{ACCOUNT_SERVICE_URL}/accounts/holds/{hold['hold_id']}/release", timeout=5)
+        except requests.exceptions.RequestException:
+            pass
+        raise HTTPException(status_code=500, detail="Could not record authorisation")
+    finally:
+        db.close()
+
+    velocity.record(card.card_id, data.amount)
 
     return {
         "status": "APPROVED",
-        "available_limit": available_limit,
-        "transaction": txn.json()
+        "available_limit": card.daily_limit - used,
+        "authorisation": {
+            "auth_id": auth.auth_id,
+            "hold_id": hold["hold_id"],
+            "amount": data.amount,
+            "expires_at": hold["expires_at"]
+        }
     }
+
+
+@app.get("/cards/velocity/stats")
+def get_velocity_stats():
+    return velocity.stats()
+
+
+# ------------------------------------------------
+# SETTLEMENT (BATCHED CAPTURE)
+# ------------------------------------------------
+@app.post("/cards/settlement/run")
+def run_settlement():
+    try:
+        return settler.run()
+    except requests.exceptions.RequestException:
+        raise HTTPException(status_code=503, detail="Transaction service unavailable")
+
+
+# ------------------------------------------------
+# DAILY USAGE RESET (FALLBACK, BACKGROUND)
+# ------------------------------------------------
+def run_usage_reset(batch_size: int, pause: float):
+    try:
+        usage_reset_state["last_run"] = reset_stale_usage(
+            SessionLocal,
+            batch_size=batch_size,
+            pause=pause,
+            stop=usage_reset_stop
+        )
+    finally:
+        usage_reset_state["running"] = False
+
+
+@app.post("/cards/usage/reset", status_code=202)
+def start_usage_reset(batch_size: int = USAGE_RESET_BATCH_SIZE, pause: float = USAGE_RESET_PAUSE):
+    if batch_size < 1 or pause < 0:
+        raise HTTPException(status_code=400, detail="Invalid batch size or pause")
+
+    with usage_reset_lock:
+        if usage_reset_state["running"]:
+            raise HTTPException(status_code=409, detail="Usage reset already running")
+        usage_reset_state["running"] = True
+
+    threading.Thread(
+        target=run_usage_reset,
+        args=(batch_size, pause),
+        name="card-usage-reset",
+        daemon=True
+    ).start()
+
+    return {"status": "started", "batch_size": batch_size, "pause": pause}
+
+
+@app.get("/cards/usage/reset")
+def get_usage_reset():
+    return usage_reset_state
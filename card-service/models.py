@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float
+from sqlalchemy import Column, Integer, String, DateTime, Float, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -10,7 +10,7 @@ class Card(Base):
     card_id = Column(Integer, primary_key=True, index=True)
 
     account_id = Column(Integer, nullable=False)
-    customer_id = Column(Integer, nullable=False)   # 🔥 NEW
+    customer_id = Column(Integer, nullable=False, index=True)   # 🔥 NEW
     branch_id = Column(Integer, nullable=False)     # 🔥 NEW
 
     card_number = Column(String(16), unique=True, nullable=False)
@@ -19,5 +19,38 @@ class Card(Base):
 
     daily_limit = Column(Float, default=50000)
     daily_used = Column(Float, default=0)
+    usage_date = Column(Date)   # business date daily_used belongs to
 
     issued_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class PooledCardNumber(Base):
+    """Pre-generated card numbers, handed out in seq order."""
+    __tablename__ = "card_number_pool"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    card_number = Column(String(16), unique=True, nullable=False)
+    allocated_at = Column(DateTime, index=True)
+
+
+class CardAuthorisation(Base):
+    """An approved swipe whose account hold still has to be captured."""
+    __tablename__ = "card_authorisations"
+    __table_args__ = (
+        Index("ix_card_authorisations_status_auth", "status", "auth_id"),
+    )
+
+    auth_id = Column(Integer, primary_key=True, index=True)
+    card_id = Column(Integer, nullable=False, index=True)
+    account_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    branch_id = Column(Integer, nullable=False)
+
+    hold_id = Column(Integer, unique=True, nullable=False)
+    amount = Column(Float, nullable=False)
+    status = Column(String(20), nullable=False, default="APPROVED")   # APPROVED / SETTLED / FAILED
+    transaction_id = Column(Integer)
+    error = Column(String(100))
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    settled_at = Column(DateTime)
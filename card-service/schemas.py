@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class CardCreate(BaseModel):
     account_id: int
@@ -18,3 +18,21 @@ class CardResponse(BaseModel):
 class CardValidateRequest(BaseModel):
     card_number: str
     amount: float
+
+
+class CardBulkIssueRequest(BaseModel):
+    account_ids: List[int]
+    daily_limit: Optional[float] = 50000
+    card_type: Optional[str] = "DEBIT"
+
+
+class CardIssued(CardResponse):
+    account_id: int
+
+
+class CardBulkIssueResponse(BaseModel):
+    requested: int
+    issued: int
+    failed: int
+    cards: List[CardIssued]
+    errors: List[dict]
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from models import CardAuthorisation
+
+logger = logging.getLogger("card-service.settlement")
+
+APPROVED = "APPROVED"
+SETTLED = "SETTLED"
+FAILED = "FAILED"
+
+
+class CardSettler:
+    """Captures approved authorisations in batches via transaction-service.
+
+    Each batch is one /transactions/card-settlement call, which captures the
+    account holds and records the debits. Settlement is idempotent on
+    hold_id, so a batch whose response was lost is simply sent again.
+
+    An item fails only when its hold can no longer be captured (expired,
+    released or missing), so the swipe never moved money. After the batch
+    commits, `on_failed(card_id, amount, authorised_at)` is called for each
+    such item so the card's daily usage can be given back.
+    """
+
+    def __init__(self, session_factory, http, url, batch_size=500, interval=5, timeout=30,
+                 on_failed=None):
+        self.session_factory = session_factory
+        self.http = http
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.on_failed = on_failed
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="card-settlement", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _loop(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run()
+            except Exception:
+                logger.exception("Card settlement run failed")
+
+    def run(self):
+        """Settle every approved authorisation; returns counts."""
+        stats = {"batches": 0, "settled": 0, "failed": 0}
+        started = time.monotonic()
+
+        with self._lock:
+            while not self._stopping.is_set():
+                settled, failed, size = self._settle_batch()
+                if size == 0:
+                    break
+                stats["batches"] += 1
+                stats["settled"] += settled
+                stats["failed"] += failed
+                if size < self.batch_size:
+                    break
+
+        stats["elapsed_seconds"] = round(time.monotonic() - started, 3)
+        return stats
+
+    def _settle_batch(self):
+        db = self.session_factory()
+        try:
+            auths = (
+                db.query(CardAuthorisation)
+                .filter(CardAuthorisation.status == APPROVED)
+                .order_by(CardAuthorisation.auth_id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not auths:
+                return 0, 0, 0
+
+            resp = self.http.post(
+                f"{self.url}/transactions/card-settlement",
+                json={
+                    "items": [
+                        {
+                            "hold_id": a.hold_id,
+                            "account_id": a.account_id,
+                            "customer_id": a.customer_id,
+                            "branch_id": a.branch_id,
+                            "amount": a.amount,
+                            "channel": "CARD"
+                        }
+                        for a in auths
+                    ]
+                },
+                timeout=self.timeout
+            )
+            if resp.status_code != 200:
+                raise requests.exceptions.HTTPError(f"Settlement returned {resp.status_code}")
+
+            result = resp.json()
+            by_hold = {a.hold_id: a for a in auths}
+            # read before the commit expires the instances
+            released = [
+                (by_hold[item["hold_id"]].card_id, by_hold[item["hold_id"]].amount, by_hold[item["hold_id"]].created_at)
+                for item in result["failed"]
+            ]
+            now = datetime.utcnow()
+
+            updates = [
+                {
+                    "auth_id": by_hold[item["hold_id"]].auth_id,
+                    "status": SETTLED,
+                    "transaction_id": item["transaction_id"],
+                    "settled_at": now
+                }
+                for item in result["settled"]
+            ]
+            updates += [
+                {
+                    "auth_id": by_hold[item["hold_id"]].auth_id,
+                    "status": FAILED,
+                    "error": item["error"][:100],
+                    "settled_at": now
+                }
+                for item in result["failed"]
+            ]
+
+            db.bulk_update_mappings(CardAuthorisation, updates)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if self.on_failed is not None:
+            for card_id, amount, authorised_at in released:
+                try:
+                    self.on_failed(card_id, amount, authorised_at)
+                except Exception:
+                    logger.exception("Releasing usage of a failed authorisation on card %s failed", card_id)
+
+        return len(result["settled"]), len(result["failed"]), len(auths)
@@ -0,0 +1,49 @@
+from velocity import VelocityChecker
+
+WINDOWS = ((600, 5, 25000), (3600, 15, 50000))
+
+
+def make_checker():
+    return VelocityChecker(WINDOWS, repeat_window=600, repeat_max=3, capacity=32)
+
+
+def test_single_large_swipe_is_not_a_velocity_decline():
+    checker = make_checker()
+    assert checker.check(1, 30000.0, now=1000.0) is None
+
+
+def test_prior_spend_reaching_cap_declines_next_swipe():
+    checker = make_checker()
+    checker.record(1, 30000.0, now=1000.0)
+    assert checker.check(1, 10.0, now=1010.0) == "Spend over 25000 in 10 minutes"
+    # outside the 10 minute window only the hourly cap applies
+    assert checker.check(1, 10.0, now=1700.0) is None
+
+
+def test_swipe_taking_window_over_cap_declines():
+    checker = make_checker()
+    checker.record(1, 20000.0, now=1000.0)
+    assert checker.check(1, 10000.0, now=1010.0) == "Spend over 25000 in 10 minutes"
+    # landing exactly on the cap is still allowed
+    assert checker.check(1, 5000.0, now=1010.0) is None
+
+
+def test_declined_or_unrecorded_swipes_do_not_count():
+    checker = make_checker()
+    for i in range(10):
+        assert checker.check(1, 100.0 + i, now=1000.0 + i) is None
+    assert checker.stats()["cards_tracked"] == 0
+
+
+def test_count_limit_includes_current_swipe():
+    checker = make_checker()
+    for i in range(5):
+        checker.record(1, 100.0 + i, now=1000.0 + i)
+    assert checker.check(1, 500.0, now=1010.0) == "More than 5 transactions in 10 minutes"
+
+
+def test_repeated_amount_declines():
+    checker = make_checker()
+    for i in range(3):
+        checker.record(1, 250.0, now=1000.0 + i)
+    assert checker.check(1, 250.0, now=1010.0) == "Same amount repeated too often"
@@ -0,0 +1,152 @@
+import threading
+import time
+from array import array
+
+# Amounts closer than this count as the same amount
+AMOUNT_TOLERANCE = 0.005
+
+
+class _CardHistory:
+    """Fixed-size ring of (timestamp, amount) for one card, newest last."""
+
+    __slots__ = ("times", "amounts", "head", "size")
+
+    def __init__(self, capacity):
+        self.times = array("d", [0.0]) * capacity
+        self.amounts = array("d", [0.0]) * capacity
+        self.head = 0   # next slot to write
+        self.size = 0
+
+    def add(self, ts, amount):
+        capacity = len(self.times)
+        self.times[self.head] = ts
+        self.amounts[self.head] = amount
+        self.head = (self.head + 1) % capacity
+        if self.size < capacity:
+            self.size += 1
+
+    def newest(self):
+        if not self.size:
+            return 0.0
+        return self.times[self.head - 1]
+
+    def since(self, cutoff):
+        """(ts, amount) pairs at or after `cutoff`, newest first."""
+        capacity = len(self.times)
+        i = self.head
+        for _ in range(self.size):
+            i = (i - 1) % capacity
+            ts = self.times[i]
+            if ts < cutoff:
+                return
+            yield ts, self.amounts[i]
+
+
+# -------------------------------
+# VELOCITY CHECKS
+# -------------------------------
+class VelocityChecker:
+    """Rolling per-card count/amount limits and repeat-amount detection.
+
+    `windows` is a sequence of (seconds, max_count, max_amount); a swipe is
+    declined if, counting it, any window would hold more than max_count
+    swipes, or if it follows earlier swipes in the window and would take
+    their total over max_amount. A lone swipe is left to the card's daily
+    limit, so one large purchase is never a velocity decline. A swipe is
+    also declined if the same amount was already seen `repeat_max` times
+    within `repeat_window` seconds.
+
+    `check` only reads history; the caller calls `record` once the swipe is
+    actually authorised, so declined swipes never count.
+
+    History lives in a small ring per card, so older entries are evicted
+    by time on read and by overwrite once the ring is full; `capacity`
+    must exceed every max_count. Cards idle for longer than the largest
+    window are dropped every `sweep_every` checks.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, windows, repeat_window=600, repeat_max=3, capacity=32, sweep_every=10000):
+        self.windows = sorted(windows)
+        self.repeat_window = repeat_window
+        self.repeat_max = repeat_max
+        self.capacity = capacity
+        self.sweep_every = sweep_every
+        self.horizon = max([w[0] for w in self.windows] + [repeat_window])
+
+        if any(max_count >= capacity for _, max_count, _ in self.windows) or repeat_max >= capacity:
+            raise ValueError("capacity must exceed every max_count")
+
+        self._history = {}
+        self._locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self._checks = 0
+        self._declines = {}
+
+    def check(self, card_id, amount, now=None):
+        """Return a decline reason, or None if the swipe may proceed."""
+        now = time.time() if now is None else now
+
+        with self._locks[card_id % self.STRIPES]:
+            history = self._history.get(card_id)
+
+            counts = [1] * len(self.windows)
+            sums = [0.0] * len(self.windows)
+            repeats = 1
+
+            for ts, past in (history.since(now - self.horizon) if history else ()):
+                age = now - ts
+                for i, (seconds, _, _) in enumerate(self.windows):
+                    if age <= seconds:
+                        counts[i] += 1
+                        sums[i] += past
+                if age <= self.repeat_window and abs(past - amount) < AMOUNT_TOLERANCE:
+                    repeats += 1
+
+            reason = None
+            for (seconds, max_count, max_amount), count, total in zip(self.windows, counts, sums):
+                if count > max_count:
+                    reason = f"More than {max_count} transactions in {seconds // 60} minutes"
+                    break
+                if count > 1 and total + amount > max_amount:
+                    reason = f"Spend over {max_amount:g} in {seconds // 60} minutes"
+                    break
+            if reason is None and repeats > self.repeat_max:
+                reason = "Same amount repeated too often"
+
+        self._checks += 1
+        if self._checks % self.sweep_every == 0:
+            self.sweep(now)
+
+        if reason is not None:
+            self._declines[reason] = self._declines.get(reason, 0) + 1
+        return reason
+
+    def record(self, card_id, amount, now=None):
+        """Add an authorised swipe to the card's history."""
+        now = time.time() if now is None else now
+        with self._locks[card_id % self.STRIPES]:
+            history = self._history.get(card_id)
+            if history is None:
+                history = self._history[card_id] = _CardHistory(self.capacity)
+            history.add(now, amount)
+
+    def sweep(self, now=None):
+        """Forget cards with no swipe inside the largest window."""
+        now = time.time() if now is None else now
+        cutoff = now - self.horizon
+        dropped = 0
+
+        for card_id, history in list(self._history.items()):
+            with self._locks[card_id % self.STRIPES]:
+                if history.newest() < cutoff:
+                    self._history.pop(card_id, None)
+                    dropped += 1
+        return dropped
+
+    def stats(self):
+        return {
+            "cards_tracked": len(self._history),
+            "checks": self._checks,
+            "declines": dict(self._declines)
+        }
@@ -1,14 +1,70 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from database import engine, SessionLocal
 from models import Base, Complaint
-from schemas import ComplaintCreate, ComplaintResponse
-from datetime import datetime
-import requests
+from outbox import ATTACH, RESOLVE, OutboxDispatcher, add_event
+from schemas import ComplaintCreate, ComplaintResponse, ComplaintSearchResponse
+from text_index import ComplaintTextIndex, TextIndexError
+from migrations import migrate
+from datetime import date, datetime, timedelta
+from typing import Optional
+import csv
+import io
+import json
+import os
 
 FRAUD_SERVICE_URL = "http://127.0.0.1:8007"
 
+# Fraud notifications go through an outbox table and a background dispatcher
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_INTERVAL = 1.0
+OUTBOX_TIMEOUT = 5
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_BASE_BACKOFF = 1.0
+OUTBOX_MAX_BACKOFF = 300.0
+
+# Complaint listing: keyset page sizes and export batch size
+COMPLAINT_PAGE_SIZE = 500
+COMPLAINT_MAX_PAGE_SIZE = 5000
+COMPLAINT_STREAM_BATCH = 1000
+
+# Full-text search over descriptions and its on-disk snapshot
+SEARCH_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_snapshots", "complaints.npz")
+SEARCH_SNAPSHOT_INTERVAL = 900
+SEARCH_MAX_RESULTS = 100
+
+EXPORT_COLUMNS = (
+    "complaint_id",
+    "customer_id",
+    "branch_id",
+    "account_id",
+    "transaction_id",
+    "category",
+    "description",
+    "status",
+    "created_at",
+    "closed_at"
+)
+
 app = FastAPI(title="Complaint Service")
 
+outbox = OutboxDispatcher(
+    SessionLocal,
+    FRAUD_SERVICE_URL,
+    batch_size=OUTBOX_BATCH_SIZE,
+    interval=OUTBOX_INTERVAL,
+    timeout=OUTBOX_TIMEOUT,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    base_backoff=OUTBOX_BASE_BACKOFF,
+    max_backoff=OUTBOX_MAX_BACKOFF
+)
+
+text_index = ComplaintTextIndex(
+    SessionLocal,
+    SEARCH_SNAPSHOT_PATH,
+    snapshot_interval=SEARCH_SNAPSHOT_INTERVAL
+)
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -17,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.get("/health")
@@ -29,6 +86,14 @@ def health_check():
 @app.on_event("startup")
 def startup():
     Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    outbox.start()
+    text_index.start()
+
+@app.on_event("shutdown")
+def shutdown():
+    outbox.stop()
+    text_index.stop()
 
 # -----------------------------
 # CREATE COMPLAINT
@@ -46,25 +111,75 @@ def create_complaint(data: ComplaintCreate):
             description=data.description
         )
         db.add(complaint)
+
+        # 🔗 OPTIONAL: Update Fraud Alert if transaction-linked (via the outbox)
+        if data.transaction_id:
+            db.flush()
+            add_event(db, ATTACH, complaint.complaint_id, data.transaction_id, "Customer Complaint")
+
         db.commit()
         db.refresh(complaint)
 
-        # 🔗 OPTIONAL: Update Fraud Alert if transaction-linked
+        text_index.add(complaint.complaint_id, complaint.description, complaint.status, complaint.branch_id)
         if data.transaction_id:
-            requests.post(
-                f"{FRAUD_SERVICE_URL}/fraud/attach-complaint",
-                json={
-                    "transaction_id": data.transaction_id,
-                    "complaint_id": complaint.complaint_id,
-                    "feedback_type": "Customer Complaint"
-                },
-                timeout=3
-            )
+            outbox.notify()
 
         return complaint
     finally:
         db.close()
 
+# -----------------------------
+# FRAUD OUTBOX
+# -----------------------------
+@app.get("/complaints/outbox/stats")
+def outbox_stats():
+    return outbox.stats()
+
+@app.post("/complaints/outbox/dispatch")
+def outbox_dispatch():
+    # one pass now, e.g. after fraud-service comes back
+    return outbox.run_once()
+
+@app.post("/complaints/outbox/retry-dead")
+def outbox_retry_dead():
+    return {"requeued": outbox.retry_dead()}
+
+# -----------------------------
+# FULL-TEXT SEARCH (DESCRIPTION)
+# -----------------------------
+@app.get("/complaints/search", response_model=ComplaintSearchResponse)
+def search_complaints(
+    q: str,
+    status: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    match: str = "all",
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS)
+):
+    db = SessionLocal()
+    try:
+        matched, hits = text_index.search(db, q, status=status, branch_id=branch_id, match=match, limit=limit)
+    except TextIndexError as e:
+        code = 503 if not text_index.ready else 400
+        raise HTTPException(status_code=code, detail=str(e))
+    finally:
+        db.close()
+
+    results = [
+        dict({name: getattr(complaint, name) for name in EXPORT_COLUMNS}, score=score)
+        for complaint, score in hits
+    ]
+
+    return {
+        "query": q,
+        "matched": matched,
+        "count": len(results),
+        "results": results
+    }
+
+@app.get("/complaints/search/stats")
+def get_search_stats():
+    return text_index.stats()
+
 # -----------------------------
 # GET COMPLAINT
 # -----------------------------
@@ -99,18 +214,16 @@ def close_complaint(complaint_id: int):
 
         complaint.status = "CLOSED"
         complaint.closed_at = datetime.utcnow()
+
+        # 🔗 Update Fraud Resolution (via the outbox)
+        if complaint.transaction_id:
+            add_event(db, RESOLVE, complaint_id, complaint.transaction_id, "RESOLVED")
+
         db.commit()
 
-        # 🔗 Update Fraud Resolution
+        text_index.set_status(complaint_id, "CLOSED")
         if complaint.transaction_id:
-            requests.post(
-                f"{FRAUD_SERVICE_URL}/fraud/resolve",
-                json={
-                    "transaction_id": complaint.transaction_id,
-                    "resolution_status": "RESOLVED"
-                },
-                timeout=3
-            )
+            outbox.notify()
 
         return {
             "complaint_id": complaint_id,
@@ -119,13 +232,146 @@ def close_complaint(complaint_id: int):
     finally:
         db.close()
 
+# -----------------------------
+# COMPLAINTS OF A CUSTOMER (CUSTOMER 360)
+# -----------------------------
+@app.get("/complaints/customer/{customer_id}", response_model=list[ComplaintResponse])
+def get_customer_complaints(customer_id: int, limit: int = 100):
+    db = SessionLocal()
+    try:
+        return (
+            db.query(Complaint)
+            .filter(Complaint.customer_id == customer_id)
+            .order_by(Complaint.complaint_id.desc())
+            .limit(min(max(limit, 1), 500))
+            .all()
+        )
+    finally:
+        db.close()
+
+
 # -----------------------------
 # LIST COMPLAINTS (POWER BI)
 # -----------------------------
+def complaint_query(db, status, branch_id, category, created_from, created_to, after_id):
+    columns = [getattr(Complaint, name) for name in EXPORT_COLUMNS]
+    query = db.query(*columns)
+
+    if status:
+        query = query.filter(Complaint.status == status.upper())
+    if branch_id is not None:
+        query = query.filter(Complaint.branch_id == branch_id)
+    if category:
+        query = query.filter(Complaint.category == category)
+    if created_from:
+        query = query.filter(Complaint.created_at >= created_from)
+    if created_to:
+        query = query.filter(Complaint.created_at < created_to + timedelta(days=1))
+    if after_id:
+        query = query.filter(Complaint.complaint_id > after_id)
+
+    return query.order_by(Complaint.complaint_id)
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_complaints(format: str, filters: dict):
+    # owns its session: the response outlives the request
+    db = SessionLocal()
+    try:
+        rows = (
+            complaint_query(db, **filters)
+            .execution_options(stream_results=True)
+            .yield_per(COMPLAINT_STREAM_BATCH)
+        )
+
+        out = io.StringIO()
+        writer = csv.writer(out) if format == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        elif format == "json":
+            # one JSON array, written row by row
+            out.write("[")
+
+        pending = 0
+        separator = ""
+        for row in rows:
+            values = [export_value(v) for v in row]
+            if writer:
+                writer.writerow(values)
+            elif format == "json":
+                out.write(separator)
+                out.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                separator = ","
+            else:
+                out.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                out.write("\n")
+
+            pending += 1
+            if pending >= COMPLAINT_STREAM_BATCH:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+                pending = 0
+
+        if format == "json":
+            out.write("]")
+        if out.tell():
+            yield out.getvalue()
+    finally:
+        db.close()
+
+
 @app.get("/complaints", response_model=list[ComplaintResponse])
-def list_complaints():
+def list_complaints(
+    response: Response,
+    status: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    category: Optional[str] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=COMPLAINT_MAX_PAGE_SIZE),
+    format: str = "json"
+):
+    filters = {
+        "status": status,
+        "branch_id": branch_id,
+        "category": category,
+        "created_from": created_from,
+        "created_to": created_to,
+        "after_id": after_id
+    }
+
+    if format == "ndjson":
+        return StreamingResponse(stream_complaints(format, filters), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            stream_complaints(format, filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=complaints.csv"}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or csv")
+
+    # paging is opt-in: without limit/after_id every complaint is returned,
+    # streamed as one JSON array
+    if limit is None and after_id is None:
+        return StreamingResponse(stream_complaints(format, filters), media_type="application/json")
+    limit = limit or COMPLAINT_PAGE_SIZE
+
     db = SessionLocal()
     try:
-        return db.query(Complaint).all()
+        rows = complaint_query(db, **filters).limit(limit).all()
     finally:
         db.close()
+
+    # a full page may have more after it; pass X-Next-Cursor back as after_id
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].complaint_id)
+
+    return [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
@@ -0,0 +1,34 @@
+from sqlalchemy import inspect, text
+
+# -------------------------------
+# SCHEMA MIGRATIONS
+# -------------------------------
+# create_all only creates missing tables. Columns and indexes added to a
+# table that already exists are listed here and applied at startup when
+# the database does not have them yet, so every step is safe to re-run.
+
+# (table, column, column definition)
+COLUMNS = [
+]
+
+# (table, index name, indexed columns, unique)
+INDEXES = [
+    ("complaints", "ix_complaints_status_id", ("status", "complaint_id"), False),
+    ("complaints", "ix_complaints_branch_status_id", ("branch_id", "status", "complaint_id"), False),
+    ("complaints", "ix_complaints_category_id", ("category", "complaint_id"), False),
+    ("complaints", "ix_complaints_created_at", ("created_at",), False),
+    ("complaints", "ix_complaints_customer_id", ("customer_id",), False),
+]
+
+
+def migrate(engine):
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, definition in COLUMNS:
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+        for table, name, columns, unique in INDEXES:
+            if name not in {i["name"] for i in inspector.get_indexes(table)}:
+                kind = "UNIQUE INDEX" if unique else "INDEX"
+                conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
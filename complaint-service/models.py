@@ -1,13 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
 from datetime import datetime
 from database import Base
 
 class Complaint(Base):
     __tablename__ = "complaints"
+    __table_args__ = (
+        # listing filters, each ending in the keyset column
+        Index("ix_complaints_status_id", "status", "complaint_id"),
+        Index("ix_complaints_branch_status_id", "branch_id", "status", "complaint_id"),
+        Index("ix_complaints_category_id", "category", "complaint_id"),
+        Index("ix_complaints_created_at", "created_at"),
+    )
 
     complaint_id = Column(Integer, primary_key=True, index=True)
 
-    customer_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False, index=True)
     branch_id = Column(Integer, nullable=False)   # 🔥 REQUIRED
 
     account_id = Column(Integer, nullable=True)
@@ -20,3 +27,27 @@ class Complaint(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
     closed_at = Column(DateTime, nullable=True)
+
+
+class FraudOutboxEvent(Base):
+    """A fraud-service notification written in the same commit as the complaint change."""
+    __tablename__ = "complaint_fraud_outbox"
+    __table_args__ = (
+        # dispatcher scan: due PENDING events, oldest first
+        Index("ix_fraud_outbox_status_due", "status", "next_attempt_at", "event_id"),
+    )
+
+    event_id = Column(Integer, primary_key=True, index=True)
+
+    event_type = Column(String(20), nullable=False)   # ATTACH / RESOLVE
+    complaint_id = Column(Integer, nullable=False)
+    transaction_id = Column(Integer, nullable=False)
+    value = Column(String(50), nullable=False)        # feedback type / resolution status
+
+    status = Column(String(20), default="PENDING")    # PENDING / SENT / DEAD
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String(255), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
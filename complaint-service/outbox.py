@@ -0,0 +1,278 @@
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import func
+
+from models import FraudOutboxEvent
+
+logger = logging.getLogger("complaint-service.outbox")
+
+ATTACH = "ATTACH"
+RESOLVE = "RESOLVE"
+
+PENDING = "PENDING"
+SENT = "SENT"
+DEAD = "DEAD"
+
+
+def add_event(db, event_type, complaint_id, transaction_id, value):
+    """Queue a fraud-service notification; the caller commits it with its own change."""
+    db.add(FraudOutboxEvent(
+        event_type=event_type,
+        complaint_id=complaint_id,
+        transaction_id=transaction_id,
+        value=value,
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    ))
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+# -------------------------------
+# OUTBOX DISPATCHER
+# -------------------------------
+class OutboxDispatcher:
+    """Delivers queued complaint events to fraud-service in batches.
+
+    Each pass claims up to `batch_size` due PENDING events by pushing their
+    next_attempt_at out by `lease` seconds (so a second worker skips them),
+    then sends all ATTACH events as one bulk call and RESOLVE events as one
+    bulk call per resolution status. Delivered events are marked SENT; a
+    failed group is retried with exponential backoff and jitter, and after
+    `max_attempts` (or a 4xx other than 408/429) it is marked DEAD. The
+    fraud-service bulk updates are idempotent, so a redelivery after a crash
+    between send and mark is harmless.
+    """
+
+    def __init__(self, session_factory, fraud_url, batch_size=500, interval=1.0, timeout=5,
+                 max_attempts=10, base_backoff=1.0, max_backoff=300.0, lease=60):
+        self.session_factory = session_factory
+        self.fraud_url = fraud_url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+        self._http = requests.Session()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._pass_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="fraud-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._http.close()
+
+    def notify(self):
+        """Wake the dispatcher now instead of at the next interval."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                # keep going while passes come back full
+                while self.run_once()["claimed"] == self.batch_size and not self._stopping.is_set():
+                    pass
+            except Exception:
+                logger.exception("Fraud outbox dispatch failed")
+
+    # -------------------------------
+    # ONE PASS
+    # -------------------------------
+    def run_once(self):
+        with self._pass_lock:
+            events = self._claim()
+            if not events:
+                return {"claimed": 0, "sent": 0, "retried": 0, "dead": 0}
+
+            groups = {}
+            for event in events:
+                groups.setdefault((event.event_type, event.value), []).append(event)
+
+            updates = []
+            now = datetime.utcnow()
+            for (event_type, value), group in groups.items():
+                try:
+                    self._deliver(event_type, value, group)
+                except DeliveryError as e:
+                    updates.extend(self._failed(group, str(e), e.permanent, now))
+                else:
+                    updates.extend(
+                        {"event_id": event.event_id, "status": SENT, "sent_at": now, "last_error": None}
+                        for event in group
+                    )
+
+            db = self.session_factory()
+            try:
+                db.bulk_update_mappings(FraudOutboxEvent, updates)
+                db.commit()
+            finally:
+                db.close()
+
+            result = {"claimed": len(events), "sent": 0, "retried": 0, "dead": 0}
+            for row in updates:
+                key = "sent" if row["status"] == SENT else "dead" if row["status"] == DEAD else "retried"
+                result[key] += 1
+            self.sent += result["sent"]
+            self.retried += result["retried"]
+            self.dead += result["dead"]
+            return result
+
+    def _claim(self):
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            events = (
+                db.query(
+                    FraudOutboxEvent.event_id,
+                    FraudOutboxEvent.event_type,
+                    FraudOutboxEvent.complaint_id,
+                    FraudOutboxEvent.transaction_id,
+                    FraudOutboxEvent.value,
+                    FraudOutboxEvent.attempts
+                )
+                .filter(
+                    FraudOutboxEvent.status == PENDING,
+                    FraudOutboxEvent.next_attempt_at <= now
+                )
+                .order_by(FraudOutboxEvent.next_attempt_at, FraudOutboxEvent.event_id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if events:
+                db.query(FraudOutboxEvent).filter(
+                    FraudOutboxEvent.event_id.in_([e.event_id for e in events])
+                ).update(
+                    {FraudOutboxEvent.next_attempt_at: now + timedelta(seconds=self.lease)},
+                    synchronize_session=False
+                )
+            db.commit()
+            return events
+        finally:
+            db.close()
+
+    def _deliver(self, event_type, value, group):
+        if event_type == ATTACH:
+            path = "/fraud/bulk/attach-complaints"
+            body = {
+                "items": [
+                    {
+                        "transaction_id": e.transaction_id,
+                        "complaint_id": e.complaint_id,
+                        "feedback_type": value
+                    }
+                    for e in group
+                ]
+            }
+        else:
+            path = "/fraud/bulk/resolve"
+            body = {
+                "transaction_ids": sorted({e.transaction_id for e in group}),
+                "resolution_status": value
+            }
+
+        try:
+            response = self._http.post(f"{self.fraud_url}{path}", json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(f"{type(e).__name__}: {e}")
+
+        if response.status_code >= 400:
+            permanent = response.status_code < 500 and response.status_code not in (408, 429)
+            raise DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}", permanent)
+
+    def _failed(self, group, error, permanent, now):
+        rows = []
+        for event in group:
+            attempts = event.attempts + 1
+            row = {"event_id": event.event_id, "attempts": attempts, "last_error": error[:255]}
+            if permanent or attempts >= self.max_attempts:
+                row["status"] = DEAD
+                logger.error("Fraud outbox event %s dead after %s attempts: %s", event.event_id, attempts, error)
+            else:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+                row["status"] = PENDING
+                row["next_attempt_at"] = now + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+            rows.append(row)
+        return rows
+
+    # -------------------------------
+    # MONITORING
+    # -------------------------------
+    def stats(self):
+        db = self.session_factory()
+        try:
+            counts = dict(
+                db.query(FraudOutboxEvent.status, func.count())
+                .group_by(FraudOutboxEvent.status)
+                .all()
+            )
+            oldest = db.query(func.min(FraudOutboxEvent.created_at)).filter(
+                FraudOutboxEvent.status == PENDING
+            ).scalar()
+        finally:
+            db.close()
+
+        return {
+            "pending": counts.get(PENDING, 0),
+            "sent": counts.get(SENT, 0),
+            "dead": counts.get(DEAD, 0),
+            "oldest_pending_seconds": (
+                round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None
+            ),
+            "delivered_since_start": self.sent,
+            "retried_since_start": self.retried,
+            "dead_since_start": self.dead
+        }
+
+    def retry_dead(self):
+        """Put DEAD events back in the queue, e.g. after fixing fraud-service."""
+        db = self.session_factory()
+        try:
+            requeued = db.query(FraudOutboxEvent).filter(
+                FraudOutboxEvent.status == DEAD
+            ).update(
+                {
+                    FraudOutboxEvent.status: PENDING,
+                    FraudOutboxEvent.attempts: 0,
+                    FraudOutboxEvent.next_attempt_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        if requeued:
+            self.notify()
+        return requeued
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ComplaintCreate(BaseModel):
@@ -24,3 +24,12 @@ class ComplaintResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class ComplaintSearchHit(ComplaintResponse):
+    score: float
+
+class ComplaintSearchResponse(BaseModel):
+    query: str
+    matched: int
+    count: int
+    results: List[ComplaintSearchHit]
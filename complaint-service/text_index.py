@@ -0,0 +1,640 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import or_
+
+from models import Complaint
+
+logger = logging.getLogger("complaint-service.text_index")
+
+STATUS_CODES = {"OPEN": 0, "CLOSED": 1}
+UNKNOWN_STATUS = 255
+
+MATCH_MODES = ("all", "any")
+
+MIN_TOKEN = 2
+MAX_TOKEN = 40
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it my me no not of on or "
+    "so that the this to was we were will with".split()
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Complaints created or closed this long before a snapshot are re-read on
+# load, to cover rows committed while the snapshot was being written
+CATCH_UP_MARGIN = timedelta(minutes=5)
+
+
+class TextIndexError(Exception):
+    pass
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_PATTERN.findall((text or "").lower())
+        if MIN_TOKEN <= len(token) <= MAX_TOKEN and token not in STOPWORDS
+    ]
+
+
+def term_code(token):
+    return zlib.crc32(token.encode())
+
+
+def status_code(status):
+    return STATUS_CODES.get((status or "").upper(), UNKNOWN_STATUS)
+
+
+# -------------------------------
+# ON-DISK POSTING ENCODING
+# -------------------------------
+def varint_encode(values):
+    """LEB128 bytes of non-negative integers, 7 bits per byte."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return np.array([], dtype=np.uint8)
+
+    bits = np.zeros(len(values), dtype=np.int64)
+    nonzero = values > 0
+    bits[nonzero] = np.floor(np.log2(values[nonzero].astype(np.float64))).astype(np.int64) + 1
+    widths = np.maximum((bits + 6) // 7, 1)
+
+    shifts = np.arange(widths.max(), dtype=np.uint64) * np.uint64(7)
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    more = np.arange(widths.max())[None, :] < (widths - 1)[:, None]
+    groups[more] |= 0x80
+    return groups[np.arange(widths.max())[None, :] < widths[:, None]]
+
+
+def varint_decode(data):
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.array([], dtype=np.int64)
+
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(parts, starts)
+
+
+def gap_encode(ids, offsets):
+    """Per-list deltas of sorted ids; each list restarts from its first id."""
+    gaps = ids.copy()
+    gaps[1:] -= ids[:-1]
+    starts = offsets[:-1][np.diff(offsets) > 0]
+    gaps[starts] = ids[starts]
+    return varint_encode(gaps)
+
+
+def gap_decode(data, offsets):
+    gaps = varint_decode(data)
+    if not len(gaps):
+        return gaps
+    totals = np.cumsum(gaps)
+    lengths = np.diff(offsets)
+    before = np.where(offsets[:-1] > 0, totals[np.maximum(offsets[:-1] - 1, 0)], 0)
+    return totals - np.repeat(before, lengths)
+
+
+# -------------------------------
+# IMMUTABLE, NUMPY-BACKED SEGMENT
+# -------------------------------
+class _Segment:
+    """Per-complaint attributes plus CSR postings with term frequencies.
+
+    Documents are kept sorted by complaint_id, so attribute lookups are one
+    searchsorted. In memory the postings are plain arrays; on disk ids are
+    gap-encoded per term and, like lengths and frequencies, stored as
+    varints.
+    """
+
+    def __init__(self, doc_ids, doc_len, doc_status, doc_branch,
+                 term_codes, term_offsets, post_ids, post_tf, built_at):
+        self.doc_ids = doc_ids
+        self.doc_len = doc_len
+        self.doc_status = doc_status
+        self.doc_branch = doc_branch
+        self.term_codes = term_codes      # sorted unique term codes
+        self.term_offsets = term_offsets  # postings of term_codes[i] are post_*[off[i]:off[i+1]]
+        self.post_ids = post_ids
+        self.post_tf = post_tf
+        self.built_at = built_at
+        self.total_len = int(doc_len.sum())
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.uint8),
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.uint32),
+            np.zeros(1, dtype=np.int64),
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.int64),
+            None
+        )
+
+    @classmethod
+    def from_arrays(cls, docs, postings, built_at):
+        """Build from unsorted (ids, len, status, branch) and (codes, ids, tf).
+
+        A complaint listed more than once keeps its last entry, so a newer
+        layer passed after an older one wins.
+        """
+        doc_ids, doc_len, doc_status, doc_branch = docs
+        _, last = np.unique(doc_ids[::-1], return_index=True)
+        order = len(doc_ids) - 1 - last
+
+        codes, ids, tfs = postings
+        porder = np.lexsort((ids, codes))
+        codes, ids, tfs = codes[porder], ids[porder], tfs[porder]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (ids[1:] != ids[:-1])
+        codes, ids, tfs = codes[first], ids[first], tfs[first]
+        term_codes, starts = np.unique(codes, return_index=True)
+
+        return cls(
+            doc_ids[order].astype(np.int64),
+            doc_len[order].astype(np.int64),
+            doc_status[order].astype(np.uint8),
+            doc_branch[order].astype(np.int64),
+            term_codes.astype(np.uint32),
+            np.append(starts, len(ids)).astype(np.int64),
+            ids.astype(np.int64),
+            tfs.astype(np.int64),
+            built_at
+        )
+
+    def arrays(self, status_overrides):
+        status = self.doc_status.copy()
+        if status_overrides:
+            ids = np.fromiter(status_overrides.keys(), dtype=np.int64, count=len(status_overrides))
+            codes = np.fromiter(status_overrides.values(), dtype=np.uint8, count=len(status_overrides))
+            pos = np.searchsorted(self.doc_ids, ids)
+            hit = pos < len(self.doc_ids)
+            hit[hit] = self.doc_ids[pos[hit]] == ids[hit]
+            status[pos[hit]] = codes[hit]
+        docs = (self.doc_ids, self.doc_len, status, self.doc_branch)
+        codes = np.repeat(self.term_codes, np.diff(self.term_offsets))
+        return docs, (codes, self.post_ids, self.post_tf)
+
+    def size(self):
+        return len(self.doc_ids)
+
+    def contains(self, complaint_id):
+        i = np.searchsorted(self.doc_ids, complaint_id)
+        return i < len(self.doc_ids) and self.doc_ids[i] == complaint_id
+
+    def postings(self, code):
+        i = np.searchsorted(self.term_codes, code)
+        if i == len(self.term_codes) or self.term_codes[i] != code:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        lo, hi = self.term_offsets[i], self.term_offsets[i + 1]
+        return self.post_ids[lo:hi], self.post_tf[lo:hi]
+
+    def attributes(self, ids):
+        """(found mask, len, status, branch) of `ids` in this segment."""
+        pos = np.searchsorted(self.doc_ids, ids)
+        found = pos < len(self.doc_ids)
+        found[found] = self.doc_ids[pos[found]] == ids[found]
+        pos = np.where(found, pos, 0)
+        if not len(self.doc_ids):
+            n = len(ids)
+            return found, np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.uint8), np.zeros(n, dtype=np.int64)
+        return found, self.doc_len[pos], self.doc_status[pos], self.doc_branch[pos]
+
+    def save(self, path):
+        doc_offsets = np.array([0, len(self.doc_ids)], dtype=np.int64)
+        arrays = {
+            "doc_ids": gap_encode(self.doc_ids, doc_offsets),
+            "doc_len": varint_encode(self.doc_len),
+            "doc_status": self.doc_status,
+            "doc_branch": varint_encode(self.doc_branch),
+            "term_codes": self.term_codes,
+            "term_df": varint_encode(np.diff(self.term_offsets)),
+            "post_ids": gap_encode(self.post_ids, self.term_offsets),
+            "post_tf": varint_encode(self.post_tf),
+            "built_at": np.array(self.built_at.isoformat())
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            doc_len = varint_decode(data["doc_len"])
+            term_offsets = np.concatenate([[0], np.cumsum(varint_decode(data["term_df"]))]).astype(np.int64)
+            return cls(
+                gap_decode(data["doc_ids"], np.array([0, len(doc_len)], dtype=np.int64)),
+                doc_len,
+                data["doc_status"],
+                varint_decode(data["doc_branch"]),
+                data["term_codes"],
+                term_offsets,
+                gap_decode(data["post_ids"], term_offsets),
+                varint_decode(data["post_tf"]),
+                datetime.fromisoformat(str(data["built_at"]))
+            )
+
+
+# -------------------------------
+# MUTABLE DELTA (SINCE LAST COMPACTION)
+# -------------------------------
+class _Delta:
+    def __init__(self):
+        self.docs = {}       # complaint_id -> [len, status, branch]
+        self.terms = {}      # code -> {complaint_id: tf}
+        self.status = {}     # status changes to complaints in older layers
+        self.total_len = 0
+
+    @property
+    def count(self):
+        return len(self.docs) + len(self.status)
+
+    def add(self, complaint_id, description, status, branch_id):
+        counts = Counter(term_code(t) for t in tokenize(description))
+        length = sum(counts.values())
+        self.docs[complaint_id] = [length, status, branch_id]
+        for code, tf in counts.items():
+            self.terms.setdefault(code, {})[complaint_id] = tf
+        self.total_len += length
+
+    def drop_indexed(self, segment):
+        """Keep only the status of complaints `segment` already holds."""
+        dropped = {c for c in self.docs if segment.contains(c)}
+        if not dropped:
+            return
+        for complaint_id in dropped:
+            length, status, _ = self.docs.pop(complaint_id)
+            self.total_len -= length
+            self.status[complaint_id] = status
+        for code in list(self.terms):
+            entries = self.terms[code]
+            for complaint_id in dropped.intersection(entries):
+                del entries[complaint_id]
+            if not entries:
+                del self.terms[code]
+
+    def set_status(self, complaint_id, status):
+        doc = self.docs.get(complaint_id)
+        if doc is not None:
+            doc[1] = status
+        else:
+            self.status[complaint_id] = status
+
+    def postings(self, code):
+        entries = self.terms.get(code)
+        if not entries:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        return (
+            np.fromiter(entries.keys(), dtype=np.int64, count=len(entries)),
+            np.fromiter(entries.values(), dtype=np.int64, count=len(entries))
+        )
+
+    def arrays(self):
+        ids = np.fromiter(self.docs.keys(), dtype=np.int64, count=len(self.docs))
+        values = np.array(list(self.docs.values()), dtype=np.int64).reshape(-1, 3)
+        docs = (ids, values[:, 0], values[:, 1].astype(np.uint8), values[:, 2])
+
+        codes, post_ids, tfs = [], [], []
+        for code, entries in self.terms.items():
+            codes.extend([code] * len(entries))
+            post_ids.extend(entries.keys())
+            tfs.extend(entries.values())
+        postings = (
+            np.array(codes, dtype=np.uint32),
+            np.array(post_ids, dtype=np.int64),
+            np.array(tfs, dtype=np.int64)
+        )
+        return docs, postings
+
+
+def _concat_arrays(parts):
+    docs = tuple(np.concatenate([p[0][i] for p in parts]) for i in range(4))
+    postings = tuple(np.concatenate([p[1][i] for p in parts]) for i in range(3))
+    return docs, postings
+
+
+# -------------------------------
+# COMPLAINT TEXT INDEX
+# -------------------------------
+class ComplaintTextIndex:
+    """BM25-ranked keyword search over complaint descriptions.
+
+    Same layout as the customer search index: a compacted, immutable numpy
+    segment persisted as a snapshot, plus a small delta for complaints
+    created or closed since, folded in by `compact`. Status and branch are
+    held per complaint so filters are applied before ranking. Terms are
+    stored as CRC32 codes, so the top hits are re-checked against their DB
+    rows to drop the rare hash collision.
+    """
+
+    def __init__(self, session_factory, snapshot_path, chunk_size=50000,
+                 snapshot_interval=900, compact_threshold=20000):
+        self.session_factory = session_factory
+        self.snapshot_path = snapshot_path
+        self.chunk_size = chunk_size
+        self.snapshot_interval = snapshot_interval
+        self.compact_threshold = compact_threshold
+
+        self.ready = False
+        self._base = _Segment.empty()
+        self._frozen = None
+        self._delta = _Delta()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # -------------------------------
+    # LIFECYCLE
+    # -------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="complaint-text-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Complaint text index load failed")
+            return
+
+        last_snapshot = time.monotonic()
+        # wake often enough to compact a busy delta well before the snapshot is due
+        while not self._stopping.wait(min(self.snapshot_interval, 60)):
+            try:
+                due = time.monotonic() - last_snapshot >= self.snapshot_interval
+                if self.pending() >= self.compact_threshold or (due and self.pending()):
+                    self.compact()
+                if due:
+                    self.save_snapshot()
+                    last_snapshot = time.monotonic()
+            except Exception:
+                logger.exception("Complaint text index snapshot failed")
+
+    def load(self):
+        started = time.monotonic()
+        base = None
+
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                base = _Segment.load(self.snapshot_path)
+            except Exception:
+                logger.exception("Ignoring unreadable complaint text snapshot %s", self.snapshot_path)
+
+        if base is not None:
+            # only complaints created or closed since the snapshot are read
+            self._base = base
+            caught_up = 0
+            for row in self._rows(base.built_at - CATCH_UP_MARGIN):
+                self.add(*row)
+                caught_up += 1
+            source = f"snapshot + {caught_up} changed"
+        else:
+            built_at = datetime.utcnow()
+            parts = []
+            chunk = _Delta()
+            for row in self._rows(None):
+                chunk.add(row[0], row[1], status_code(row[2]), row[3])
+                if len(chunk.docs) >= self.chunk_size:
+                    parts.append(chunk.arrays())
+                    chunk = _Delta()
+            parts.append(chunk.arrays())
+
+            segment = _Segment.from_arrays(*_concat_arrays(parts), built_at)
+            with self._lock:
+                # complaints created during the scan may also have been added
+                # live; the scanned copy stays, the live one keeps its status
+                self._base = segment
+                self._delta.drop_indexed(segment)
+            source = "full scan"
+
+        self.ready = True
+        logger.info(
+            "Complaint text index ready: %s complaints in %.1fs (%s)",
+            self._base.size(), time.monotonic() - started, source
+        )
+
+        if base is None:
+            self.save_snapshot()
+
+    def _rows(self, since):
+        """(id, description, status, branch) of complaints changed at or after `since`."""
+        db = self.session_factory()
+        try:
+            query = db.query(
+                Complaint.complaint_id,
+                Complaint.description,
+                Complaint.status,
+                Complaint.branch_id
+            )
+            if since is not None:
+                query = query.filter(or_(Complaint.created_at >= since, Complaint.closed_at >= since))
+
+            for row in query.yield_per(self.chunk_size):
+                yield tuple(row)
+        finally:
+            db.close()
+
+    # -------------------------------
+    # MAINTENANCE
+    # -------------------------------
+    def add(self, complaint_id, description, status, branch_id):
+        """Index a new complaint (or refresh the status of a known one)."""
+        code = status_code(status)
+        with self._lock:
+            frozen = self._frozen
+            known = self._base.contains(complaint_id) or (frozen is not None and complaint_id in frozen.docs)
+            if known:
+                self._delta.set_status(complaint_id, code)
+            elif complaint_id not in self._delta.docs:
+                self._delta.add(complaint_id, description, code, branch_id)
+
+    def set_status(self, complaint_id, status):
+        with self._lock:
+            self._delta.set_status(complaint_id, status_code(status))
+
+    def pending(self):
+        return self._delta.count + (self._frozen.count if self._frozen else 0)
+
+    def compact(self):
+        """Fold the delta into a new base segment without blocking searches."""
+        with self._compact_lock:
+            with self._lock:
+                frozen, self._delta = self._delta, _Delta()
+                self._frozen = frozen
+                base = self._base
+
+            built_at = datetime.utcnow()
+            merged = _Segment.from_arrays(
+                *_concat_arrays([base.arrays(frozen.status), frozen.arrays()]),
+                built_at
+            )
+
+            with self._lock:
+                self._base = merged
+                self._frozen = None
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        base = self._base
+        base.save(self.snapshot_path)
+        logger.info("Complaint text snapshot written: %s complaints", base.size())
+
+    def stats(self):
+        base = self._base
+        return {
+            "ready": self.ready,
+            "indexed": base.size(),
+            "terms": len(base.term_codes),
+            "postings": len(base.post_ids),
+            "pending": self.pending(),
+            "built_at": base.built_at
+        }
+
+    # -------------------------------
+    # SEARCH
+    # -------------------------------
+    def _attributes(self, ids, base, layer_docs, overrides):
+        found, length, status, branch = base.attributes(ids)
+
+        for i in np.flatnonzero(~found).tolist():
+            doc = layer_docs.get(int(ids[i]))
+            if doc is not None:
+                length[i], status[i], branch[i] = doc
+
+        if overrides:
+            changed = np.fromiter(overrides.keys(), dtype=np.int64, count=len(overrides))
+            codes = np.fromiter(overrides.values(), dtype=np.uint8, count=len(overrides))
+            pos = np.searchsorted(ids, changed)
+            hit = pos < len(ids)
+            hit[hit] = ids[pos[hit]] == changed[hit]
+            status[pos[hit]] = codes[hit]
+        return length, status, branch
+
+    def rank(self, query, status=None, branch_id=None, match="all", limit=20):
+        """Top (complaint_ids, scores) and the total number of matches."""
+        if match not in MATCH_MODES:
+            raise TextIndexError(f"match must be one of {', '.join(MATCH_MODES)}")
+
+        codes = sorted({term_code(t) for t in tokenize(query)})
+        if not codes:
+            raise TextIndexError("Query has no searchable words")
+
+        wanted_status = None
+        if status:
+            wanted_status = status_code(status)
+            if wanted_status == UNKNOWN_STATUS:
+                raise TextIndexError(f"status must be one of {', '.join(STATUS_CODES)}")
+
+        # only the small delta layers are read under the lock; the base is immutable
+        with self._lock:
+            base = self._base
+            layers = [self._frozen, self._delta] if self._frozen else [self._delta]
+            layer_postings = [[layer.postings(code) for code in codes] for layer in layers]
+            layer_docs = {}
+            overrides = {}
+            for layer, postings in zip(layers, layer_postings):
+                for ids, _ in postings:
+                    for complaint_id in ids.tolist():
+                        layer_docs[complaint_id] = tuple(layer.docs[complaint_id])
+                overrides.update(layer.status)
+            doc_count = base.size() + sum(len(layer.docs) for layer in layers)
+            total_len = base.total_len + sum(layer.total_len for layer in layers)
+
+        avg_len = total_len / doc_count if doc_count else 1.0
+
+        term_ids, term_tf, term_weight = [], [], []
+        for t, code in enumerate(codes):
+            ids, tfs = base.postings(code)
+            ids = np.concatenate([ids] + [postings[t][0] for postings in layer_postings])
+            tfs = np.concatenate([tfs] + [postings[t][1] for postings in layer_postings])
+            if not len(ids) and match == "all":
+                return [], [], 0
+            idf = math.log(1 + (doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+            term_ids.append(ids)
+            term_tf.append(tfs)
+            term_weight.append(np.full(len(ids), idf))
+
+        ids = np.concatenate(term_ids)
+        if not len(ids):
+            return [], [], 0
+        tfs = np.concatenate(term_tf).astype(np.float64)
+        weights = np.concatenate(term_weight)
+
+        docs, inverse, hits = np.unique(ids, return_inverse=True, return_counts=True)
+        length, doc_status, doc_branch = self._attributes(docs, base, layer_docs, overrides)
+
+        norm = K1 * (1 - B + B * length / avg_len)
+        contrib = weights * tfs * (K1 + 1) / (tfs + norm[inverse])
+        scores = np.bincount(inverse, weights=contrib, minlength=len(docs))
+
+        keep = np.ones(len(docs), dtype=bool)
+        if match == "all":
+            keep &= hits == len(codes)
+        if wanted_status is not None:
+            keep &= doc_status == wanted_status
+        if branch_id is not None:
+            keep &= doc_branch == branch_id
+
+        docs, scores = docs[keep], scores[keep]
+        total = len(docs)
+        if not total:
+            return [], [], 0
+
+        # highest score first, newest complaint on ties
+        top = np.lexsort((-docs, -scores))[:limit]
+        return docs[top].tolist(), scores[top].tolist(), total
+
+    def search(self, db, query, status=None, branch_id=None, match="all", limit=20):
+        if not self.ready:
+            raise TextIndexError("Search index is still loading")
+
+        # over-fetch a little so dropped collisions do not shorten the page
+        ids, scores, total = self.rank(query, status, branch_id, match, limit + 5)
+        if not ids:
+            return total, []
+
+        rows = {
+            c.complaint_id: c
+            for c in db.query(Complaint).filter(Complaint.complaint_id.in_(ids)).all()
+        }
+
+        words = set(tokenize(query))
+        results = []
+        for complaint_id, score in zip(ids, scores):
+            complaint = rows.get(complaint_id)
+            if complaint is None:
+                continue
+            found = words & set(tokenize(complaint.description))
+            if not found or (match == "all" and found != words):
+                continue
+            results.append((complaint, round(score, 4)))
+            if len(results) == limit:
+                break
+        return total, results
+
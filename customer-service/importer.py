@@ -0,0 +1,242 @@
+import csv
+import json
+import logging
+import time
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import Customer
+from schemas import CustomerCreate
+
+logger = logging.getLogger("customer-service.importer")
+
+FORMATS = ("csv", "ndjson")
+
+# Columns that must be unique across customers
+UNIQUE_FIELDS = ("customer_id", "mobile", "email", "pan", "aadhaar")
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def _key(field, value):
+    # MySQL's default collation compares these case-insensitively
+    return value if field == "customer_id" else str(value).strip().casefold()
+
+
+def _validation_message(e):
+    first = e.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}"
+
+
+# -------------------------------
+# STREAMING IMPORT
+# -------------------------------
+class CustomerImport:
+    """Incremental CSV / NDJSON customer import.
+
+    Text is fed in as it arrives; complete records are parsed and queued,
+    and `flush` writes queued rows `chunk_size` at a time. Duplicates are
+    caught with per-chunk hash sets and one IN query per unique column
+    against the DB; rows from earlier chunks are already in the DB, so they
+    are caught there. Only the current chunk and the first `max_errors`
+    errors are held in memory.
+    """
+
+    def __init__(self, session_factory, fmt, chunk_size=1000, max_errors=1000, on_insert=None):
+        if fmt not in FORMATS:
+            raise ImportFormatError(f"format must be one of {', '.join(FORMATS)}")
+
+        self.session_factory = session_factory
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.on_insert = on_insert
+
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+        self._started = time.monotonic()
+        self._buffer = ""
+        self._line = 0
+        self._record_start = 0
+        self._pending_record = ""
+        self._header = None
+        self._queue = []
+
+    # -------------------------------
+    # PARSING
+    # -------------------------------
+    def feed(self, text, final=False):
+        self._buffer += text
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+
+        for line in lines:
+            self._line += 1
+            if self.fmt == "ndjson":
+                self._parse_ndjson(line)
+            else:
+                self._parse_csv(line)
+
+        if final and self._pending_record:
+            self._error(self._record_start, None, "Unterminated quoted field")
+            self._pending_record = ""
+
+    def ready(self):
+        return len(self._queue) >= self.chunk_size
+
+    def _parse_ndjson(self, line):
+        if not line.strip():
+            return
+        self.rows += 1
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            self._error(self._line, None, "Invalid JSON")
+            return
+        if not isinstance(raw, dict):
+            self._error(self._line, None, "Expected a JSON object")
+            return
+        self._validate(self._line, raw)
+
+    def _parse_csv(self, line):
+        line = line.rstrip("\r")
+        if not self._pending_record:
+            self._record_start = self._line
+            if not line.strip():
+                return
+            record = line
+        else:
+            record = self._pending_record + "\n" + line
+
+        # an odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            self._pending_record = record
+            return
+        self._pending_record = ""
+
+        values = next(csv.reader([record]))
+        if self._header is None:
+            self._header = [column.strip().lower() for column in values]
+            return
+
+        self.rows += 1
+        if len(values) != len(self._header):
+            self._error(self._record_start, None, f"Expected {len(self._header)} columns, got {len(values)}")
+            return
+
+        raw = {
+            column: (value.strip() or None)
+            for column, value in zip(self._header, values)
+        }
+        self._validate(self._record_start, raw)
+
+    def _validate(self, line, raw):
+        try:
+            data = CustomerCreate(**raw)
+        except ValidationError as e:
+            self._error(line, raw.get("customer_id"), _validation_message(e))
+            return
+
+        row = data.dict()
+        row["risk_level"] = row.get("risk_level") or "LOW"
+        self._queue.append((line, row))
+
+    def _error(self, line, customer_id, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "customer_id": customer_id, "error": message})
+
+    # -------------------------------
+    # WRITING
+    # -------------------------------
+    def flush(self, final=False):
+        while self._queue and (final or len(self._queue) >= self.chunk_size):
+            chunk = self._queue[:self.chunk_size]
+            del self._queue[:self.chunk_size]
+            self._write_chunk(chunk)
+
+    def _write_chunk(self, chunk):
+        seen = {field: set() for field in UNIQUE_FIELDS}
+        unique = []
+        for line, row in chunk:
+            duplicate = next(
+                (f for f in UNIQUE_FIELDS if _key(f, row[f]) in seen[f]),
+                None
+            )
+            if duplicate:
+                self._error(line, row["customer_id"], f"Duplicate {duplicate} in file")
+                continue
+            for field in UNIQUE_FIELDS:
+                seen[field].add(_key(field, row[field]))
+            unique.append((line, row))
+
+        if not unique:
+            return
+
+        db = self.session_factory()
+        try:
+            existing = {}
+            for field in UNIQUE_FIELDS:
+                column = getattr(Customer, field)
+                values = [row[field] for _, row in unique]
+                existing[field] = {
+                    _key(field, value)
+                    for (value,) in db.query(column).filter(column.in_(values))
+                }
+
+            fresh = []
+            for line, row in unique:
+                clash = next(
+                    (f for f in UNIQUE_FIELDS if _key(f, row[f]) in existing[f]),
+                    None
+                )
+                if clash:
+                    self._error(line, row["customer_id"], f"Customer with same {clash} already exists")
+                else:
+                    fresh.append((line, row))
+
+            if not fresh:
+                return
+
+            try:
+                db.execute(insert(Customer).values([row for _, row in fresh]))
+                db.commit()
+                inserted = fresh
+            except IntegrityError:
+                # lost a race with a concurrent create; fall back to row by row
+                db.rollback()
+                inserted = []
+                for line, row in fresh:
+                    try:
+                        db.execute(insert(Customer).values(row))
+                        db.commit()
+                        inserted.append((line, row))
+                    except IntegrityError:
+                        db.rollback()
+                        self._error(line, row["customer_id"], "Customer with same mobile/email/pan/aadhaar already exists")
+        finally:
+            db.close()
+
+        self.imported += len(inserted)
+        if self.on_insert:
+            for _, row in inserted:
+                self.on_insert(Customer(**row))
+
+    def report(self):
+        return {
+            "format": self.fmt,
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "elapsed_seconds": round(time.monotonic() - self._started, 3),
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "errors_truncated": self.failed > len(self.errors)
+        }
@@ -1,9 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
 from database import engine, SessionLocal
 from models import Base, Customer
-from schemas import CustomerCreate, CustomerResponse
+from schemas import CustomerCreate, CustomerResponse, CustomerSearchResponse, CustomerStatusUpdate
+from status_cache import StatusCache, etag_matches
+from search_index import CustomerSearchIndex, SearchIndexError
+from importer import CustomerImport, ImportFormatError
 from sqlalchemy.exc import IntegrityError
 from fastapi.middleware.cors import CORSMiddleware
+import codecs
+import os
+
+# Customer search index and its on-disk snapshot
+SEARCH_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_snapshots", "customers.npz")
+SEARCH_SNAPSHOT_INTERVAL = 900
+SEARCH_MAX_RESULTS = 50
+
+# Bulk import: rows per multi-row INSERT and errors listed in the report
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Status endpoint: server-side cache, and clients must revalidate (ETag)
+STATUS_CACHE_TTL = 60
+STATUS_CACHE_MAX_ENTRIES = 100000
+STATUS_CACHE_CONTROL = "private, no-cache"
+CUSTOMER_STATUSES = ("ACTIVE", "INACTIVE", "BLOCKED", "CLOSED")
 
 
 app = FastAPI(title="Customer Service (CIF)")
@@ -16,6 +37,26 @@ app.add_middleware(
 )
 Base.metadata.create_all(bind=engine)
 
+search_index = CustomerSearchIndex(
+    SessionLocal,
+    SEARCH_SNAPSHOT_PATH,
+    snapshot_interval=SEARCH_SNAPSHOT_INTERVAL
+)
+
+
+status_cache = StatusCache(ttl=STATUS_CACHE_TTL, max_entries=STATUS_CACHE_MAX_ENTRIES)
+
+
+@app.on_event("startup")
+def start_search_index():
+    search_index.start()
+
+
+@app.on_event("shutdown")
+def stop_search_index():
+    search_index.stop()
+
+
 @app.get("/health")
 def health_check():
     return {
@@ -40,6 +81,7 @@ def create_customer(data: CustomerCreate):
         db.add(customer)
         db.commit()
         db.refresh(customer)
+        search_index.add(customer)
 
         result = customer
 
@@ -55,6 +97,70 @@ def create_customer(data: CustomerCreate):
     return result
 
 
+# -----------------------------
+# BULK IMPORT (CSV / NDJSON, STREAMED)
+# -----------------------------
+@app.post("/customers/import")
+async def import_customers(request: Request, format: str = None):
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "json" in content_type else "csv"
+
+    try:
+        job = CustomerImport(
+            SessionLocal,
+            format,
+            chunk_size=IMPORT_CHUNK_SIZE,
+            max_errors=IMPORT_MAX_REPORTED_ERRORS,
+            on_insert=search_index.add
+        )
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # the body is parsed as it arrives; only one chunk of rows is held.
+    # Parsing and inserts run in the threadpool so the event loop stays free.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    async for data in request.stream():
+        await run_in_threadpool(job.feed, decoder.decode(data))
+        if job.ready():
+            await run_in_threadpool(job.flush)
+
+    await run_in_threadpool(job.feed, decoder.decode(b"", final=True), final=True)
+    await run_in_threadpool(job.flush, True)
+
+    return job.report()
+
+
+# -----------------------------
+# SEARCH (NAME / MOBILE / PAN / EMAIL)
+# -----------------------------
+@app.get("/customers/search", response_model=CustomerSearchResponse)
+def search_customers(q: str, field: str = None, limit: int = 20):
+    if limit < 1 or limit > SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_RESULTS}")
+
+    db = SessionLocal()
+    try:
+        field, results = search_index.search(db, q, field=field, limit=limit)
+    except SearchIndexError as e:
+        status = 503 if not search_index.ready else 400
+        raise HTTPException(status_code=status, detail=str(e))
+    finally:
+        db.close()
+
+    return {
+        "query": q,
+        "field": field,
+        "count": len(results),
+        "results": results
+    }
+
+
+@app.get("/customers/search/stats")
+def get_search_stats():
+    return search_index.stats()
+
+
 # -----------------------------
 # GET CUSTOMER (UI / BI)
 # -----------------------------
@@ -121,15 +227,23 @@ def verify_kyc(customer_id: int):
 
     db.commit()
     db.close()
+    status_cache.invalidate(customer_id)
 
     return {"status": "KYC VERIFIED"}
 
 
 # -----------------------------
-# CUSTOMER STATUS (CRITICAL FOR OTHER SERVICES)
+# UPDATE CUSTOMER STATUS
 # -----------------------------
-@app.get("/customers/{customer_id}/status")
-def get_customer_status(customer_id: int):
+@app.post("/customers/{customer_id}/status")
+def update_customer_status(customer_id: int, data: CustomerStatusUpdate):
+    status = data.status.strip().upper()
+    if status not in CUSTOMER_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"status must be one of {', '.join(CUSTOMER_STATUSES)}"
+        )
+
     db = SessionLocal()
     customer = db.query(Customer).filter(
         Customer.customer_id == customer_id
@@ -139,15 +253,47 @@ def get_customer_status(customer_id: int):
         db.close()
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    response = {
-        "customer_id": customer.customer_id,
-        "kyc_status": customer.kyc_status,
-        "status": customer.status,
-        "branch_id": customer.branch_id,
-        "risk_level": customer.risk_level
-    }
-
+    customer.status = status
+    db.commit()
     db.close()
-    return response
+    status_cache.invalidate(customer_id)
+
+    return {"customer_id": customer_id, "status": status}
+
+
+# -----------------------------
+# CUSTOMER STATUS (CRITICAL FOR OTHER SERVICES)
+# -----------------------------
+@app.get("/customers/{customer_id}/status")
+def get_customer_status(customer_id: int, request: Request):
+    entry = status_cache.get(customer_id)
+
+    if entry is None:
+        generation = status_cache.generation()
+        db = SessionLocal()
+        customer = db.query(Customer).filter(
+            Customer.customer_id == customer_id
+        ).first()
+
+        if not customer:
+            db.close()
+            raise HTTPException(status_code=404, detail="Customer not found")
+
+        response = {
+            "customer_id": customer.customer_id,
+            "kyc_status": customer.kyc_status,
+            "status": customer.status,
+            "branch_id": customer.branch_id,
+            "risk_level": customer.risk_level
+        }
+
+        db.close()
+        entry = status_cache.put(customer_id, response, generation)
+
+    headers = {"ETag": entry.etag, "Cache-Control": STATUS_CACHE_CONTROL}
 
+    # ✅ caller's copy is current: no body at all
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
 
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 
 class CustomerCreate(BaseModel):
     customer_id: int
@@ -45,3 +45,27 @@ class CustomerResponse(BaseModel):
     class Config:
         orm_mode = True
 
+
+class CustomerStatusUpdate(BaseModel):
+    status: str
+
+
+class CustomerSearchResult(BaseModel):
+    customer_id: int
+    full_name: str
+    mobile: str
+    email: str
+    pan: str
+    branch_id: int
+    status: str
+    kyc_status: str
+
+    class Config:
+        orm_mode = True
+
+
+class CustomerSearchResponse(BaseModel):
+    query: str
+    field: str
+    count: int
+    results: List[CustomerSearchResult]
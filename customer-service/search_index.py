@@ -0,0 +1,618 @@
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models import Customer
+
+logger = logging.getLogger("customer-service.search_index")
+
+# Exact-prefix fields; names go through the trigram index instead
+PREFIX_FIELDS = ("mobile", "pan", "email")
+SEARCH_FIELDS = ("name",) + PREFIX_FIELDS
+
+# Shortest name token that can be searched (" ab" is the first trigram)
+MIN_NAME_TOKEN = 2
+
+# Customers created this long before a snapshot are re-read on load, to
+# cover rows committed while the snapshot was being written
+CATCH_UP_MARGIN = timedelta(minutes=5)
+
+PAN_PATTERN = re.compile(r"^[A-Za-z]{1,5}[0-9]{0,4}[A-Za-z]?$")
+
+
+class SearchIndexError(Exception):
+    pass
+
+
+def normalise_name(value):
+    return " ".join((value or "").lower().split())
+
+
+def normalise_mobile(value):
+    return re.sub(r"\D", "", value or "")
+
+
+def normalise_pan(value):
+    return (value or "").strip().upper()
+
+
+def normalise_email(value):
+    return (value or "").strip().lower()
+
+
+NORMALISERS = {
+    "name": normalise_name,
+    "mobile": normalise_mobile,
+    "pan": normalise_pan,
+    "email": normalise_email
+}
+
+
+def guess_field(query):
+    """Which field a free-text query most likely targets."""
+    q = query.strip()
+    if "@" in q:
+        return "email"
+    if normalise_mobile(q) and not re.search(r"[A-Za-z]", q):
+        return "mobile"
+    if PAN_PATTERN.match(q) and re.search(r"[0-9]", q):
+        return "pan"
+    return "name"
+
+
+def name_trigrams(name):
+    """Trigram codes of every word of `name`, each padded with a leading space."""
+    codes = set()
+    for token in name.split():
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            codes.add(zlib.crc32(padded[i:i + 3].encode()))
+    return codes
+
+
+def query_trigrams(tokens):
+    """Codes a name must contain for every token to be a word prefix in it."""
+    codes = set()
+    for token in tokens:
+        padded = f" {token}"
+        for i in range(len(padded) - 2):
+            codes.add(zlib.crc32(padded[i:i + 3].encode()))
+    return codes
+
+
+def _record(customer_id, full_name, mobile, pan, email):
+    return {
+        "customer_id": int(customer_id),
+        "name": normalise_name(full_name),
+        "mobile": normalise_mobile(mobile),
+        "pan": normalise_pan(pan),
+        "email": normalise_email(email)
+    }
+
+
+# -------------------------------
+# IMMUTABLE, NUMPY-BACKED SEGMENT
+# -------------------------------
+class _Segment:
+    """Sorted key arrays per prefix field plus CSR trigram postings.
+
+    Prefix lookups are two searchsorted calls on a sorted byte-string
+    array. Name postings are one id array sliced by trigram offsets, and
+    the normalised name of every id is kept so candidates can be checked
+    and ranked without reading the DB.
+    """
+
+    def __init__(self, fields, tri_codes, tri_offsets, tri_ids, name_ids, names, built_at):
+        self.fields = fields            # field -> (sorted keys, ids)
+        self.tri_codes = tri_codes      # sorted unique trigram codes
+        self.tri_offsets = tri_offsets  # postings of tri_codes[i] are tri_ids[off[i]:off[i+1]]
+        self.tri_ids = tri_ids
+        self.name_ids = name_ids        # sorted unique ids
+        self.names = names              # normalised name of name_ids[i]
+        self.built_at = built_at
+
+    @classmethod
+    def empty(cls):
+        fields = {f: (np.array([], dtype="S1"), np.array([], dtype=np.int64)) for f in PREFIX_FIELDS}
+        return cls(
+            fields,
+            np.array([], dtype=np.uint32),
+            np.zeros(1, dtype=np.int64),
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.int64),
+            np.array([], dtype="S1"),
+            None
+        )
+
+    @classmethod
+    def from_pairs(cls, field_pairs, tri_pairs, name_pairs, built_at):
+        """Build from unsorted (keys, ids) per field, (codes, ids) trigram
+        pairs and (ids, names); a later name for an id replaces an earlier one."""
+        fields = {}
+        for field in PREFIX_FIELDS:
+            keys, ids = field_pairs[field]
+            order = np.lexsort((ids, keys))
+            keys, ids = keys[order], ids[order]
+            if len(keys):
+                keep = np.ones(len(keys), dtype=bool)
+                keep[1:] = (keys[1:] != keys[:-1]) | (ids[1:] != ids[:-1])
+                keys, ids = keys[keep], ids[keep]
+            fields[field] = (keys, ids)
+
+        codes, ids = tri_pairs
+        if len(codes):
+            pairs = np.unique(np.column_stack([codes.astype(np.int64), ids]), axis=0)
+            codes, ids = pairs[:, 0].astype(np.uint32), pairs[:, 1]
+        tri_codes, starts = np.unique(codes, return_index=True)
+        tri_offsets = np.append(starts, len(ids)).astype(np.int64)
+
+        name_ids, names = name_pairs
+        name_ids, last = np.unique(name_ids[::-1], return_index=True)
+        names = names[::-1][last]
+
+        return cls(fields, tri_codes, tri_offsets, ids.astype(np.int64), name_ids, names, built_at)
+
+    def pairs(self):
+        field_pairs = {f: self.fields[f] for f in PREFIX_FIELDS}
+        codes = np.repeat(self.tri_codes, np.diff(self.tri_offsets))
+        return field_pairs, (codes, self.tri_ids), (self.name_ids, self.names)
+
+    def size(self):
+        return len(self.fields["mobile"][1])
+
+    def prefix(self, field, prefix):
+        """(keys, ids) of every entry whose key starts with `prefix`."""
+        keys, ids = self.fields[field]
+        key = prefix.encode()
+        lo = np.searchsorted(keys, key, side="left")
+        hi = np.searchsorted(keys, key + b"\xff", side="left")
+        return keys[lo:hi], ids[lo:hi]
+
+    def names_of(self, ids):
+        """Indexed names of `ids` (empty where an id has none)."""
+        if not len(self.name_ids):
+            return np.zeros(len(ids), dtype="S1")
+        i = np.minimum(np.searchsorted(self.name_ids, ids), len(self.name_ids) - 1)
+        return np.where(self.name_ids[i] == ids, self.names[i], b"")
+
+    def postings(self, code):
+        i = np.searchsorted(self.tri_codes, code)
+        if i == len(self.tri_codes) or self.tri_codes[i] != code:
+            return np.array([], dtype=np.int64)
+        return self.tri_ids[self.tri_offsets[i]:self.tri_offsets[i + 1]]
+
+    def name_candidates(self, codes):
+        postings = sorted((self.postings(code) for code in codes), key=len)
+        result = postings[0]
+        for other in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def save(self, path):
+        arrays = {
+            "tri_codes": self.tri_codes,
+            "tri_offsets": self.tri_offsets,
+            "tri_ids": self.tri_ids,
+            "name_ids": self.name_ids,
+            "names": self.names
+        }
+        for field, (keys, ids) in self.fields.items():
+            arrays[f"{field}_keys"] = keys
+            arrays[f"{field}_ids"] = ids
+        arrays["built_at"] = np.array(self.built_at.isoformat())
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fields = {f: (data[f"{f}_keys"], data[f"{f}_ids"]) for f in PREFIX_FIELDS}
+            return cls(
+                fields,
+                data["tri_codes"],
+                data["tri_offsets"],
+                data["tri_ids"],
+                data["name_ids"],
+                data["names"],
+                datetime.fromisoformat(str(data["built_at"]))
+            )
+
+
+# -------------------------------
+# MUTABLE DELTA (SINCE LAST COMPACTION)
+# -------------------------------
+class _Delta:
+    def __init__(self):
+        self.fields = {f: [] for f in PREFIX_FIELDS}   # sorted (key, id)
+        self.trigrams = {}
+        self.names = {}                                # id -> normalised name
+        self.count = 0
+
+    def add(self, record):
+        customer_id = record["customer_id"]
+        for field in PREFIX_FIELDS:
+            if record[field]:
+                insort(self.fields[field], (record[field].encode(), customer_id))
+        for code in name_trigrams(record["name"]):
+            self.trigrams.setdefault(code, set()).add(customer_id)
+        self.names[customer_id] = record["name"].encode()
+        self.count += 1
+
+    def prefix(self, field, prefix):
+        entries = self.fields[field]
+        key = prefix.encode()
+        found = []
+        for i in range(bisect_left(entries, (key,)), len(entries)):
+            if not entries[i][0].startswith(key):
+                break
+            found.append(entries[i])
+        return found
+
+    def name_candidates(self, codes):
+        sets = [self.trigrams.get(code, set()) for code in codes]
+        return set.intersection(*sets) if sets else set()
+
+    def pairs(self):
+        field_pairs = {}
+        for field in PREFIX_FIELDS:
+            entries = self.fields[field]
+            field_pairs[field] = (
+                np.array([k for k, _ in entries], dtype="S") if entries else np.array([], dtype="S1"),
+                np.array([i for _, i in entries], dtype=np.int64)
+            )
+        codes = [code for code, ids in self.trigrams.items() for _ in ids]
+        ids = [i for ids in self.trigrams.values() for i in ids]
+        return (
+            field_pairs,
+            (np.array(codes, dtype=np.uint32), np.array(ids, dtype=np.int64)),
+            _name_arrays(list(self.names.items()))
+        )
+
+
+def _name_arrays(pairs):
+    return (
+        np.array([i for i, _ in pairs], dtype=np.int64),
+        np.array([n for _, n in pairs], dtype="S") if pairs else np.array([], dtype="S1")
+    )
+
+
+def _records_to_pairs(records):
+    """Unsorted index pairs for a chunk of records (bulk build path)."""
+    field_pairs = {}
+    for field in PREFIX_FIELDS:
+        kept = [(r[field].encode(), r["customer_id"]) for r in records if r[field]]
+        field_pairs[field] = (
+            np.array([k for k, _ in kept], dtype="S") if kept else np.array([], dtype="S1"),
+            np.array([i for _, i in kept], dtype=np.int64)
+        )
+
+    codes, ids = [], []
+    for r in records:
+        name_codes = name_trigrams(r["name"])
+        codes.extend(name_codes)
+        ids.extend([r["customer_id"]] * len(name_codes))
+    return (
+        field_pairs,
+        (np.array(codes, dtype=np.uint32), np.array(ids, dtype=np.int64)),
+        _name_arrays([(r["customer_id"], r["name"].encode()) for r in records])
+    )
+
+
+def _first_of_runs(values):
+    """Mask of the first element of each run of equal values in a sorted array."""
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return keep
+
+
+def _concat_bytes(arrays):
+    width = max([a.dtype.itemsize for a in arrays] + [1])
+    return np.concatenate([a.astype(f"S{width}") for a in arrays])
+
+
+def _merge_pairs(parts):
+    field_pairs = {}
+    for field in PREFIX_FIELDS:
+        field_pairs[field] = (
+            _concat_bytes([p[0][field][0] for p in parts]),
+            np.concatenate([p[0][field][1] for p in parts])
+        )
+    codes = np.concatenate([p[1][0] for p in parts])
+    ids = np.concatenate([p[1][1] for p in parts])
+    name_ids = np.concatenate([p[2][0] for p in parts])
+    names = _concat_bytes([p[2][1] for p in parts])
+    return field_pairs, (codes, ids), (name_ids, names)
+
+
+# -------------------------------
+# SEARCH INDEX
+# -------------------------------
+class CustomerSearchIndex:
+    """In-memory name/mobile/PAN/email search over all customers.
+
+    A compacted, immutable numpy segment holds the bulk of the index and is
+    persisted as a snapshot; customers added since live in a small delta
+    that is folded in by `compact`. On start the snapshot is loaded and only
+    customers created since it was taken are read from the DB. The index
+    only proposes candidates. All of them are checked and ranked in memory
+    on the indexed values; the best `limit * verify_factor` are then
+    re-checked against the DB rows (more if too few survive), so stale
+    entries left by updates never surface and a good match is never dropped
+    for having a high customer_id.
+    """
+
+    def __init__(self, session_factory, snapshot_path, chunk_size=50000,
+                 snapshot_interval=900, verify_factor=4):
+        self.session_factory = session_factory
+        self.snapshot_path = snapshot_path
+        self.chunk_size = chunk_size
+        self.snapshot_interval = snapshot_interval
+        self.verify_factor = verify_factor
+
+        self.ready = False
+        self._base = _Segment.empty()
+        self._frozen = None
+        self._delta = _Delta()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # -------------------------------
+    # LIFECYCLE
+    # -------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="customer-search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Customer search index load failed")
+            return
+
+        while not self._stopping.wait(self.snapshot_interval):
+            try:
+                if self.pending():
+                    self.compact()
+                    self.save_snapshot()
+            except Exception:
+                logger.exception("Customer search index snapshot failed")
+
+    def load(self):
+        started = time.monotonic()
+        base = None
+
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                base = _Segment.load(self.snapshot_path)
+            except Exception:
+                logger.exception("Ignoring unreadable search snapshot %s", self.snapshot_path)
+
+        if base is not None:
+            # only customers created since the snapshot are read
+            self._base = base
+            caught_up = 0
+            for record in self._records(base.built_at - CATCH_UP_MARGIN):
+                with self._lock:
+                    self._delta.add(record)
+                caught_up += 1
+            source = f"snapshot + {caught_up} new"
+        else:
+            built_at = datetime.utcnow()
+            parts = []
+            chunk = []
+            for record in self._records(None):
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    parts.append(_records_to_pairs(chunk))
+                    chunk = []
+            parts.append(_records_to_pairs(chunk))
+
+            self._base = _Segment.from_pairs(*_merge_pairs(parts), built_at)
+            source = "full scan"
+
+        self.ready = True
+        logger.info(
+            "Customer search index ready: %s customers in %.1fs (%s)",
+            self._base.size(), time.monotonic() - started, source
+        )
+
+        if base is None:
+            self.save_snapshot()
+
+    def _records(self, since):
+        """Index records for customers created at or after `since` (all if None)."""
+        db = self.session_factory()
+        try:
+            query = db.query(
+                Customer.customer_id,
+                Customer.full_name,
+                Customer.mobile,
+                Customer.pan,
+                Customer.email
+            )
+            if since is not None:
+                query = query.filter(Customer.created_at >= since)
+
+            for row in query.yield_per(self.chunk_size):
+                yield _record(*row)
+        finally:
+            db.close()
+
+    # -------------------------------
+    # MAINTENANCE
+    # -------------------------------
+    def add(self, customer):
+        """Index a created or updated customer."""
+        record = _record(customer.customer_id, customer.full_name, customer.mobile, customer.pan, customer.email)
+        with self._lock:
+            self._delta.add(record)
+
+    def pending(self):
+        return self._delta.count + (self._frozen.count if self._frozen else 0)
+
+    def compact(self):
+        """Fold the delta into a new base segment without blocking searches."""
+        with self._compact_lock:
+            with self._lock:
+                frozen, self._delta = self._delta, _Delta()
+                self._frozen = frozen
+                base = self._base
+
+            built_at = datetime.utcnow()
+            merged = _Segment.from_pairs(*_merge_pairs([base.pairs(), frozen.pairs()]), built_at)
+
+            with self._lock:
+                self._base = merged
+                self._frozen = None
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        base = self._base
+        base.save(self.snapshot_path)
+        logger.info("Customer search snapshot written: %s customers", base.size())
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "indexed": self._base.size(),
+            "pending": self.pending(),
+            "built_at": self._base.built_at
+        }
+
+    # -------------------------------
+    # SEARCH
+    # -------------------------------
+    def candidates(self, field, query):
+        """Candidate ids and their indexed values; the caller checks and ranks them."""
+        with self._lock:
+            base, frozen, delta = self._base, self._frozen, self._delta
+
+            if field == "name":
+                codes = query_trigrams(query.split())
+                found = set(delta.name_candidates(codes))
+                if frozen:
+                    found |= frozen.name_candidates(codes)
+                # names changed since the base was built
+                overrides = dict(frozen.names) if frozen else {}
+                overrides.update(delta.names)
+            else:
+                entries = delta.prefix(field, query)
+                if frozen:
+                    entries += frozen.prefix(field, query)
+
+        if field == "name":
+            ids = base.name_candidates(codes)
+            if found:
+                ids = np.sort(np.concatenate([ids, np.fromiter(found, dtype=np.int64, count=len(found))]))
+                ids = ids[_first_of_runs(ids)]
+            values = base.names_of(ids)
+            if overrides and len(ids):
+                changed = np.array(list(overrides), dtype=np.int64)
+                at = np.minimum(np.searchsorted(ids, changed), len(ids) - 1)
+                hit = ids[at] == changed
+                names = np.array(list(overrides.values()), dtype="S")[hit]
+                width = max(values.dtype.itemsize, names.dtype.itemsize)
+                values = values.astype(f"S{width}")
+                values[at[hit]] = names
+            return ids, values
+
+        keys, ids = base.prefix(field, query)
+        if entries:
+            keys = _concat_bytes([keys, np.array([k for k, _ in entries], dtype="S")])
+            ids = np.concatenate([ids, np.array([i for _, i in entries], dtype=np.int64)])
+        return ids, keys
+
+    def rank(self, field, query, ids, values):
+        """Candidate ids that match on their indexed value, best first."""
+        if not len(ids):
+            return ids
+        q = query.encode()
+        if field == "name":
+            spaced = np.char.add(b" ", values)
+            keep = np.ones(len(ids), dtype=bool)
+            for token in query.split():
+                keep &= np.char.find(spaced, f" {token}".encode()) >= 0
+            ids, values = ids[keep], values[keep]
+
+        # (rank, length, id) packed into one int64 so a plain sort orders them
+        rank = np.where(values == q, 0, np.where(np.char.startswith(values, q), 1, 2)).astype(np.int64)
+        length = np.minimum(np.char.str_len(values), 0xFFFF).astype(np.int64)
+        ranked = np.sort((rank << 48) | (length << 32) | ids) & 0xFFFFFFFF
+        if field != "name":
+            # an id indexed under several values keeps its best one
+            order = np.argsort(ranked, kind="stable")
+            ranked = ranked[np.sort(order[_first_of_runs(ranked[order])])]
+        return ranked
+
+    def search(self, db, query, field=None, limit=20):
+        if not self.ready:
+            raise SearchIndexError("Search index is still loading")
+
+        field = field or guess_field(query)
+        if field not in SEARCH_FIELDS:
+            raise SearchIndexError(f"field must be one of {', '.join(SEARCH_FIELDS)}")
+
+        q = NORMALISERS[field](query)
+        if not q:
+            raise SearchIndexError("Empty search query")
+        if field == "name" and min(len(t) for t in q.split()) < MIN_NAME_TOKEN:
+            raise SearchIndexError(f"Name search needs at least {MIN_NAME_TOKEN} characters per word")
+
+        ranked = self.rank(field, q, *self.candidates(field, q)).tolist()
+
+        # re-check the best candidates against the DB on the one column
+        # searched, widening the window until `limit` of them hold up
+        column = Customer.full_name if field == "name" else getattr(Customer, field)
+        tokens = q.split()
+        window = limit * self.verify_factor
+        matches = []
+        for start in range(0, len(ranked), window):
+            batch = ranked[start:start + window]
+            rows = db.query(Customer.customer_id, column).filter(Customer.customer_id.in_(batch))
+            for customer_id, raw in rows:
+                value = NORMALISERS[field](raw)
+                if field == "name":
+                    words = value.split()
+                    if not all(any(w.startswith(t) for w in words) for t in tokens):
+                        continue
+                    rank = 0 if value == q else 1 if value.startswith(q) else 2
+                else:
+                    if not value.startswith(q):
+                        continue
+                    rank = 0 if value == q else 1
+                matches.append((rank, len(value), customer_id))
+            if len(matches) >= limit:
+                break
+
+        top = heapq.nsmallest(limit, matches)
+        if not top:
+            return field, []
+
+        customers = {
+            c.customer_id: c
+            for c in db.query(Customer).filter(Customer.customer_id.in_([m[2] for m in top]))
+        }
+        return field, [customers[m[2]] for m in top if m[2] in customers]
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class StatusEntry:
+    __slots__ = ("body", "etag", "loaded_at")
+
+    def __init__(self, body, etag, loaded_at):
+        self.body = body
+        self.etag = etag
+        self.loaded_at = loaded_at
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match requires
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
+
+
+class StatusCache:
+    """customer_id -> serialised status body and its ETag.
+
+    The body is serialised once and the ETag is a hash of it, so a
+    revalidation with a matching If-None-Match costs a dict lookup. Entries
+    are dropped by `invalidate` when KYC or status changes here, and expire
+    after `ttl` seconds to bound staleness from writes made elsewhere.
+    """
+
+    def __init__(self, ttl=60, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidations = 0
+
+    def get(self, customer_id):
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded_at >= self.ttl:
+                del self._entries[customer_id]
+                return None
+            self._entries.move_to_end(customer_id)
+            return entry
+
+    def generation(self):
+        """Token to take before reading the DB; pass it back to `put`."""
+        return self._invalidations
+
+    def put(self, customer_id, payload, generation=None):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        entry = StatusEntry(body, etag, time.monotonic())
+
+        with self._lock:
+            # an invalidation since the DB read may mean the payload is stale
+            if generation is not None and generation != self._invalidations:
+                return entry
+            self._entries[customer_id] = entry
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, customer_id):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(customer_id, None)
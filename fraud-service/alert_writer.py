@@ -0,0 +1,242 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import FraudAlert, AlertIdSequence
+
+logger = logging.getLogger("fraud-service.alert_writer")
+
+SEQUENCE_NAME = "fraud_alerts"
+
+
+class AlertWriteError(Exception):
+    pass
+
+
+# -------------------------------
+# ALERT ID RANGES
+# -------------------------------
+class AlertIdAllocator:
+    """Hands out alert ids from blocks reserved in the fraud_id_sequence table,
+    so an alert has its id before it is ever written."""
+
+    def __init__(self, session_factory, block_size=1000):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._limit:
+                self._next, self._limit = self._reserve_block()
+            alert_id = self._next
+            self._next += 1
+            return alert_id
+
+    def _reserve_block(self):
+        for _ in range(3):
+            db = self.session_factory()
+            try:
+                seq = db.query(AlertIdSequence).filter(
+                    AlertIdSequence.name == SEQUENCE_NAME
+                ).with_for_update().first()
+
+                # never hand out ids already used by direct (non-buffered) inserts
+                max_id = db.query(func.max(FraudAlert.alert_id)).scalar() or 0
+
+                if seq is None:
+                    seq = AlertIdSequence(name=SEQUENCE_NAME, next_id=max_id + 1)
+                    db.add(seq)
+
+                start = max(seq.next_id, max_id + 1)
+                seq.next_id = start + self.block_size
+                db.commit()
+                return start, start + self.block_size
+            except IntegrityError:
+                # another instance created the sequence row first
+                db.rollback()
+            finally:
+                db.close()
+
+        raise AlertWriteError("Could not reserve alert id block")
+
+
+# -------------------------------
+# GROUP-COMMIT WRITE BUFFER
+# -------------------------------
+QUEUED = "QUEUED"
+TAKEN = "TAKEN"          # part of a flush that has started
+CANCELLED = "CANCELLED"  # given up by its submitter; never written
+
+
+class _PendingAlert:
+    __slots__ = ("row", "done", "error", "state")
+
+    def __init__(self, row, durable):
+        self.row = row
+        self.done = threading.Event() if durable else None
+        self.error = None
+        self.state = QUEUED
+
+
+class AlertWriteBuffer:
+    """Write-behind buffer for FraudAlert rows.
+
+    Alerts are queued and flushed by a single writer thread as one multi-row
+    INSERT every `flush_interval_ms` or `batch_size` rows, whichever comes
+    first. Durable submits block until the batch holding them is committed.
+
+    A durable submit that times out cancels its row if no flush has taken it
+    yet, so an error reported to the caller always means nothing was
+    written and a client retry cannot duplicate the alert. If a flush has
+    already taken the row, the submit waits for that flush's outcome.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        allocator,
+        batch_size=500,
+        flush_interval_ms=5,
+        max_queue=10000,
+        enqueue_timeout=2.0,
+        durable_timeout=5.0,
+        max_retries=2
+    ):
+        self.session_factory = session_factory
+        self.allocator = allocator
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout
+        self.durable_timeout = durable_timeout
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._state_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="fraud-alert-writer",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread after draining everything still queued."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, row, durable=False):
+        """Queue an alert row and return it with its pre-allocated alert_id.
+
+        With `durable=True` this only returns once the row is committed.
+        """
+        row = dict(
+            row,
+            alert_id=self.allocator.next_id(),
+            resolution_status="Pending",
+            created_at=datetime.utcnow()
+        )
+        pending = _PendingAlert(row, durable)
+
+        try:
+            self._queue.put(pending, timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise AlertWriteError("Alert write queue is full")
+
+        if durable:
+            if not pending.done.wait(self.durable_timeout):
+                with self._state_lock:
+                    if pending.state == QUEUED:
+                        pending.state = CANCELLED
+                if pending.state == CANCELLED:
+                    raise AlertWriteError("Timed out waiting for alert flush")
+                # a flush already holds the row; only its outcome is certain
+                pending.done.wait()
+            if pending.error is not None:
+                raise AlertWriteError("Alert flush failed") from pending.error
+
+        return row
+
+    def backlog(self):
+        return self._queue.qsize()
+
+    # -------------------------------
+    # WRITER THREAD
+    # -------------------------------
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _flush(self, batch):
+        with self._state_lock:
+            batch = [p for p in batch if p.state != CANCELLED]
+            for p in batch:
+                p.state = TAKEN
+        if not batch:
+            return
+
+        rows = [p.row for p in batch]
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            db = self.session_factory()
+            try:
+                db.execute(insert(FraudAlert).values(rows))
+                db.commit()
+                error = None
+                break
+            except SQLAlchemyError as exc:
+                db.rollback()
+                error = exc
+                time.sleep(0.01 * (2 ** attempt))
+            finally:
+                db.close()
+
+        if error is not None:
+            logger.error(
+                "Dropped %d fraud alerts (ids %d-%d) after flush failure: %s",
+                len(rows), rows[0]["alert_id"], rows[-1]["alert_id"], error
+            )
+
+        for p in batch:
+            p.error = error
+            if p.done is not None:
+                p.done.set()
@@ -0,0 +1,186 @@
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+# -------------------------------
+# FEATURES
+# -------------------------------
+# Only fields known both at /fraud/check time and on stored alerts.
+FEATURES = (
+    "log_amount",
+    "channel_upi",
+    "channel_card",
+    "channel_atm",
+    "branch_scaled",
+    "night_hours",
+)
+
+POSITIVE_FEEDBACK = {"CONFIRMED_FRAUD", "FRAUD", "TRUE_POSITIVE"}
+NEGATIVE_FEEDBACK = {"FALSE_POSITIVE", "GENUINE", "NOT_FRAUD", "LEGITIMATE"}
+
+BRANCH_SCALE = 145.0
+
+
+def feedback_label(feedback_type):
+    """1 for confirmed fraud, 0 for cleared alerts, None if not usable."""
+    if not feedback_type:
+        return None
+    key = feedback_type.strip().upper().replace(" ", "_")
+    if key in POSITIVE_FEEDBACK:
+        return 1
+    if key in NEGATIVE_FEEDBACK:
+        return 0
+    return None
+
+
+def extract_features(amount, channel, branch_id, hour):
+    return (
+        math.log1p(max(amount, 0.0)),
+        1.0 if channel == "UPI" else 0.0,
+        1.0 if channel == "CARD" else 0.0,
+        1.0 if channel == "ATM" else 0.0,
+        branch_id / BRANCH_SCALE,
+        1.0 if hour < 6 else 0.0,
+    )
+
+
+def feature_matrix(amounts, channels, branch_ids, hours):
+    """Vectorised extract_features over column arrays."""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    channels = np.asarray(channels, dtype=object)
+    branch_ids = np.asarray(branch_ids, dtype=np.float64)
+    hours = np.asarray(hours, dtype=np.int64)
+
+    return np.column_stack([
+        np.log1p(np.maximum(amounts, 0.0)),
+        (channels == "UPI").astype(np.float64),
+        (channels == "CARD").astype(np.float64),
+        (channels == "ATM").astype(np.float64),
+        branch_ids / BRANCH_SCALE,
+        (hours < 6).astype(np.float64),
+    ])
+
+
+# -------------------------------
+# TRAINING (OFFLINE)
+# -------------------------------
+def train_logistic(X, y, l2=0.01, learning_rate=0.5, iterations=2000):
+    """Fit a class-weighted, L2-regularised logistic regression.
+
+    Features are standardised for training and the scaling is folded back
+    into the weights, so scoring needs only one dot product.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - mean) / scale
+
+    positives = y.sum()
+    negatives = len(y) - positives
+    if positives == 0 or negatives == 0:
+        raise ValueError("Training data needs both fraud and non-fraud feedback")
+
+    # balance the rare fraud class against cleared alerts
+    sample_weight = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives))
+
+    w = np.zeros(Z.shape[1])
+    b = 0.0
+    n = len(y)
+
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(Z @ w + b)))
+        err = (p - y) * sample_weight
+        w -= learning_rate * (Z.T @ err / n + l2 * w)
+        b -= learning_rate * err.sum() / n
+
+    weights = w / scale
+    bias = b - float(np.dot(w, mean / scale))
+    return weights, bias
+
+
+def save_model(path, weights, bias, meta):
+    np.savez_compressed(
+        path,
+        weights=np.asarray(weights, dtype=np.float64),
+        bias=np.float64(bias),
+        features=np.array(FEATURES),
+        meta=np.array(json.dumps(meta))
+    )
+
+
+# -------------------------------
+# IN-PROCESS EVALUATOR
+# -------------------------------
+class FraudModel:
+    """Scores transactions with a trained logistic model.
+
+    Single checks use plain floats (a numpy call per row costs more than the
+    whole dot product); `score_batch` is the vectorised path for many rows.
+    """
+
+    def __init__(self, weights, bias, meta=None, budget_us=50):
+        self.weights_array = np.asarray(weights, dtype=np.float64)
+        self.weights = tuple(float(w) for w in self.weights_array)
+        self.bias = float(bias)
+        self.meta = meta or {}
+        self.budget_ns = int(budget_us * 1000)
+
+        self._lock = threading.Lock()
+        self._scored = 0
+        self._total_ns = 0
+        self._max_ns = 0
+        self._over_budget = 0
+
+    @classmethod
+    def load(cls, path, budget_us=50):
+        with np.load(path, allow_pickle=False) as artifact:
+            features = tuple(str(f) for f in artifact["features"])
+            if features != FEATURES:
+                raise ValueError(f"Model features {features} do not match {FEATURES}")
+            return cls(
+                artifact["weights"],
+                float(artifact["bias"]),
+                meta=json.loads(str(artifact["meta"])),
+                budget_us=budget_us
+            )
+
+    def score(self, amount, channel, branch_id, hour):
+        start = time.perf_counter_ns()
+
+        z = self.bias
+        for w, x in zip(self.weights, extract_features(amount, channel, branch_id, hour)):
+            z += w * x
+        # clamp to keep math.exp in range for extreme inputs
+        z = max(min(z, 35.0), -35.0)
+        probability = 1.0 / (1.0 + math.exp(-z))
+
+        elapsed = time.perf_counter_ns() - start
+        with self._lock:
+            self._scored += 1
+            self._total_ns += elapsed
+            if elapsed > self._max_ns:
+                self._max_ns = elapsed
+            if elapsed > self.budget_ns:
+                self._over_budget += 1
+
+        return probability
+
+    def score_batch(self, X):
+        z = np.clip(np.asarray(X, dtype=np.float64) @ self.weights_array + self.bias, -35.0, 35.0)
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "scored": self._scored,
+                "avg_us": round(self._total_ns / self._scored / 1000, 3) if self._scored else 0.0,
+                "max_us": round(self._max_ns / 1000, 3),
+                "budget_us": self.budget_ns / 1000,
+                "over_budget": self._over_budget
+            }
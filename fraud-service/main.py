@@ -2,12 +2,62 @@ from fastapi import FastAPI, HTTPException
 from database import SessionLocal, engine
 from models import Base, FraudAlert
 from schemas import FraudCheckRequest, FraudCheckResponse,FraudFeedbackRequest, FraudFeedbackResponse
+from schemas import (
+    FraudComplaintAttachRequest,
+    FraudResolveRequest,
+    FraudBulkComplaintAttachRequest,
+    FraudBulkFeedbackRequest,
+    FraudBulkResolveRequest,
+    FraudBulkUpdateResponse,
+    RuleSetDefinition
+)
+from alert_writer import AlertIdAllocator, AlertWriteBuffer, AlertWriteError
+from rule_engine import RuleEngine, RuleSet
+from fraud_model import FraudModel
+from migrations import migrate
+from sqlalchemy import bindparam, update
 from datetime import datetime
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger("fraud-service")
+
+# -------------------------------
+# FRAUD RULES (HOT-RELOADABLE)
+# -------------------------------
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rule_sets", "default.json")
+
+# -------------------------------
+# STATISTICAL MODEL (TRAINED OFFLINE BY train_model.py)
+# -------------------------------
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_artifacts", "fraud_model.npz")
+MODEL_BUDGET_US = 50
+# Off: model score is reported and stored only. On: a high score can flag.
+MODEL_ENFORCE = False
+MODEL_FLAG_THRESHOLD = 0.9
+# What np.load / FraudModel.load raise for a corrupt or mismatched artifact
+MODEL_LOAD_ERRORS = (KeyError, ValueError, OSError, EOFError, zipfile.BadZipFile)
+
+# -------------------------------
+# ALERT WRITE-BEHIND (GROUP COMMIT)
+# -------------------------------
+# When enabled, alerts are buffered and flushed as multi-row inserts.
+# Flagged alerts are still committed before /fraud/check returns.
+ALERT_WRITE_BEHIND = False
+ALERT_FLUSH_INTERVAL_MS = 5
+ALERT_FLUSH_BATCH_SIZE = 500
+ALERT_QUEUE_SIZE = 10000
+ALERT_ID_BLOCK_SIZE = 1000
+
+# Upper bound on ids accepted by one bulk update (single IN-list statement)
+MAX_BULK_ALERTS = 10000
 
 app = FastAPI(title="Fraud Detection Service")
 from fastapi.middleware.cors import CORSMiddleware
 
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +72,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+rule_engine = RuleEngine(RuleSet.from_file(RULES_PATH))
+
+# a bad artifact must not stop the service; it scores with rules only
+fraud_model = None
+if os.path.exists(MODEL_PATH):
+    try:
+        fraud_model = FraudModel.load(MODEL_PATH, budget_us=MODEL_BUDGET_US)
+    except MODEL_LOAD_ERRORS:
+        logger.exception("Ignoring unreadable model artifact %s", MODEL_PATH)
+
+alert_writer = None
+
+if ALERT_WRITE_BEHIND:
+    alert_writer = AlertWriteBuffer(
+        SessionLocal,
+        AlertIdAllocator(SessionLocal, block_size=ALERT_ID_BLOCK_SIZE),
+        batch_size=ALERT_FLUSH_BATCH_SIZE,
+        flush_interval_ms=ALERT_FLUSH_INTERVAL_MS,
+        max_queue=ALERT_QUEUE_SIZE
+    )
+
+
+@app.on_event("startup")
+def start_alert_writer():
+    if alert_writer is not None:
+        alert_writer.start()
+
+
+@app.on_event("shutdown")
+def stop_alert_writer():
+    if alert_writer is not None:
+        alert_writer.stop()
+
 @app.get("/health")
 def health_check():
     return {
@@ -32,97 +115,77 @@ def health_check():
 
 @app.post("/fraud/check", response_model=FraudCheckResponse)
 def fraud_check(data: FraudCheckRequest):
-    db = SessionLocal()
+    result = rule_engine.evaluate({
+        "amount": data.amount,
+        "channel": data.channel,
+        "branch_id": data.branch_id,
+        "account_id": data.account_id
+    })
 
-    risk_score = 10
-    fraud_flag = False
-    reason = "Normal transaction"
-    anomaly = "None"
-
-    # Rule 1: Very high amount irrespective of channel (critical risk)
-    if data.amount >= 1000000:
-        risk_score = max(risk_score, 98)
-        fraud_flag = True
-        reason = "Very high transaction amount"
-        anomaly = "VERY_HIGH_AMOUNT"
-
-    # Rule 2: High value UPI (UPI has strict RBI limits in real banks)
-    elif data.channel == "UPI" and data.amount > 100000:
-        risk_score = max(risk_score, 85)
-        fraud_flag = True
-        reason = "UPI transaction exceeding normal limits"
-        anomaly = "UPI_LIMIT_BREACH"
-
-    # Rule 3: Large CARD transaction (card fraud is statistically common)
-    elif data.channel == "CARD" and data.amount > 150000:
-        risk_score = max(risk_score, 75)
-        fraud_flag = True
-        reason = "High value card transaction"
-        anomaly = "CARD_HIGH_VALUE"
-
-    # Rule 4: ATM withdrawal beyond safe threshold
-    elif data.channel == "ATM" and data.amount > 50000:
-        risk_score = max(risk_score, 80)
-        fraud_flag = True
-        reason = "Unusually large ATM withdrawal"
-        anomaly = "ATM_HIGH_WITHDRAWAL"
-
-    # Rule 5: Medium-high amount from non-home / unusual branch
-    elif data.amount > 300000 and data.branch_id > 50:
-        risk_score = max(risk_score, 70)
-        fraud_flag = True
-        reason = "High value transaction from uncommon branch"
-        anomaly = "UNUSUAL_BRANCH_HIGH_VALUE"
-
-    # Rule 6: Moderate amount but risky digital channel
-    elif data.channel in ["UPI", "CARD"] and data.amount > 75000:
-        risk_score = max(risk_score, 60)
-        reason = "Moderately high digital transaction"
-        anomaly = "DIGITAL_CHANNEL_RISK"
-
-    # Rule 7: Cross-branch anomaly (large branch ID space = 145 branches)
-    elif data.amount > 200000 and data.branch_id > 100:
-        risk_score = max(risk_score, 65)
-        fraud_flag = True
-        reason = "Large transaction from far-mapped branch"
-        anomaly = "BRANCH_DISTANCE_RISK"
-
-    # Rule 8: ATM usage for non-typical high amount
-    elif data.channel == "ATM" and data.amount > 30000:
-        risk_score = max(risk_score, 55)
-        reason = "ATM usage approaching risky threshold"
-        anomaly = "ATM_BEHAVIOR_RISK"
-
-    # Rule 9: General high-value transaction monitoring
-    elif data.amount > 250000:
-        risk_score = max(risk_score, 72)
-        reason = "High value transaction under monitoring"
-        anomaly = "HIGH_VALUE_MONITOR"
-
-
-    risk_score = min(risk_score, 100)
-
-    alert = FraudAlert(
-        transaction_id=data.transaction_id,
-        branch_id=data.branch_id,
-        risk_score=risk_score,
-        fraud_flag=fraud_flag,
-        reason=reason,
-        anomaly=anomaly
-    )
+    risk_score = min(result.risk_score, 100)
+    fraud_flag = result.fraud_flag
+    reason = result.reason
+    anomaly = result.anomaly
 
-    db.add(alert)
-    db.commit()
-    db.refresh(alert)   # ✅ REQUIRED to get alert.id
+    model_score = None
+    model = fraud_model
+    if model is not None:
+        model_score = round(model.score(
+            data.amount,
+            data.channel,
+            data.branch_id,
+            datetime.utcnow().hour
+        ), 4)
+
+        if MODEL_ENFORCE and model_score >= MODEL_FLAG_THRESHOLD and not fraud_flag:
+            risk_score = max(risk_score, int(model_score * 100))
+            fraud_flag = True
+            reason = "Statistical model high fraud probability"
+            anomaly = "MODEL_HIGH_RISK"
+
+    alert_row = {
+        "transaction_id": data.transaction_id,
+        "branch_id": data.branch_id,
+        "amount": data.amount,
+        "channel": data.channel,
+        "risk_score": risk_score,
+        "model_score": model_score,
+        "fraud_flag": fraud_flag,
+        "reason": reason,
+        "anomaly": anomaly
+    }
+
+    if alert_writer is not None:
+        # 🔒 flagged alerts must be on disk before we answer
+        try:
+            saved = alert_writer.submit(alert_row, durable=fraud_flag)
+        except AlertWriteError:
+            raise HTTPException(status_code=503, detail="Fraud alert could not be recorded")
+
+        alert_id = saved["alert_id"]
+        resolution_status = saved["resolution_status"]
+    else:
+        db = SessionLocal()
+        try:
+            alert = FraudAlert(**alert_row)
+            db.add(alert)
+            db.commit()
+            db.refresh(alert)   # ✅ REQUIRED to get alert.id
+
+            alert_id = alert.alert_id
+            resolution_status = alert.resolution_status
+        finally:
+            db.close()
 
     return {
-    "alert_id": alert.alert_id,
+    "alert_id": alert_id,
     "transaction_id": data.transaction_id,
     "fraud_flag": fraud_flag,
     "risk_score": risk_score,
     "reason": reason,
     "anomaly": anomaly,
-    "resolution_status": alert.resolution_status
+    "resolution_status": resolution_status,
+    "model_score": model_score
 }
 
 @app.post("/fraud/attach-feedback")
@@ -152,3 +215,303 @@ def attach_feedback(data: FraudFeedbackRequest):
     }
 
 
+# -------------------------------
+# COMPLAINT LINKING (BY TRANSACTION)
+# -------------------------------
+@app.post("/fraud/attach-complaint")
+def attach_complaint(data: FraudComplaintAttachRequest):
+    db = SessionLocal()
+    try:
+        updated = db.query(FraudAlert).filter(
+            FraudAlert.transaction_id == data.transaction_id
+        ).update(
+            {
+                FraudAlert.feedback_id: data.complaint_id,
+                FraudAlert.feedback_type: data.feedback_type,
+                FraudAlert.feedback_date: datetime.utcnow().date()
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Fraud alert not found")
+
+    return {
+        "status": "complaint_attached",
+        "transaction_id": data.transaction_id,
+        "complaint_id": data.complaint_id,
+        "alerts_updated": updated
+    }
+
+
+@app.post("/fraud/resolve")
+def resolve_alerts(data: FraudResolveRequest):
+    db = SessionLocal()
+    try:
+        updated = db.query(FraudAlert).filter(
+            FraudAlert.transaction_id == data.transaction_id
+        ).update(
+            {
+                FraudAlert.resolution_status: data.resolution_status,
+                FraudAlert.resolution_date: datetime.utcnow().date()
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Fraud alert not found")
+
+    return {
+        "status": "resolved",
+        "transaction_id": data.transaction_id,
+        "resolution_status": data.resolution_status,
+        "alerts_updated": updated
+    }
+
+
+# -------------------------------
+# BULK ANALYST UPDATES (SET-BASED)
+# -------------------------------
+def _check_bulk_size(count: int):
+    if count == 0:
+        raise HTTPException(status_code=400, detail="No alerts given")
+    if count > MAX_BULK_ALERTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_ALERTS} alerts per request"
+        )
+
+
+@app.post("/fraud/bulk/attach-complaints", response_model=FraudBulkUpdateResponse)
+def bulk_attach_complaints(data: FraudBulkComplaintAttachRequest):
+    _check_bulk_size(len(data.items))
+
+    alerts = FraudAlert.__table__
+    stmt = (
+        update(alerts)
+        .where(alerts.c.transaction_id == bindparam("b_transaction_id"))
+        .values(
+            feedback_id=bindparam("b_complaint_id"),
+            feedback_type=bindparam("b_feedback_type"),
+            feedback_date=datetime.utcnow().date()
+        )
+    )
+
+    db = SessionLocal()
+    try:
+        # one executemany for the whole batch
+        result = db.execute(stmt, [
+            {
+                "b_transaction_id": item.transaction_id,
+                "b_complaint_id": item.complaint_id,
+                "b_feedback_type": item.feedback_type
+            }
+            for item in data.items
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "status": "complaints_attached",
+        "requested": len(data.items),
+        "updated": max(result.rowcount, 0)
+    }
+
+
+@app.post("/fraud/bulk/attach-feedback", response_model=FraudBulkUpdateResponse)
+def bulk_attach_feedback(data: FraudBulkFeedbackRequest):
+    alert_ids = set(data.alert_ids)
+    _check_bulk_size(len(alert_ids))
+
+    db = SessionLocal()
+    try:
+        updated = db.query(FraudAlert).filter(
+            FraudAlert.alert_id.in_(alert_ids)
+        ).update(
+            {
+                FraudAlert.feedback_type: data.feedback_type,
+                FraudAlert.feedback_date: data.feedback_date,
+                FraudAlert.resolution_status: "RESOLVED",
+                FraudAlert.resolution_date: datetime.utcnow().date()
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "status": "feedback_attached",
+        "requested": len(alert_ids),
+        "updated": updated
+    }
+
+
+@app.post("/fraud/bulk/resolve", response_model=FraudBulkUpdateResponse)
+def bulk_resolve(data: FraudBulkResolveRequest):
+    alert_ids = set(data.alert_ids)
+    transaction_ids = set(data.transaction_ids)
+    _check_bulk_size(len(alert_ids) + len(transaction_ids))
+
+    db = SessionLocal()
+    try:
+        query = db.query(FraudAlert)
+        if alert_ids and transaction_ids:
+            query = query.filter(
+                FraudAlert.alert_id.in_(alert_ids)
+                | FraudAlert.transaction_id.in_(transaction_ids)
+            )
+        elif alert_ids:
+            query = query.filter(FraudAlert.alert_id.in_(alert_ids))
+        else:
+            query = query.filter(FraudAlert.transaction_id.in_(transaction_ids))
+
+        updated = query.update(
+            {
+                FraudAlert.resolution_status: data.resolution_status,
+                FraudAlert.resolution_date: datetime.utcnow().date()
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "status": "resolved",
+        "requested": len(alert_ids) + len(transaction_ids),
+        "updated": updated
+    }
+
+
+# -------------------------------
+# RULE SET MANAGEMENT
+# -------------------------------
+def _build_rule_set(definition: dict):
+    try:
+        return RuleSet(definition)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule set: {e}")
+
+
+def _rule_set_summary(rule_set):
+    if rule_set is None:
+        return None
+    return {
+        "version": rule_set.version,
+        "rules": [r.name for r in rule_set.rules],
+        "loaded_at": datetime.utcfromtimestamp(rule_set.loaded_at)
+    }
+
+
+@app.get("/fraud/rules")
+def get_rules():
+    return {
+        "live": _rule_set_summary(rule_engine.live),
+        "shadow": _rule_set_summary(rule_engine.shadow),
+        "definition": rule_engine.live.definition
+    }
+
+
+@app.post("/fraud/rules/reload")
+def reload_rules():
+    try:
+        rule_set = RuleSet.from_file(RULES_PATH)
+    except OSError:
+        raise HTTPException(status_code=500, detail="Rule file not readable")
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule set: {e}")
+
+    previous = rule_engine.set_live(rule_set)
+    return {
+        "status": "reloaded",
+        "previous_version": previous.version,
+        "live_version": rule_set.version
+    }
+
+
+@app.post("/fraud/rules/live")
+def set_live_rules(data: RuleSetDefinition):
+    rule_set = _build_rule_set(data.dict())
+    previous = rule_engine.set_live(rule_set)
+    return {
+        "status": "live",
+        "previous_version": previous.version,
+        "live_version": rule_set.version
+    }
+
+
+@app.post("/fraud/rules/shadow")
+def set_shadow_rules(data: RuleSetDefinition):
+    rule_set = _build_rule_set(data.dict())
+    rule_engine.set_shadow(rule_set)
+    return {
+        "status": "shadowing",
+        "live_version": rule_engine.live.version,
+        "shadow_version": rule_set.version
+    }
+
+
+@app.delete("/fraud/rules/shadow")
+def clear_shadow_rules():
+    rule_engine.set_shadow(None)
+    return {"status": "shadow_cleared"}
+
+
+@app.post("/fraud/rules/shadow/promote")
+def promote_shadow_rules():
+    previous = rule_engine.promote_shadow()
+    if previous is None:
+        raise HTTPException(status_code=404, detail="No shadow rule set loaded")
+    return {
+        "status": "promoted",
+        "previous_version": previous.version,
+        "live_version": rule_engine.live.version
+    }
+
+
+@app.get("/fraud/rules/metrics")
+def get_rule_metrics():
+    return rule_engine.metrics()
+
+
+# -------------------------------
+# MODEL MANAGEMENT
+# -------------------------------
+@app.get("/fraud/model")
+def get_model():
+    model = fraud_model
+    if model is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "meta": model.meta,
+        "weights": list(model.weights),
+        "bias": model.bias,
+        "enforce": MODEL_ENFORCE,
+        "metrics": model.metrics()
+    }
+
+
+@app.post("/fraud/model/reload")
+def reload_model():
+    global fraud_model
+
+    if not os.path.exists(MODEL_PATH):
+        raise HTTPException(status_code=404, detail="Model artifact not found")
+
+    # a bad artifact keeps the model that is already serving
+    try:
+        model = FraudModel.load(MODEL_PATH, budget_us=MODEL_BUDGET_US)
+    except MODEL_LOAD_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid model artifact: {e}")
+
+    fraud_model = model
+    return {"status": "reloaded", "meta": model.meta}
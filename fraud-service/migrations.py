@@ -0,0 +1,34 @@
+from sqlalchemy import inspect, text
+
+# -------------------------------
+# SCHEMA MIGRATIONS
+# -------------------------------
+# create_all only creates missing tables. Columns and indexes added to a
+# table that already exists are listed here and applied at startup when
+# the database does not have them yet, so every step is safe to re-run.
+
+# (table, column, column definition)
+COLUMNS = [
+    ("fraud_alerts", "amount", "FLOAT NULL"),
+    ("fraud_alerts", "channel", "VARCHAR(20) NULL"),
+    ("fraud_alerts", "model_score", "FLOAT NULL"),
+]
+
+# (table, index name, indexed columns, unique)
+INDEXES = [
+    ("fraud_alerts", "ix_fraud_alerts_transaction_id", ("transaction_id",), False),
+    ("fraud_alerts", "ix_fraud_alerts_status_created", ("resolution_status", "created_at"), False),
+]
+
+
+def migrate(engine):
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, definition in COLUMNS:
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+        for table, name, columns, unique in INDEXES:
+            if name not in {i["name"] for i in inspector.get_indexes(table)}:
+                kind = "UNIQUE INDEX" if unique else "INDEX"
+                conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime
+from sqlalchemy import Column, Integer, String, Date, DateTime, BigInteger, Index, Float
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, date
 
@@ -6,11 +6,17 @@ Base = declarative_base()
 
 class FraudAlert(Base):
     __tablename__ = "fraud_alerts"
+    __table_args__ = (
+        Index("ix_fraud_alerts_status_created", "resolution_status", "created_at"),
+    )
 
     alert_id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(Integer, nullable=False)
+    transaction_id = Column(Integer, nullable=False, index=True)
     branch_id = Column(Integer, nullable=False)
+    amount = Column(Float)
+    channel = Column(String(20))
     risk_score = Column(Integer)
+    model_score = Column(Float)
     fraud_flag = Column(Integer)
     reason = Column(String(255))
     anomaly = Column(String(50))
@@ -20,3 +26,10 @@ class FraudAlert(Base):
     feedback_type = Column(String(50))
     feedback_date = Column(Date)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AlertIdSequence(Base):
+    __tablename__ = "fraud_id_sequence"
+
+    name = Column(String(50), primary_key=True)
+    next_id = Column(BigInteger, nullable=False)
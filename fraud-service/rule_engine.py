@@ -0,0 +1,263 @@
+import json
+import logging
+import operator
+import threading
+import time
+
+logger = logging.getLogger("fraud-service.rule_engine")
+
+RULE_FIELDS = ("amount", "channel", "branch_id", "account_id")
+
+# Operand types each field may be compared with
+FIELD_TYPES = {
+    "amount": (int, float),
+    "channel": (str,),
+    "branch_id": (int,),
+    "account_id": (int,),
+}
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda left, right: left in right,
+    "not_in": lambda left, right: left not in right,
+}
+
+
+class RuleResult:
+    __slots__ = ("risk_score", "fraud_flag", "reason", "anomaly", "rule")
+
+    def __init__(self, risk_score, fraud_flag, reason, anomaly, rule=None):
+        self.risk_score = risk_score
+        self.fraud_flag = fraud_flag
+        self.reason = reason
+        self.anomaly = anomaly
+        self.rule = rule
+
+
+class RuleStats:
+    __slots__ = ("evaluations", "hits", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.hits = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def as_dict(self):
+        return {
+            "evaluations": self.evaluations,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.evaluations, 6) if self.evaluations else 0.0,
+            "avg_us": round(self.total_ns / self.evaluations / 1000, 3) if self.evaluations else 0.0,
+            "max_us": round(self.max_ns / 1000, 3)
+        }
+
+
+def _check_operand(rule_name, field, value):
+    expected = FIELD_TYPES[field]
+    # bool is an int subclass but never a meaningful operand
+    if isinstance(value, bool) or not isinstance(value, expected):
+        names = " or ".join(t.__name__ for t in expected)
+        raise ValueError(f"Rule {rule_name}: value {value!r} for '{field}' must be {names}")
+
+
+# -------------------------------
+# COMPILED RULES
+# -------------------------------
+class Rule:
+    __slots__ = ("name", "result", "predicates")
+
+    def __init__(self, definition):
+        self.name = definition["name"]
+        self.result = RuleResult(
+            risk_score=int(definition["risk_score"]),
+            fraud_flag=bool(definition.get("fraud_flag", False)),
+            reason=definition["reason"],
+            anomaly=definition["anomaly"],
+            rule=self.name
+        )
+
+        predicates = []
+        for condition in definition.get("conditions", []):
+            field = condition["field"]
+            op = condition["op"]
+            value = condition["value"]
+
+            if field not in RULE_FIELDS:
+                raise ValueError(f"Rule {self.name}: unknown field '{field}'")
+            if op not in OPERATORS:
+                raise ValueError(f"Rule {self.name}: unknown operator '{op}'")
+            if op in ("in", "not_in"):
+                if not isinstance(value, (list, tuple)):
+                    raise ValueError(f"Rule {self.name}: '{op}' on '{field}' needs a list of values")
+                for item in value:
+                    _check_operand(self.name, field, item)
+                value = frozenset(value)
+            else:
+                _check_operand(self.name, field, value)
+
+            predicates.append((field, OPERATORS[op], value))
+
+        if not predicates:
+            raise ValueError(f"Rule {self.name}: at least one condition is required")
+
+        self.predicates = tuple(predicates)
+
+    def matches(self, values):
+        for field, fn, value in self.predicates:
+            if not fn(values[field], value):
+                return False
+        return True
+
+
+class RuleSet:
+    """An immutable, versioned, first-match rule list with its own metrics.
+
+    Rules are tried in order and the first hit decides the result, the same
+    as the original if/elif chain in fraud_check.
+    """
+
+    def __init__(self, definition):
+        self.version = str(definition["version"])
+        self.definition = definition
+        self.rules = tuple(Rule(r) for r in definition["rules"])
+
+        names = [r.name for r in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Rule set {self.version}: duplicate rule names")
+
+        self.default = RuleResult(
+            risk_score=int(definition.get("default_risk_score", 10)),
+            fraud_flag=False,
+            reason=definition.get("default_reason", "Normal transaction"),
+            anomaly=definition.get("default_anomaly", "None")
+        )
+        self.loaded_at = time.time()
+
+        self._lock = threading.Lock()
+        self._stats = {r.name: RuleStats() for r in self.rules}
+        self._evaluations = 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def evaluate(self, values):
+        timings = []
+        result = self.default
+
+        for rule in self.rules:
+            start = time.perf_counter_ns()
+            hit = rule.matches(values)
+            timings.append((rule.name, time.perf_counter_ns() - start, hit))
+            if hit:
+                result = rule.result
+                break
+
+        with self._lock:
+            self._evaluations += 1
+            for name, elapsed, hit in timings:
+                stats = self._stats[name]
+                stats.evaluations += 1
+                stats.total_ns += elapsed
+                if elapsed > stats.max_ns:
+                    stats.max_ns = elapsed
+                if hit:
+                    stats.hits += 1
+
+        return result
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "evaluations": self._evaluations,
+                "rules": {name: s.as_dict() for name, s in self._stats.items()}
+            }
+
+
+# -------------------------------
+# LIVE / SHADOW ENGINE
+# -------------------------------
+class RuleEngine:
+    """Holds the live rule set and an optional shadow candidate.
+
+    Swapping is a single reference assignment, so in-flight requests finish
+    on the rule set they started with and nothing is dropped.
+    """
+
+    def __init__(self, live):
+        self.live = live
+        self.shadow = None
+        self._lock = threading.Lock()
+        self._shadow_compared = 0
+        self._shadow_disagreements = 0
+        self._shadow_errors = 0
+
+    def evaluate(self, values):
+        live = self.live
+        shadow = self.shadow
+
+        result = live.evaluate(values)
+
+        if shadow is not None:
+            # a broken candidate must never fail the live check
+            try:
+                candidate = shadow.evaluate(values)
+            except Exception:
+                candidate = None
+                with self._lock:
+                    self._shadow_errors += 1
+                    first = self._shadow_errors == 1
+                if first:
+                    logger.exception("Shadow rule set %s failed to evaluate", shadow.version)
+            disagree = (
+                candidate is None
+                or candidate.anomaly != result.anomaly
+                or candidate.fraud_flag != result.fraud_flag
+            )
+            with self._lock:
+                self._shadow_compared += 1
+                if disagree:
+                    self._shadow_disagreements += 1
+
+        return result
+
+    def set_live(self, rule_set):
+        previous = self.live
+        self.live = rule_set
+        return previous
+
+    def set_shadow(self, rule_set):
+        with self._lock:
+            self._shadow_compared = 0
+            self._shadow_disagreements = 0
+            self._shadow_errors = 0
+        self.shadow = rule_set
+
+    def promote_shadow(self):
+        shadow = self.shadow
+        if shadow is None:
+            return None
+        self.set_shadow(None)
+        return self.set_live(shadow)
+
+    def metrics(self):
+        shadow = self.shadow
+        with self._lock:
+            comparison = {
+                "compared": self._shadow_compared,
+                "disagreements": self._shadow_disagreements,
+                "errors": self._shadow_errors
+            }
+        return {
+            "live": self.live.metrics(),
+            "shadow": shadow.metrics() if shadow is not None else None,
+            "shadow_comparison": comparison if shadow is not None else None
+        }
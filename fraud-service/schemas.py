@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Any
 from datetime import date, datetime
 
 class FraudCheckRequest(BaseModel):
@@ -18,6 +18,7 @@ class FraudCheckResponse(BaseModel):
     reason: str
     anomaly: str
     resolution_status: str
+    model_score: Optional[float] = None
 
 class FraudFeedbackRequest(BaseModel):
     alert_id: int
@@ -27,4 +28,51 @@ class FraudFeedbackRequest(BaseModel):
 class FraudFeedbackResponse(BaseModel):
     status: str
     alert_id: int
-    resolution_status: str
\ No newline at end of file
+    resolution_status: str
+
+class FraudComplaintAttachRequest(BaseModel):
+    transaction_id: int
+    complaint_id: int
+    feedback_type: str
+
+class FraudResolveRequest(BaseModel):
+    transaction_id: int
+    resolution_status: str = "RESOLVED"
+
+class FraudBulkComplaintAttachRequest(BaseModel):
+    items: List[FraudComplaintAttachRequest]
+
+class FraudBulkFeedbackRequest(BaseModel):
+    alert_ids: List[int]
+    feedback_type: str
+    feedback_date: str
+
+class FraudBulkResolveRequest(BaseModel):
+    alert_ids: List[int] = []
+    transaction_ids: List[int] = []
+    resolution_status: str = "RESOLVED"
+
+class FraudBulkUpdateResponse(BaseModel):
+    status: str
+    requested: int
+    updated: int
+
+class RuleCondition(BaseModel):
+    field: str
+    op: str
+    value: Any
+
+class RuleDefinition(BaseModel):
+    name: str
+    anomaly: str
+    reason: str
+    risk_score: int
+    fraud_flag: bool = False
+    conditions: List[RuleCondition]
+
+class RuleSetDefinition(BaseModel):
+    version: str
+    default_risk_score: int = 10
+    default_reason: str = "Normal transaction"
+    default_anomaly: str = "None"
+    rules: List[RuleDefinition]
@@ -0,0 +1,80 @@
+"""Offline trainer for the fraud scoring model.
+
+Reads alerts that carry analyst feedback, fits a logistic model and writes
+the artifact loaded by fraud-service:
+
+    python train_model.py --out model_artifacts/fraud_model.npz
+"""
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+
+from database import SessionLocal
+from models import FraudAlert
+from fraud_model import feature_matrix, feedback_label, save_model, train_logistic
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_artifacts", "fraud_model.npz")
+
+
+def load_training_data(batch_size=5000):
+    db = SessionLocal()
+    amounts, channels, branch_ids, hours, labels = [], [], [], [], []
+
+    try:
+        rows = (
+            db.query(
+                FraudAlert.amount,
+                FraudAlert.channel,
+                FraudAlert.branch_id,
+                FraudAlert.created_at,
+                FraudAlert.feedback_type
+            )
+            .filter(
+                FraudAlert.feedback_type.isnot(None),
+                FraudAlert.amount.isnot(None)
+            )
+            .yield_per(batch_size)
+        )
+
+        for amount, channel, branch_id, created_at, feedback_type in rows:
+            label = feedback_label(feedback_type)
+            if label is None:
+                continue
+            amounts.append(amount)
+            channels.append(channel or "")
+            branch_ids.append(branch_id)
+            hours.append(created_at.hour if created_at else 12)
+            labels.append(label)
+    finally:
+        db.close()
+
+    return feature_matrix(amounts, channels, branch_ids, hours), np.array(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the fraud scoring model")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--l2", type=float, default=0.01)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    X, y = load_training_data()
+    if len(y) == 0:
+        raise SystemExit("No alerts with usable feedback found")
+
+    weights, bias = train_logistic(X, y, l2=args.l2, iterations=args.iterations)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    save_model(args.out, weights, bias, {
+        "trained_at": datetime.utcnow().isoformat(),
+        "samples": int(len(y)),
+        "positives": int(y.sum())
+    })
+
+    print(f"Trained on {len(y)} alerts ({int(y.sum())} fraud), saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
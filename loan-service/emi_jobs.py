@@ -0,0 +1,223 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from models import EMIJob
+
+logger = logging.getLogger("loan-service.emi_jobs")
+
+COUNTERS = ("processed_emis", "paid", "overdue", "failed", "in_doubt", "chunks")
+RESUMABLE = ("QUEUED", "INTERRUPTED", "FAILED")
+
+
+class EMIJobManager:
+    """Runs EMIRunner as background jobs with a checkpoint per chunk.
+
+    The checkpoint is the last emi_id whose chunk has committed, so a resumed
+    job continues from there instead of re-scanning. A job is claimed with a
+    conditional UPDATE, so only one process can run it at a time; a RUNNING
+    job whose heartbeat is older than `stale_after` seconds counts as dead
+    and may be claimed again.
+    """
+
+    def __init__(self, session_factory, runner, stale_after=300):
+        self.session_factory = session_factory
+        self.runner = runner
+        self.stale_after = stale_after
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._stopping = threading.Event()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------
+    # PUBLIC API
+    # -------------------------------
+    def create(self, business_date):
+        db = self.session_factory()
+        try:
+            job = EMIJob(
+                job_id=uuid.uuid4().hex,
+                business_date=business_date,
+                status="QUEUED",
+                last_emi_id=0,
+                created_at=datetime.utcnow(),
+                **{name: 0 for name in COUNTERS}
+            )
+            db.add(job)
+            db.commit()
+            job_id = job.job_id
+        finally:
+            db.close()
+
+        self.launch(job_id)
+        return self.get(job_id)
+
+    def launch(self, job_id):
+        """Claim the job and run it in a background thread.
+
+        Returns False if the job is finished or already running.
+        """
+        # reserve the slot first: _claim also accepts a job this process
+        # owns, so it cannot tell two local launches apart
+        with self._lock:
+            if job_id in self._threads:
+                return False
+            self._threads[job_id] = None
+
+        claimed = False
+        try:
+            claimed = self._claim(job_id)
+        finally:
+            if not claimed:
+                with self._lock:
+                    self._threads.pop(job_id, None)
+        if not claimed:
+            return False
+
+        thread = threading.Thread(
+            target=self._execute,
+            args=(job_id,),
+            name=f"emi-job-{job_id[:8]}",
+            daemon=True
+        )
+        with self._lock:
+            self._threads[job_id] = thread
+        thread.start()
+        return True
+
+    def get(self, job_id):
+        db = self.session_factory()
+        try:
+            return db.query(EMIJob).filter(EMIJob.job_id == job_id).first()
+        finally:
+            db.close()
+
+    def active_job(self):
+        db = self.session_factory()
+        try:
+            return db.query(EMIJob).filter(
+                EMIJob.status == "RUNNING",
+                EMIJob.heartbeat_at >= self._stale_cutoff()
+            ).first()
+        finally:
+            db.close()
+
+    def recover(self):
+        """Resume jobs that were running when a previous process died."""
+        db = self.session_factory()
+        try:
+            job_ids = [
+                job_id for (job_id,) in db.query(EMIJob.job_id).filter(
+                    or_(
+                        EMIJob.status.in_(("QUEUED", "INTERRUPTED")),
+                        (EMIJob.status == "RUNNING") & (EMIJob.owner == self.owner),
+                        (EMIJob.status == "RUNNING") & (EMIJob.heartbeat_at < self._stale_cutoff())
+                    )
+                )
+            ]
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            if self.launch(job_id):
+                logger.info("Resumed EMI job %s", job_id)
+
+    def shutdown(self, timeout=30):
+        """Stop after the current chunk; jobs are left INTERRUPTED."""
+        self._stopping.set()
+        with self._lock:
+            threads = [thread for thread in self._threads.values() if thread is not None]
+        for thread in threads:
+            thread.join(timeout)
+
+    # -------------------------------
+    # INTERNALS
+    # -------------------------------
+    def _stale_cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.stale_after)
+
+    def _claim(self, job_id):
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            claimed = db.query(EMIJob).filter(
+                EMIJob.job_id == job_id,
+                or_(
+                    EMIJob.status.in_(RESUMABLE),
+                    (EMIJob.status == "RUNNING") & (EMIJob.owner == self.owner),
+                    (EMIJob.status == "RUNNING") & (EMIJob.heartbeat_at < self._stale_cutoff())
+                )
+            ).update(
+                {
+                    EMIJob.status: "RUNNING",
+                    EMIJob.owner: self.owner,
+                    EMIJob.heartbeat_at: now,
+                    EMIJob.error: None
+                },
+                synchronize_session=False
+            )
+            db.commit()
+            return claimed == 1
+        finally:
+            db.close()
+
+    def _finish(self, job_id, status, error=None):
+        db = self.session_factory()
+        try:
+            db.query(EMIJob).filter(
+                EMIJob.job_id == job_id,
+                EMIJob.owner == self.owner
+            ).update(
+                {
+                    EMIJob.status: status,
+                    EMIJob.error: error,
+                    EMIJob.heartbeat_at: datetime.utcnow(),
+                    EMIJob.finished_at: datetime.utcnow() if status == "COMPLETED" else None
+                },
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _execute(self, job_id):
+        job = self.get(job_id)
+        base = {name: getattr(job, name) for name in COUNTERS}
+
+        def checkpoint(last_emi_id, stats):
+            values = {getattr(EMIJob, name): base[name] + stats[name] for name in COUNTERS}
+            values[EMIJob.last_emi_id] = last_emi_id
+            values[EMIJob.heartbeat_at] = datetime.utcnow()
+
+            db = self.session_factory()
+            try:
+                db.query(EMIJob).filter(EMIJob.job_id == job_id).update(
+                    values,
+                    synchronize_session=False
+                )
+                db.commit()
+            finally:
+                db.close()
+
+        try:
+            self.runner.run(
+                job.business_date,
+                after_emi_id=job.last_emi_id,
+                on_chunk=checkpoint,
+                should_stop=self._stopping.is_set,
+                collect_details=False
+            )
+        except Exception as e:
+            logger.exception("EMI job %s failed", job_id)
+            self._finish(job_id, "FAILED", error=str(e)[:1000])
+        else:
+            self._finish(job_id, "INTERRUPTED" if self._stopping.is_set() else "COMPLETED")
+        finally:
+            with self._lock:
+                self._threads.pop(job_id, None)
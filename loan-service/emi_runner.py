@@ -0,0 +1,326 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam, update
+
+from models import Loan, EMISchedule
+
+logger = logging.getLogger("loan-service.emi_runner")
+
+DAILY_PENALTY_RATE = Decimal("0.02") / Decimal("30")
+
+# Debit outcomes
+DEBITED = "DEBITED"
+DECLINED = "DECLINED"
+RETRY = "RETRY"          # request never reached transaction-service
+IN_DOUBT = "IN_DOUBT"    # sent but no answer; the debit may have happened
+
+# EMIs are parked in this status while their debit call is in flight
+IN_FLIGHT_STATUS = "PROCESSING"
+
+
+def penalty_for(emi_amount, overdue_days):
+    return (Decimal(emi_amount) * DAILY_PENALTY_RATE * Decimal(overdue_days)).quantize(Decimal("0.01"))
+
+
+class EMIRunner:
+    """Auto-debits due EMIs in keyset-ordered chunks.
+
+    Each chunk is read with its Loan joined in, debited through a bounded
+    worker pool and committed with set-based updates before the next chunk
+    is read.
+
+    Before any debit is sent, a chunk is claimed with a conditional UPDATE
+    that moves PENDING rows to PROCESSING and stamps them with this run's
+    claim token; only the rows that carry the token are debited, so two
+    runs reading the same chunk never debit an EMI twice. Every debit
+    carries the reference "emi:<emi_id>", which transaction-service uses to
+    return the first debit instead of taking the money again.
+
+    EMIs that could not reach transaction-service go back to PENDING; EMIs
+    whose debit went unanswered stay PROCESSING. A claim older than
+    `lease_seconds` (left by a crash or an unanswered debit) is released
+    back to PENDING at the start of the next run and retried safely under
+    the same reference.
+    """
+
+    def __init__(self, session_factory, transaction_service_url, chunk_size=500, workers=16, timeout=5,
+                 lease_seconds=900):
+        self.session_factory = session_factory
+        self.debit_url = f"{transaction_service_url}/transactions/debit"
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.timeout = timeout
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+
+    # -------------------------------
+    # HTTP (ONE POOLED SESSION PER WORKER)
+    # -------------------------------
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    def _debit(self, emi):
+        try:
+            resp = self._session().post(
+                self.debit_url,
+                json={
+                    "account_id": emi.account_id,
+                    "amount": float(emi.emi_amount),
+                    "channel": "EMI_AUTO",
+                    "reference": f"emi:{emi.emi_id}"
+                },
+                timeout=self.timeout
+            )
+        except requests.exceptions.ConnectionError:
+            return RETRY
+        except requests.exceptions.RequestException:
+            return IN_DOUBT
+        if resp.status_code == 409:
+            # an earlier attempt under this reference has not settled yet
+            return IN_DOUBT
+        return DEBITED if resp.status_code == 200 else DECLINED
+
+    # -------------------------------
+    # CHUNKS
+    # -------------------------------
+    def _next_chunk(self, db, today, after_emi_id):
+        return (
+            db.query(
+                EMISchedule.emi_id,
+                EMISchedule.loan_id,
+                EMISchedule.emi_number,
+                EMISchedule.due_date,
+                EMISchedule.emi_amount,
+                Loan.account_id,
+                Loan.customer_id
+            )
+            .join(Loan, EMISchedule.loan_id == Loan.loan_id)
+            .filter(
+                EMISchedule.due_date <= today,
+                EMISchedule.status == "PENDING",
+                EMISchedule.emi_id > after_emi_id
+            )
+            .order_by(EMISchedule.emi_id)
+            .limit(self.chunk_size)
+            .all()
+        )
+
+    def _claim(self, db, chunk, token):
+        """Claim the chunk's still-PENDING rows for this run; return the claimed ones."""
+        ids = [emi.emi_id for emi in chunk]
+        db.query(EMISchedule).filter(
+            EMISchedule.emi_id.in_(ids),
+            EMISchedule.status == "PENDING"
+        ).update(
+            {
+                EMISchedule.status: IN_FLIGHT_STATUS,
+                EMISchedule.claim_token: token,
+                EMISchedule.claimed_at: datetime.utcnow()
+            },
+            synchronize_session=False
+        )
+        db.commit()
+
+        claimed = {
+            emi_id for (emi_id,) in db.query(EMISchedule.emi_id).filter(
+                EMISchedule.emi_id.in_(ids),
+                EMISchedule.claim_token == token
+            )
+        }
+        return [emi for emi in chunk if emi.emi_id in claimed]
+
+    def release_stale(self):
+        """Put PROCESSING rows whose claim outlived the lease back to PENDING."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        db = self.session_factory()
+        try:
+            released = db.query(EMISchedule).filter(
+                EMISchedule.status == IN_FLIGHT_STATUS,
+                EMISchedule.claimed_at < cutoff
+            ).update(
+                {EMISchedule.status: "PENDING", EMISchedule.claim_token: None},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        if released:
+            logger.warning("Released %d stale EMI claims older than %ds", released, self.lease_seconds)
+        return released
+
+    def _apply(self, db, today, chunk, outcomes, token):
+        paid_ids = []
+        retry_ids = []
+        overdue_rows = []
+        overdue_loans = set()
+        details = []
+
+        for emi, outcome in zip(chunk, outcomes):
+            if outcome == IN_DOUBT:
+                logger.warning("EMI %d debit unanswered, left %s", emi.emi_id, IN_FLIGHT_STATUS)
+                continue
+
+            if outcome == RETRY:
+                retry_ids.append(emi.emi_id)
+                continue
+
+            if outcome == DEBITED:
+                paid_ids.append(emi.emi_id)
+                details.append({
+                    "loan_id": emi.loan_id,
+                    "emi_number": emi.emi_number,
+                    "status": "PAID"
+                })
+            else:
+                overdue_days = (today - emi.due_date).days
+                overdue_rows.append({
+                    "emi_id": emi.emi_id,
+                    "status": "OVERDUE",
+                    "overdue_days": overdue_days,
+                    "penalty_amount": penalty_for(emi.emi_amount, overdue_days)
+                })
+                overdue_loans.add(emi.loan_id)
+                details.append({
+                    "loan_id": emi.loan_id,
+                    "emi_number": emi.emi_number,
+                    "status": "OVERDUE",
+                    "customer_id": emi.customer_id,
+                    "due_date": emi.due_date,
+                    "emi_amount": float(emi.emi_amount)
+                })
+
+        # every write is limited to rows this run still holds the claim on
+        if paid_ids:
+            db.query(EMISchedule).filter(
+                EMISchedule.emi_id.in_(paid_ids),
+                EMISchedule.claim_token == token
+            ).update(
+                {
+                    EMISchedule.status: "PAID",
+                    EMISchedule.paid_date: today,
+                    EMISchedule.overdue_days: 0,
+                    EMISchedule.penalty_amount: 0,
+                    EMISchedule.claim_token: None
+                },
+                synchronize_session=False
+            )
+
+        if retry_ids:
+            db.query(EMISchedule).filter(
+                EMISchedule.emi_id.in_(retry_ids),
+                EMISchedule.claim_token == token
+            ).update(
+                {EMISchedule.status: "PENDING", EMISchedule.claim_token: None},
+                synchronize_session=False
+            )
+
+        if overdue_rows:
+            emis = EMISchedule.__table__
+            db.execute(
+                update(emis)
+                .where(emis.c.emi_id == bindparam("b_emi_id"), emis.c.claim_token == token)
+                .values(
+                    status="OVERDUE",
+                    overdue_days=bindparam("b_overdue_days"),
+                    penalty_amount=bindparam("b_penalty_amount"),
+                    claim_token=None
+                ),
+                [
+                    {
+                        "b_emi_id": row["emi_id"],
+                        "b_overdue_days": row["overdue_days"],
+                        "b_penalty_amount": row["penalty_amount"]
+                    }
+                    for row in overdue_rows
+                ]
+            )
+            db.query(Loan).filter(
+                Loan.loan_id.in_(overdue_loans)
+            ).update(
+                {Loan.loan_status: "OVERDUE"},
+                synchronize_session=False
+            )
+
+        db.commit()
+        return len(paid_ids), len(overdue_rows), len(retry_ids), details
+
+    # -------------------------------
+    # RUN
+    # -------------------------------
+    def run(self, today, after_emi_id=0, on_chunk=None, should_stop=None, collect_details=True):
+        """Process every due EMI with emi_id > after_emi_id.
+
+        `on_chunk(last_emi_id, stats)` is called after each chunk commits.
+        `should_stop()` is checked between chunks.
+        """
+        stats = {
+            "processed_emis": 0,
+            "paid": 0,
+            "overdue": 0,
+            "failed": 0,
+            "in_doubt": 0,
+            "chunks": 0,
+            "last_emi_id": after_emi_id,
+            "elapsed_seconds": 0.0,
+            "throughput_per_sec": 0.0
+        }
+        details = []
+        started = time.monotonic()
+
+        token = uuid.uuid4().hex
+        self.release_stale()
+
+        db = self.session_factory()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="emi-debit") as pool:
+                while should_stop is None or not should_stop():
+                    chunk = self._next_chunk(db, today, stats["last_emi_id"])
+                    if not chunk:
+                        break
+
+                    last_emi_id = chunk[-1].emi_id
+                    chunk = self._claim(db, chunk, token)
+                    outcomes = list(pool.map(self._debit, chunk))
+                    paid, overdue, retry, chunk_details = self._apply(db, today, chunk, outcomes, token)
+
+                    stats["paid"] += paid
+                    stats["overdue"] += overdue
+                    stats["failed"] += retry
+                    stats["in_doubt"] += len(chunk) - paid - overdue - retry
+                    stats["processed_emis"] += paid + overdue
+                    stats["chunks"] += 1
+                    stats["last_emi_id"] = last_emi_id
+
+                    elapsed = time.monotonic() - started
+                    stats["elapsed_seconds"] = round(elapsed, 3)
+                    stats["throughput_per_sec"] = round(stats["processed_emis"] / elapsed, 2) if elapsed else 0.0
+
+                    if collect_details:
+                        details.extend(chunk_details)
+
+                    logger.info(
+                        "EMI chunk %d done: paid=%d overdue=%d failed=%d in_doubt=%d last_emi_id=%d (%.1f EMI/s)",
+                        stats["chunks"], stats["paid"], stats["overdue"], stats["failed"], stats["in_doubt"],
+                        stats["last_emi_id"], stats["throughput_per_sec"]
+                    )
+
+                    if on_chunk is not None:
+                        on_chunk(stats["last_emi_id"], dict(stats))
+        finally:
+            db.close()
+
+        return stats, details
@@ -1,18 +1,59 @@
 from fastapi import FastAPI, HTTPException, Query, Depends
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, time
 from database import engine, SessionLocal, get_db
-from models import Base, Loan, EMISchedule
-from schemas import LoanCreate, LoanResponse, EMIProcessResponse
-from math import pow
-import requests
-from decimal import Decimal
-from dateutil.relativedelta import relativedelta
+from models import Base, Loan, EMISchedule, LoanPayment
+from schemas import LoanCreate, LoanResponse, EMIProcessResponse, LoanBulkCreate, LoanBulkCreateResponse
+from schemas import EMIJobCreate, EMIJobResponse
+from schemas import LoanPrepayRequest, LoanRepriceRequest, LoanBatchRepriceRequest
+from schedule import calculate_emi, schedule_rows, insert_schedule
+from emi_runner import EMIRunner
+from emi_jobs import EMIJobManager
+from penalties import accrue_penalties, PenaltyScheduler
+from portfolio import PortfolioStore, GROUPINGS
+from restructure import recompute_remaining, reprice_batch, RestructureError, OPEN_STATUSES, FLOATING
+from migrations import migrate
+from typing import Optional
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from fastapi.responses import StreamingResponse
+import json
+import uuid
+import requests
 
 TRANSACTION_SERVICE_URL = "http://127.0.0.1:8002"
 
+MAX_BULK_LOANS = 1000
+
+# EMI auto-debit: rows read/committed per chunk, concurrent debit calls
+EMI_CHUNK_SIZE = 500
+EMI_DEBIT_WORKERS = 16
+EMI_DEBIT_TIMEOUT = 5
+# PROCESSING EMIs claimed longer ago than this are released back to PENDING
+EMI_CLAIM_LEASE_SECONDS = 900
+# A RUNNING job without a checkpoint for this long is treated as dead
+EMI_JOB_STALE_SECONDS = 300
+
+OVERDUE_PAGE_SIZE = 1000
+OVERDUE_MAX_PAGE_SIZE = 10000
+OVERDUE_STREAM_BATCH = 1000
+
+# Nightly overdue/penalty accrual (idempotent, safe on every instance)
+PENALTY_ACCRUAL_ENABLED = True
+PENALTY_ACCRUAL_AT = time(1, 0)
+PENALTY_CHUNK_SIZE = 5000
+
+# Portfolio analytics cache: incremental refresh / full rebuild intervals
+PORTFOLIO_REFRESH_SECONDS = 60
+PORTFOLIO_FULL_RELOAD_SECONDS = 3600
+
+# Mass repricing (e.g. after an MCLR change)
+REPRICE_WORKERS = 8
+REPRICE_CHUNK_SIZE = 200
+
 app = FastAPI(title="Loan Management Service")
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -25,10 +66,6 @@ app.add_middleware(
 )
 
 
-def calculate_emi(P, R, N):
-    r = R / (12 * 100)
-    return round(P * r * pow(1 + r, N) / (pow(1 + r, N) - 1), 2)
-
 @app.get("/health")
 def health_check():
     return {"service": "loan-service", "status": "UP"}
@@ -36,171 +73,588 @@ def health_check():
 # -------------------------------
 # CREATE LOAN
 # -------------------------------
-@app.post("/loans/create", response_model=LoanResponse)
-def create_loan(data: LoanCreate):
-    db = SessionLocal()
-
+def build_loan(data: LoanCreate):
     emi = calculate_emi(
         data.principal_amount,
         data.interest_rate,
         data.tenure_months
     )
 
-    end_date = data.start_date + relativedelta(months=data.tenure_months)
-
-    loan = Loan(
-    customer_id=data.customer_id,
-    branch_id=data.branch_id,
-    account_id=data.account_id,
-    loan_type=data.loan_type,
-    principal_amount=data.principal_amount,
-    interest_rate=data.interest_rate,
-    tenure_months=data.tenure_months,
-    emi_amount=emi,
-    loan_status="ACTIVE",
-    start_date=data.start_date,
-    end_date=data.start_date + timedelta(days=30 * data.tenure_months)
-)
-
-    db.add(loan)
-    db.commit()
-    db.refresh(loan)
+    return Loan(
+        customer_id=data.customer_id,
+        branch_id=data.branch_id,
+        account_id=data.account_id,
+        loan_type=data.loan_type,
+        principal_amount=data.principal_amount,
+        interest_rate=data.interest_rate,
+        rate_type=data.rate_type,
+        tenure_months=data.tenure_months,
+        emi_amount=emi,
+        loan_status="ACTIVE",
+        start_date=data.start_date,
+        end_date=data.start_date + timedelta(days=30 * data.tenure_months)
+    )
 
-    loan_id = loan.loan_id  # capture safely   
 
-    outstanding = float(data.principal_amount)
+def book_loans(db: Session, loans_data):
+    """Insert loans, then their whole EMI schedules as multi-row inserts."""
+    loans = [build_loan(data) for data in loans_data]
 
-    for i in range(1, data.tenure_months + 1):
-        interest = round(outstanding * (data.interest_rate / (12 * 100)), 2)
-        principal = round(emi - interest, 2)
-        outstanding -= principal
+    db.add_all(loans)
+    db.flush()   # assigns loan_id
 
-        emi_row = EMISchedule(
-            loan_id=loan.loan_id,
-            emi_number=i,
-            due_date=data.start_date + relativedelta(months=i),
-            emi_amount=emi,
-            principal_component=principal,
-            interest_component=interest,
-            status="PENDING"
-        )
-        db.add(emi_row)
+    rows = []
+    for loan, data in zip(loans, loans_data):
+        rows.extend(schedule_rows(
+            loan.loan_id,
+            data.principal_amount,
+            data.interest_rate,
+            data.tenure_months,
+            data.start_date,
+            loan.emi_amount
+        ))
 
+    insert_schedule(db, rows)
     db.commit()
-    db.close()
+
+    return loans
+
+
+@app.post("/loans/create", response_model=LoanResponse)
+def create_loan(data: LoanCreate):
+    db = SessionLocal()
+    try:
+        loan = book_loans(db, [data])[0]
+    finally:
+        db.close()
 
     return {
-    "loan_id": loan_id,
+    "loan_id": loan.loan_id,
     "loan_status": loan.loan_status,
     "emi_amount": float(loan.emi_amount)
 }
 
 
+# -------------------------------
+# BULK LOAN BOOKING (PORTFOLIO MIGRATION)
+# -------------------------------
+@app.post("/loans/bulk-create", response_model=LoanBulkCreateResponse)
+def bulk_create_loans(data: LoanBulkCreate):
+    if not data.loans:
+        raise HTTPException(status_code=400, detail="No loans given")
+    if len(data.loans) > MAX_BULK_LOANS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_LOANS} loans per request"
+        )
+
+    db = SessionLocal()
+    try:
+        loans = book_loans(db, data.loans)
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Bulk loan booking failed")
+    finally:
+        db.close()
+
+    return {
+        "created": len(loans),
+        "loans": [
+            {
+                "loan_id": loan.loan_id,
+                "loan_status": loan.loan_status,
+                "emi_amount": float(loan.emi_amount)
+            }
+            for loan in loans
+        ]
+    }
+
+
 
 # -------------------------------
 # PROCESS EMI (AUTO-DEBIT)
 # -------------------------------
+emi_runner = EMIRunner(
+    SessionLocal,
+    TRANSACTION_SERVICE_URL,
+    chunk_size=EMI_CHUNK_SIZE,
+    workers=EMI_DEBIT_WORKERS,
+    timeout=EMI_DEBIT_TIMEOUT,
+    lease_seconds=EMI_CLAIM_LEASE_SECONDS
+)
+
+
+emi_jobs = EMIJobManager(SessionLocal, emi_runner, stale_after=EMI_JOB_STALE_SECONDS)
+
+
+@app.on_event("startup")
+def resume_emi_jobs():
+    emi_jobs.recover()
+
+
+@app.on_event("shutdown")
+def stop_emi_jobs():
+    emi_jobs.shutdown()
+
+
+penalty_scheduler = PenaltyScheduler(SessionLocal, PENALTY_ACCRUAL_AT, chunk_size=PENALTY_CHUNK_SIZE)
+
+
+@app.on_event("startup")
+def start_penalty_scheduler():
+    if PENALTY_ACCRUAL_ENABLED:
+        penalty_scheduler.start()
+
+
+@app.on_event("shutdown")
+def stop_penalty_scheduler():
+    penalty_scheduler.stop()
+
+
 @app.post("/loans/process-emi", response_model=EMIProcessResponse)
 def process_emi():
-    db = SessionLocal()
-    today = date.today()
+    if emi_jobs.active_job() is not None:
+        raise HTTPException(status_code=409, detail="An EMI job is already running")
 
-    emis = db.query(EMISchedule).filter(
-        EMISchedule.due_date <= today,
-        EMISchedule.status == "PENDING"
-    ).all()
+    stats, details = emi_runner.run(date.today())
 
-    results = []
+    return {
+        **stats,
+        "details": details
+    }
 
-    for emi in emis:
-        loan = db.query(Loan).filter(
-            Loan.loan_id == emi.loan_id
-        ).first()
+# -------------------------------
+# EMI PROCESSING JOBS (BACKGROUND, RESUMABLE)
+# -------------------------------
+@app.post("/loans/emi-jobs", response_model=EMIJobResponse, status_code=202)
+def start_emi_job(data: EMIJobCreate = EMIJobCreate()):
+    if emi_jobs.active_job() is not None:
+        raise HTTPException(status_code=409, detail="An EMI job is already running")
 
-        resp = requests.post(
-            f"{TRANSACTION_SERVICE_URL}/transactions/debit",
-            json={
-                "account_id": loan.account_id,
-                "amount": float(emi.emi_amount),
-                "channel": "EMI_AUTO"
-            },
-            timeout=5
+    return emi_jobs.create(data.business_date or date.today())
+
+
+@app.get("/loans/emi-jobs/{job_id}", response_model=EMIJobResponse)
+def get_emi_job(job_id: str):
+    job = emi_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="EMI job not found")
+    return job
+
+
+@app.post("/loans/emi-jobs/{job_id}/resume", response_model=EMIJobResponse, status_code=202)
+def resume_emi_job(job_id: str):
+    job = emi_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="EMI job not found")
+
+    if not emi_jobs.launch(job_id):
+        raise HTTPException(status_code=409, detail=f"EMI job is {job.status.lower()}")
+
+    return emi_jobs.get(job_id)
+
+# -------------------------------
+# PENALTY ACCRUAL
+# -------------------------------
+@app.post("/loans/penalties/accrue")
+def run_penalty_accrual(as_of: Optional[date] = None):
+    return accrue_penalties(SessionLocal, as_of=as_of, chunk_size=PENALTY_CHUNK_SIZE)
+
+
+@app.get("/loans/penalties/last-run")
+def get_last_penalty_run():
+    return penalty_scheduler.last_run or {}
+
+
+# -------------------------------
+# OVERDUE EMIS (COLLECTIONS)
+# -------------------------------
+UNPAID_STATUSES = ("PENDING", "OVERDUE", "PROCESSING")
+
+
+def overdue_emi_query(db: Session, today: date, min_overdue_days: int, after_due_date, after_emi_id):
+    # overdue_days >= N  <=>  due_date <= today - N, so the filter hits the index
+    query = (
+        db.query(
+            EMISchedule.emi_id,
+            EMISchedule.emi_number,
+            EMISchedule.due_date,
+            EMISchedule.emi_amount,
+            Loan.loan_id,
+            Loan.customer_id
         )
+        .join(Loan, EMISchedule.loan_id == Loan.loan_id)
+        .filter(
+            EMISchedule.status.in_(UNPAID_STATUSES),
+            EMISchedule.due_date <= today - timedelta(days=min_overdue_days)
+        )
+    )
 
-        if resp.status_code == 200:
-            emi.status = "PAID"
-            emi.paid_date = today
-            emi.overdue_days = 0
-            emi.penalty_amount = 0
+    if after_due_date is not None:
+        query = query.filter(or_(
+            EMISchedule.due_date > after_due_date,
+            and_(
+                EMISchedule.due_date == after_due_date,
+                EMISchedule.emi_id > (after_emi_id or 0)
+            )
+        ))
 
-            results.append({
-                "loan_id": loan.loan_id,
-                "emi_number": emi.emi_number,
-                "status": "PAID"
-            })
-        else:
-            overdue_days = (today - emi.due_date).days
-            daily_penalty_rate = Decimal("0.02") / Decimal("30")
-            penalty = (emi.emi_amount * daily_penalty_rate * Decimal(overdue_days)).quantize(Decimal("0.01"))
-            emi.status = "OVERDUE"
-            emi.overdue_days = overdue_days
-            emi.penalty_amount = penalty
-            loan.loan_status = "OVERDUE"
-
-            results.append({
-        "loan_id": loan.loan_id,
-        "emi_number": emi.emi_number,
-        "status": "OVERDUE",
-        "customer_id": loan.customer_id,
-        "due_date": emi.due_date,
-        "emi_amount": float(emi.emi_amount)
-    })
+    return query.order_by(EMISchedule.due_date, EMISchedule.emi_id)
 
-        db.commit()
 
-    db.close()
+def overdue_row(row, today: date):
     return {
-        "processed_emis": len(results),
-        "details": results
+        "customer_id": row.customer_id,
+        "loan_id": row.loan_id,
+        "emi_number": row.emi_number,
+        "due_date": row.due_date,
+        "emi_amount": float(row.emi_amount),
+        "overdue_days": (today - row.due_date).days,
+        "status": "OVERDUE"
     }
 
+
+def stream_overdue_ndjson(today: date, min_overdue_days: int, after_due_date, after_emi_id):
+    # owns its session: the response outlives the request dependencies
+    db = SessionLocal()
+    try:
+        rows = (
+            overdue_emi_query(db, today, min_overdue_days, after_due_date, after_emi_id)
+            .execution_options(stream_results=True)
+            .yield_per(OVERDUE_STREAM_BATCH)
+        )
+        buffer = []
+        for row in rows:
+            record = overdue_row(row, today)
+            record["due_date"] = record["due_date"].isoformat()
+            buffer.append(json.dumps(record))
+            if len(buffer) >= OVERDUE_STREAM_BATCH:
+                yield "\n".join(buffer) + "\n"
+                buffer = []
+        if buffer:
+            yield "\n".join(buffer) + "\n"
+    finally:
+        db.close()
+
+
 @app.get("/loans/overdue-emis")
 def get_overdue_emis(
     min_overdue_days: int = Query(1, ge=1),
+    limit: int = Query(OVERDUE_PAGE_SIZE, ge=1, le=OVERDUE_MAX_PAGE_SIZE),
+    after_due_date: Optional[date] = None,
+    after_emi_id: Optional[int] = None,
+    format: str = "json",
     db: Session = Depends(get_db)
 ):
     today = date.today()
 
-    overdue_emis = (
-        db.query(EMISchedule, Loan)
-        .join(Loan, EMISchedule.loan_id == Loan.loan_id)
-        .filter(
-            EMISchedule.status != "PAID",
-            EMISchedule.due_date < today
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_overdue_ndjson(today, min_overdue_days, after_due_date, after_emi_id),
+            media_type="application/x-ndjson"
         )
-        .all()
-    )
-
-    results = []
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
 
-    for emi, loan in overdue_emis:
-        overdue_days = (today - emi.due_date).days
+    rows = overdue_emi_query(
+        db, today, min_overdue_days, after_due_date, after_emi_id
+    ).limit(limit).all()
 
-        if overdue_days < min_overdue_days:
-            continue
+    results = [overdue_row(row, today) for row in rows]
 
-        results.append({
-            "customer_id": loan.customer_id,
-            "loan_id": loan.loan_id,
-            "emi_number": emi.emi_number,
-            "due_date": emi.due_date,
-            "emi_amount": float(emi.emi_amount),
-            "overdue_days": overdue_days,
-            "status": "OVERDUE"
-        })
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = {
+            "after_due_date": rows[-1].due_date,
+            "after_emi_id": rows[-1].emi_id
+        }
 
     return {
         "count": len(results),
-        "overdues": results
+        "overdues": results,
+        "next_cursor": next_cursor
+    }
+
+
+# -------------------------------
+# PORTFOLIO ANALYTICS
+# -------------------------------
+portfolio_store = PortfolioStore(
+    SessionLocal,
+    refresh_seconds=PORTFOLIO_REFRESH_SECONDS,
+    full_reload_seconds=PORTFOLIO_FULL_RELOAD_SECONDS
+)
+
+
+def portfolio_snapshot(group_by: str):
+    if group_by not in GROUPINGS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by must be one of {', '.join(GROUPINGS)}"
+        )
+    return portfolio_store.get()
+
+
+def portfolio_meta(snapshot, as_of: date, group_by: str):
+    return {
+        "as_of": as_of,
+        "group_by": group_by,
+        "loans": snapshot.loan_count,
+        "emis": snapshot.emi_count,
+        "snapshot_loaded_at": datetime.utcfromtimestamp(snapshot.loaded_at)
+    }
+
+
+@app.get("/loans/portfolio/summary")
+def portfolio_summary(group_by: str = "branch_loan_type", as_of: Optional[date] = None):
+    snapshot = portfolio_snapshot(group_by)
+    as_of = as_of or date.today()
+    return {
+        **portfolio_meta(snapshot, as_of, group_by),
+        "groups": snapshot.summary(as_of, group_by)
+    }
+
+
+@app.get("/loans/portfolio/dpd")
+def portfolio_dpd(group_by: str = "branch_loan_type", as_of: Optional[date] = None):
+    snapshot = portfolio_snapshot(group_by)
+    as_of = as_of or date.today()
+    return {
+        **portfolio_meta(snapshot, as_of, group_by),
+        "groups": snapshot.dpd(as_of, group_by)
+    }
+
+
+@app.get("/loans/portfolio/cashflows")
+def portfolio_cashflows(
+    group_by: str = "branch_loan_type",
+    months: int = Query(12, ge=1, le=480),
+    as_of: Optional[date] = None
+):
+    snapshot = portfolio_snapshot(group_by)
+    as_of = as_of or date.today()
+    return {
+        **portfolio_meta(snapshot, as_of, group_by),
+        "groups": snapshot.cashflows(as_of, months, group_by)
     }
 
+
+@app.post("/loans/portfolio/refresh", status_code=202)
+def portfolio_refresh():
+    portfolio_store.invalidate()
+    snapshot = portfolio_store.get()
+    return {
+        "status": "reload scheduled",
+        "loans": snapshot.loan_count,
+        "emis": snapshot.emi_count,
+        "snapshot_loaded_at": datetime.utcfromtimestamp(snapshot.loaded_at)
+    }
+
+
+# -------------------------------
+# LOANS OF A CUSTOMER (CUSTOMER 360)
+# -------------------------------
+@app.get("/loans/customer/{customer_id}")
+def get_customer_loans(customer_id: int, limit: int = 100):
+    db = SessionLocal()
+    try:
+        loans = (
+            db.query(Loan)
+            .filter(Loan.customer_id == customer_id)
+            .order_by(Loan.loan_id)
+            .limit(min(max(limit, 1), 500))
+            .all()
+        )
+        return [
+            {
+                "loan_id": l.loan_id,
+                "account_id": l.account_id,
+                "loan_type": l.loan_type,
+                "principal_amount": float(l.principal_amount),
+                "interest_rate": float(l.interest_rate),
+                "emi_amount": float(l.emi_amount),
+                "tenure_months": l.tenure_months,
+                "start_date": l.start_date,
+                "end_date": l.end_date,
+                "loan_status": l.loan_status
+            }
+            for l in loans
+        ]
+    finally:
+        db.close()
+
+
+# -------------------------------
+# PREPAYMENT & RATE RESET
+# -------------------------------
+def restructure_loan(loan_id: int, as_of: Optional[date], **changes):
+    db = SessionLocal()
+    try:
+        result = recompute_remaining(db, loan_id, as_of or date.today(), **changes)
+        db.commit()
+    except LookupError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Loan not found")
+    except RestructureError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        db.close()
+
+    portfolio_store.invalidate()
+    return result
+
+
+def debit_prepayment(account_id: int, amount: float, reference: str, key: str):
+    try:
+        resp = requests.post(
+            f"{TRANSACTION_SERVICE_URL}/transactions/debit",
+            json={
+                "account_id": account_id,
+                "amount": amount,
+                "channel": "LOAN_PREPAY",
+                "reference": reference
+            },
+            timeout=EMI_DEBIT_TIMEOUT
+        )
+    except requests.exceptions.ConnectionError:
+        raise HTTPException(status_code=503, detail="Transaction service unavailable")
+    except requests.exceptions.RequestException:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Prepayment debit outcome unknown; retry with reference {key}"
+        )
+
+    if resp.status_code == 400:
+        raise HTTPException(status_code=400, detail="Insufficient balance for prepayment")
+    if resp.status_code == 409:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Prepayment debit still in progress; retry with reference {key}"
+        )
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail="Prepayment debit failed")
+    return resp.json()
+
+
+def prepayment_session(loan_id: int, reference: str):
+    """Open a session after checking the reference has not been applied yet."""
+    db = SessionLocal()
+    if db.query(LoanPayment.payment_id).filter(LoanPayment.reference == reference).first():
+        db.close()
+        raise HTTPException(status_code=409, detail="Prepayment with this reference already applied")
+    return db
+
+
+@app.post("/loans/{loan_id}/prepay")
+def prepay_loan(loan_id: int, data: LoanPrepayRequest):
+    if data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Invalid amount")
+
+    if data.reference is not None and not 0 < len(data.reference) <= 40:
+        raise HTTPException(status_code=400, detail="reference must be 1 to 40 characters")
+    # the client resends `key` on retry; it is namespaced so it can never
+    # match another debit's reference
+    key = data.reference or uuid.uuid4().hex
+    reference = f"prepay:{loan_id}:{key}"
+    as_of = data.as_of or date.today()
+
+    # 1. validate against the current schedule, then let go of the loan row
+    #    lock before calling transaction-service
+    db = prepayment_session(loan_id, reference)
+    try:
+        recompute_remaining(db, loan_id, as_of, prepayment=data.amount, mode=data.mode)
+        account_id = db.query(Loan.account_id).filter(Loan.loan_id == loan_id).scalar()
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    except RestructureError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        db.rollback()
+        db.close()
+
+    # 2. take the money; the reference makes a retried debit return the first one
+    txn = debit_prepayment(account_id, data.amount, reference, key)
+
+    # 3. apply the prepayment and record it in one transaction
+    db = prepayment_session(loan_id, reference)
+    try:
+        result = recompute_remaining(db, loan_id, as_of, prepayment=data.amount, mode=data.mode)
+        db.add(LoanPayment(
+            loan_id=loan_id,
+            payment_type="PREPAYMENT",
+            amount=data.amount,
+            reference=reference,
+            transaction_id=txn["transaction_id"],
+            paid_at=datetime.utcnow()
+        ))
+        db.commit()
+    except IntegrityError:
+        # a concurrent retry with the same reference committed first
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Prepayment with this reference already applied")
+    except (LookupError, RestructureError) as e:
+        # the loan changed while the debit was in flight
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Loan changed during prepayment ({e}); debit {txn['transaction_id']} "
+                f"is not applied yet, retry with reference {key}"
+            )
+        )
+    finally:
+        db.close()
+
+    portfolio_store.invalidate()
+    return {
+        **result,
+        "payment": {
+            "transaction_id": txn["transaction_id"],
+            "amount": data.amount,
+            "reference": key
+        }
+    }
+
+
+@app.post("/loans/{loan_id}/reprice")
+def reprice_loan(loan_id: int, data: LoanRepriceRequest):
+    if data.new_rate < 0:
+        raise HTTPException(status_code=400, detail="Invalid rate")
+
+    return restructure_loan(loan_id, data.as_of, new_rate=data.new_rate, mode=data.mode)
+
+
+@app.post("/loans/reprice/batch")
+def reprice_loans(data: LoanBatchRepriceRequest):
+    if data.loan_ids is not None:
+        loan_ids = sorted(set(data.loan_ids))
+    else:
+        db = SessionLocal()
+        try:
+            query = db.query(Loan.loan_id).filter(
+                Loan.rate_type == FLOATING,
+                Loan.loan_status.in_(OPEN_STATUSES)
+            )
+            if data.loan_type:
+                query = query.filter(Loan.loan_type == data.loan_type)
+            loan_ids = [loan_id for (loan_id,) in query.order_by(Loan.loan_id)]
+        finally:
+            db.close()
+
+    try:
+        result = reprice_batch(
+            SessionLocal,
+            loan_ids,
+            data.as_of or date.today(),
+            new_rate=data.new_rate,
+            rate_delta=data.rate_delta,
+            mode=data.mode,
+            workers=REPRICE_WORKERS,
+            chunk_size=REPRICE_CHUNK_SIZE
+        )
+    except RestructureError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    portfolio_store.invalidate()
+    return result
@@ -1,11 +1,11 @@
-from sqlalchemy import Column, Integer, String, Date, DECIMAL, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, Date, DateTime, DECIMAL, ForeignKey, BigInteger, Text, Index
 from database import Base
 
 class Loan(Base):
     __tablename__ = "loans"
 
     loan_id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False, index=True)
     branch_id = Column(Integer, nullable=False)
 
     account_id = Column(BigInteger, nullable=False)  # 🔥 FIXED
@@ -13,6 +13,7 @@ class Loan(Base):
     loan_type = Column(String(50), nullable=False)
     principal_amount = Column(DECIMAL(15,2), nullable=False)
     interest_rate = Column(DECIMAL(5,2), nullable=False)
+    rate_type = Column(String(10), nullable=False, default="FIXED")   # FIXED / FLOATING
     tenure_months = Column(Integer, nullable=False)
     emi_amount = Column(DECIMAL(15,2), nullable=False)
 
@@ -23,6 +24,9 @@ class Loan(Base):
 
 class EMISchedule(Base):
     __tablename__ = "emi_schedule"
+    __table_args__ = (
+        Index("ix_emi_schedule_status_due_date", "status", "due_date"),
+    )
 
     emi_id = Column(Integer, primary_key=True, index=True)
     loan_id = Column(Integer, ForeignKey("loans.loan_id"), nullable=False)
@@ -39,3 +43,44 @@ class EMISchedule(Base):
 
     overdue_days = Column(Integer, default=0)        # 🔥 FIX
     penalty_amount = Column(DECIMAL(15,2), default=0)  # 🔥 FIX
+
+    claim_token = Column(String(32))   # EMI run that moved the row to PROCESSING
+    claimed_at = Column(DateTime)
+
+
+class LoanPayment(Base):
+    """Money received against a loan outside the EMI schedule (prepayments)."""
+    __tablename__ = "loan_payments"
+
+    payment_id = Column(Integer, primary_key=True, index=True)
+    loan_id = Column(Integer, ForeignKey("loans.loan_id"), nullable=False, index=True)
+
+    payment_type = Column(String(20), nullable=False)   # PREPAYMENT
+    amount = Column(DECIMAL(15,2), nullable=False)
+    reference = Column(String(64), unique=True, nullable=False)
+    transaction_id = Column(Integer, nullable=False)   # transaction-service debit
+
+    paid_at = Column(DateTime, nullable=False)
+
+
+class EMIJob(Base):
+    __tablename__ = "emi_jobs"
+
+    job_id = Column(String(32), primary_key=True)
+    business_date = Column(Date, nullable=False)
+
+    status = Column(String(20), nullable=False)   # QUEUED / RUNNING / COMPLETED / FAILED / INTERRUPTED
+    owner = Column(String(100))
+    last_emi_id = Column(Integer, nullable=False, default=0)   # checkpoint
+
+    processed_emis = Column(Integer, nullable=False, default=0)
+    paid = Column(Integer, nullable=False, default=0)
+    overdue = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    in_doubt = Column(Integer, nullable=False, default=0)
+    chunks = Column(Integer, nullable=False, default=0)
+
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
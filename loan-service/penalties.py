@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from models import Loan, EMISchedule
+from emi_runner import DAILY_PENALTY_RATE, IN_FLIGHT_STATUS
+
+logger = logging.getLogger("loan-service.penalties")
+
+# PROCESSING rows have a debit in flight and are left alone
+ACCRUING_STATUSES = ("PENDING", "OVERDUE")
+# ...but until that debit lands they are still owed when judging the loan
+DUE_STATUSES = ACCRUING_STATUSES + (IN_FLIGHT_STATUS,)
+
+
+def accrue_penalties(session_factory, as_of=None, chunk_size=5000):
+    """Recompute overdue_days and penalty_amount for every unpaid past-due EMI.
+
+    All EMIs sharing a due date have the same overdue_days, so each UPDATE
+    covers one due date (split into emi_id ranges when a date holds more
+    than `chunk_size` rows) and runs on the (status, due_date) index with
+    plain parameters, no per-row loading. Loan statuses are then corrected
+    with two set-based UPDATEs. Re-running for the same day is harmless.
+    """
+    as_of = as_of or date.today()
+    started = time.monotonic()
+    stats = {
+        "as_of": as_of,
+        "due_dates": 0,
+        "statements": 0,
+        "emis_updated": 0,
+        "loans_marked_overdue": 0,
+        "loans_restored_active": 0
+    }
+
+    db = session_factory()
+    try:
+        groups = (
+            db.query(
+                EMISchedule.due_date,
+                func.count(EMISchedule.emi_id),
+                func.min(EMISchedule.emi_id),
+                func.max(EMISchedule.emi_id)
+            )
+            .filter(
+                EMISchedule.status.in_(ACCRUING_STATUSES),
+                EMISchedule.due_date < as_of
+            )
+            .group_by(EMISchedule.due_date)
+            .all()
+        )
+
+        for due_date, count, min_id, max_id in groups:
+            overdue_days = (as_of - due_date).days
+            rate = DAILY_PENALTY_RATE * Decimal(overdue_days)
+
+            if count <= chunk_size:
+                ranges = [(min_id, max_id)]
+            else:
+                ranges = [
+                    (lo, min(lo + chunk_size - 1, max_id))
+                    for lo in range(min_id, max_id + 1, chunk_size)
+                ]
+
+            for lo, hi in ranges:
+                updated = db.query(EMISchedule).filter(
+                    EMISchedule.status.in_(ACCRUING_STATUSES),
+                    EMISchedule.due_date == due_date,
+                    EMISchedule.emi_id.between(lo, hi)
+                ).update(
+                    {
+                        EMISchedule.overdue_days: overdue_days,
+                        EMISchedule.penalty_amount: func.round(EMISchedule.emi_amount * rate, 2)
+                    },
+                    synchronize_session=False
+                )
+                db.commit()
+
+                stats["statements"] += 1
+                stats["emis_updated"] += updated
+
+            stats["due_dates"] += 1
+
+        past_due_loans = db.query(EMISchedule.loan_id).filter(
+            EMISchedule.status.in_(DUE_STATUSES),
+            EMISchedule.due_date < as_of
+        )
+
+        stats["loans_marked_overdue"] = db.query(Loan).filter(
+            Loan.loan_status == "ACTIVE",
+            Loan.loan_id.in_(past_due_loans)
+        ).update({Loan.loan_status: "OVERDUE"}, synchronize_session=False)
+
+        stats["loans_restored_active"] = db.query(Loan).filter(
+            Loan.loan_status == "OVERDUE",
+            ~Loan.loan_id.in_(past_due_loans)
+        ).update({Loan.loan_status: "ACTIVE"}, synchronize_session=False)
+
+        db.commit()
+    finally:
+        db.close()
+
+    stats["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    logger.info("Penalty accrual for %s: %s", as_of, stats)
+    return stats
+
+
+class PenaltyScheduler:
+    """Runs accrue_penalties once a day at `run_at` (local time)."""
+
+    def __init__(self, session_factory, run_at, chunk_size=5000):
+        self.session_factory = session_factory
+        self.run_at = run_at
+        self.chunk_size = chunk_size
+        self.last_run = None
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="penalty-accrual", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _seconds_until_next_run(self):
+        now = datetime.now()
+        next_run = datetime.combine(now.date(), self.run_at)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def _loop(self):
+        while not self._stopping.wait(self._seconds_until_next_run()):
+            try:
+                self.last_run = accrue_penalties(self.session_factory, chunk_size=self.chunk_size)
+            except Exception:
+                logger.exception("Nightly penalty accrual failed")
@@ -0,0 +1,435 @@
+import logging
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+from models import Loan, EMISchedule
+
+logger = logging.getLogger("loan-service.portfolio")
+
+UNPAID_STATUSES = ("PENDING", "OVERDUE", "PROCESSING")
+
+DPD_EDGES = (1, 31, 61, 91)
+DPD_BUCKETS = ("CURRENT", "1-30", "31-60", "61-90", "90+")
+
+GROUPINGS = ("branch", "loan_type", "branch_loan_type", "total")
+
+# Days in an instalment period, for pro-rata interest on the next EMI
+PERIOD_DAYS = 30
+
+_NO_DUE = np.iinfo(np.int64).max
+
+
+def _days(d):
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+
+class PortfolioSnapshot:
+    """Columnar, read-only copy of loans and emi_schedule.
+
+    Loan columns are indexed by position; `emi_loan_idx` maps each EMI row
+    to its loan's position so aggregates are plain bincounts.
+    """
+
+    def __init__(self, loan_ids, branch_ids, loan_types, emi_ids, emi_loan_idx,
+                 due, emi_amount, principal, interest, penalty, unpaid, loaded_at):
+        self.loan_ids = loan_ids
+        self.branch_ids = branch_ids
+        self.loan_types = loan_types
+        self.emi_ids = emi_ids
+        self.emi_loan_idx = emi_loan_idx
+        self.due = due
+        self.emi_amount = emi_amount
+        self.principal = principal
+        self.interest = interest
+        self.penalty = penalty
+        self.unpaid = unpaid
+        self.loaded_at = loaded_at
+
+    @property
+    def loan_count(self):
+        return len(self.loan_ids)
+
+    @property
+    def emi_count(self):
+        return len(self.emi_ids)
+
+    # -------------------------------
+    # GROUPING
+    # -------------------------------
+    def _groups(self, group_by):
+        """Group code per loan plus the key dict for each code."""
+        if group_by == "total":
+            return np.zeros(self.loan_count, dtype=np.int64), [{}]
+
+        if group_by == "branch":
+            labels, codes = np.unique(self.branch_ids, return_inverse=True)
+            return codes, [{"branch_id": int(b)} for b in labels]
+
+        if group_by == "loan_type":
+            labels, codes = np.unique(self.loan_types, return_inverse=True)
+            return codes, [{"loan_type": str(t)} for t in labels]
+
+        branches, branch_codes = np.unique(self.branch_ids, return_inverse=True)
+        types, type_codes = np.unique(self.loan_types, return_inverse=True)
+        labels, codes = np.unique(branch_codes * len(types) + type_codes, return_inverse=True)
+        return codes, [
+            {"branch_id": int(branches[c // len(types)]), "loan_type": str(types[c % len(types)])}
+            for c in labels
+        ]
+
+    # -------------------------------
+    # AGGREGATES
+    # -------------------------------
+    def summary(self, as_of, group_by="branch"):
+        codes, keys = self._groups(group_by)
+        groups = len(keys)
+        emi_group = codes[self.emi_loan_idx]
+        today = _days(as_of)
+
+        unpaid = self.unpaid
+        past_due = unpaid & (self.due <= today)
+
+        # interest already earned: unpaid past-due instalments in full, plus
+        # the elapsed share of the next instalment's period
+        elapsed = np.clip(1 - (self.due - today) / PERIOD_DAYS, 0, 1)
+        accrued = np.where(past_due, self.interest, np.where(unpaid, self.interest * elapsed, 0.0))
+
+        def total(weights, mask=None):
+            if mask is None:
+                return np.bincount(emi_group, weights=weights, minlength=groups)
+            return np.bincount(emi_group[mask], weights=weights[mask], minlength=groups)
+
+        outstanding = total(self.principal, unpaid)
+        accrued_interest = total(accrued)
+        overdue_amount = total(self.emi_amount, past_due)
+        penalties = total(self.penalty, unpaid)
+        loans = np.bincount(codes, minlength=groups)
+
+        return [
+            {
+                **keys[g],
+                "loans": int(loans[g]),
+                "outstanding_principal": round(float(outstanding[g]), 2),
+                "accrued_interest": round(float(accrued_interest[g]), 2),
+                "overdue_amount": round(float(overdue_amount[g]), 2),
+                "penalty_outstanding": round(float(penalties[g]), 2)
+            }
+            for g in range(groups)
+        ]
+
+    def dpd(self, as_of, group_by="branch"):
+        codes, keys = self._groups(group_by)
+        groups = len(keys)
+        today = _days(as_of)
+
+        past_due = self.unpaid & (self.due <= today)
+        oldest = np.full(self.loan_count, _NO_DUE, dtype=np.int64)
+        np.minimum.at(oldest, self.emi_loan_idx[past_due], self.due[past_due])
+
+        days_past_due = np.where(oldest == _NO_DUE, 0, today - oldest)
+        bucket = np.digitize(days_past_due, DPD_EDGES)
+
+        loan_outstanding = np.bincount(
+            self.emi_loan_idx[self.unpaid],
+            weights=self.principal[self.unpaid],
+            minlength=self.loan_count
+        )
+
+        cell = codes * len(DPD_BUCKETS) + bucket
+        cells = groups * len(DPD_BUCKETS)
+        counts = np.bincount(cell, minlength=cells).reshape(groups, -1)
+        amounts = np.bincount(cell, weights=loan_outstanding, minlength=cells).reshape(groups, -1)
+
+        return [
+            {
+                **keys[g],
+                "buckets": {
+                    name: {
+                        "loans": int(counts[g, b]),
+                        "outstanding_principal": round(float(amounts[g, b]), 2)
+                    }
+                    for b, name in enumerate(DPD_BUCKETS)
+                }
+            }
+            for g in range(groups)
+        ]
+
+    def cashflows(self, as_of, months=12, group_by="branch"):
+        codes, keys = self._groups(group_by)
+        groups = len(keys)
+        today = _days(as_of)
+
+        start_month = np.datetime64(as_of, "M")
+        due_month = self.due.astype("datetime64[D]").astype("datetime64[M]")
+        offset = (due_month - start_month).astype(np.int64)
+
+        upcoming = self.unpaid & (self.due >= today) & (offset < months)
+        cell = codes[self.emi_loan_idx[upcoming]] * months + offset[upcoming]
+
+        def grid(weights):
+            return np.bincount(cell, weights=weights[upcoming], minlength=groups * months).reshape(groups, months)
+
+        emi = grid(self.emi_amount)
+        principal = grid(self.principal)
+        interest = grid(self.interest)
+        labels = [str(start_month + m) for m in range(months)]
+
+        return [
+            {
+                **keys[g],
+                "months": [
+                    {
+                        "month": labels[m],
+                        "expected_emi": round(float(emi[g, m]), 2),
+                        "principal": round(float(principal[g, m]), 2),
+                        "interest": round(float(interest[g, m]), 2)
+                    }
+                    for m in range(months)
+                ]
+            }
+            for g in range(groups)
+        ]
+
+
+class PortfolioStore:
+    """Loads and caches a PortfolioSnapshot.
+
+    `refresh()` appends loans/EMIs above the loaded id watermarks and
+    re-syncs the status of due, unpaid instalments (the only rows the
+    EMI runner and penalty job change). Every `full_reload_seconds`, or
+    after `invalidate()`, the snapshot is rebuilt from scratch.
+
+    Only the very first load runs in the caller. After that, refreshes and
+    rebuilds run on one background thread while readers keep getting the
+    previous complete snapshot; the new one is swapped in when it is ready.
+    """
+
+    def __init__(self, session_factory, refresh_seconds=60, full_reload_seconds=3600, batch_size=50000):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.batch_size = batch_size
+
+        self.snapshot = None
+        self._refreshed_at = 0.0
+        self._full_loaded_at = 0.0
+        self._force_full = False
+        self._worker = None
+        self._lock = threading.Lock()        # guards the flags and _worker
+        self._load_lock = threading.Lock()   # one load/refresh at a time
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self.snapshot is None:
+                    self._reload()
+                return self.snapshot
+
+        if self._stale():
+            self._start_worker()
+        return snapshot
+
+    def invalidate(self):
+        """Rebuild from scratch in the background (e.g. after schedules are rewritten)."""
+        with self._lock:
+            self._force_full = True
+        self._start_worker()
+
+    # -------------------------------
+    # BACKGROUND REBUILD
+    # -------------------------------
+    def _stale(self):
+        return self._force_full or time.monotonic() - self._refreshed_at >= self.refresh_seconds
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._rebuild, name="portfolio-reload", daemon=True)
+            self._worker.start()
+
+    def _rebuild(self):
+        try:
+            while True:
+                with self._lock:
+                    if self.snapshot is not None and not self._stale():
+                        self._worker = None
+                        return
+                    full = (
+                        self.snapshot is None
+                        or self._force_full
+                        or time.monotonic() - self._full_loaded_at >= self.full_reload_seconds
+                    )
+                    # cleared before loading so an invalidate() during the load
+                    # schedules another rebuild
+                    self._force_full = False
+
+                try:
+                    with self._load_lock:
+                        if full:
+                            self._reload()
+                        else:
+                            self._refresh()
+                except Exception:
+                    logger.exception("Portfolio %s failed", "reload" if full else "refresh")
+                    if full:
+                        with self._lock:
+                            self._force_full = True
+                    return
+        finally:
+            with self._lock:
+                if self._worker is threading.current_thread():
+                    self._worker = None
+
+    # -------------------------------
+    # LOADING
+    # -------------------------------
+    def _load_loans(self, db, after_loan_id):
+        ids, branches, types = [], [], []
+        rows = (
+            db.query(Loan.loan_id, Loan.branch_id, Loan.loan_type)
+            .filter(Loan.loan_id > after_loan_id)
+            .order_by(Loan.loan_id)
+            .yield_per(self.batch_size)
+        )
+        for loan_id, branch_id, loan_type in rows:
+            ids.append(loan_id)
+            branches.append(branch_id)
+            types.append(loan_type)
+
+        return (
+            np.array(ids, dtype=np.int64),
+            np.array(branches, dtype=np.int64),
+            np.array(types, dtype=object)
+        )
+
+    def _load_emis(self, db, after_emi_id):
+        cols = {k: [] for k in ("emi_id", "loan_id", "due", "emi", "principal", "interest", "penalty", "unpaid")}
+        rows = (
+            db.query(
+                EMISchedule.emi_id,
+                EMISchedule.loan_id,
+                EMISchedule.due_date,
+                EMISchedule.emi_amount,
+                EMISchedule.principal_component,
+                EMISchedule.interest_component,
+                EMISchedule.penalty_amount,
+                EMISchedule.status
+            )
+            .filter(EMISchedule.emi_id > after_emi_id)
+            .order_by(EMISchedule.emi_id)
+            .yield_per(self.batch_size)
+        )
+        for emi_id, loan_id, due_date, emi, principal, interest, penalty, status in rows:
+            cols["emi_id"].append(emi_id)
+            cols["loan_id"].append(loan_id)
+            cols["due"].append(due_date)
+            cols["emi"].append(emi)
+            cols["principal"].append(principal)
+            cols["interest"].append(interest)
+            cols["penalty"].append(penalty or 0)
+            cols["unpaid"].append(status in UNPAID_STATUSES)
+
+        return {
+            "emi_id": np.array(cols["emi_id"], dtype=np.int64),
+            "loan_id": np.array(cols["loan_id"], dtype=np.int64),
+            "due": np.array(cols["due"], dtype="datetime64[D]").astype(np.int64),
+            "emi": np.array(cols["emi"], dtype=np.float64),
+            "principal": np.array(cols["principal"], dtype=np.float64),
+            "interest": np.array(cols["interest"], dtype=np.float64),
+            "penalty": np.array(cols["penalty"], dtype=np.float64),
+            "unpaid": np.array(cols["unpaid"], dtype=bool)
+        }
+
+    def _build(self, loans, emis, base=None):
+        if base is not None:
+            loans = tuple(np.concatenate([old, new]) for old, new in zip(
+                (base.loan_ids, base.branch_ids, base.loan_types), loans
+            ))
+            emis = {
+                "emi_id": np.concatenate([base.emi_ids, emis["emi_id"]]),
+                "loan_id": emis["loan_id"],
+                "due": np.concatenate([base.due, emis["due"]]),
+                "emi": np.concatenate([base.emi_amount, emis["emi"]]),
+                "principal": np.concatenate([base.principal, emis["principal"]]),
+                "interest": np.concatenate([base.interest, emis["interest"]]),
+                "penalty": np.concatenate([base.penalty, emis["penalty"]]),
+                "unpaid": np.concatenate([base.unpaid, emis["unpaid"]])
+            }
+
+        loan_ids, branch_ids, loan_types = loans
+        new_idx = np.searchsorted(loan_ids, emis["loan_id"]).astype(np.int64)
+        loan_idx = new_idx if base is None else np.concatenate([base.emi_loan_idx, new_idx])
+
+        return PortfolioSnapshot(
+            loan_ids, branch_ids, loan_types,
+            emis["emi_id"], loan_idx, emis["due"], emis["emi"],
+            emis["principal"], emis["interest"], emis["penalty"], emis["unpaid"],
+            loaded_at=time.time()
+        )
+
+    def _reload(self):
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            loans = self._load_loans(db, 0)
+            emis = self._load_emis(db, 0)
+        finally:
+            db.close()
+
+        self.snapshot = self._build(loans, emis)
+        self._full_loaded_at = self._refreshed_at = time.monotonic()
+        logger.info(
+            "Portfolio loaded: %d loans, %d EMIs in %.2fs",
+            self.snapshot.loan_count, self.snapshot.emi_count, time.monotonic() - started
+        )
+
+    def _refresh(self):
+        base = self.snapshot
+        last_loan = int(base.loan_ids[-1]) if base.loan_count else 0
+        last_emi = int(base.emi_ids[-1]) if base.emi_count else 0
+        today = date.today()
+
+        db = self.session_factory()
+        try:
+            loans = self._load_loans(db, last_loan)
+            emis = self._load_emis(db, last_emi)
+
+            # due instalments the DB still has unpaid, with current penalties
+            still_unpaid = db.query(
+                EMISchedule.emi_id,
+                EMISchedule.penalty_amount
+            ).filter(
+                EMISchedule.status.in_(UNPAID_STATUSES),
+                EMISchedule.due_date <= today,
+                EMISchedule.emi_id <= last_emi
+            ).all()
+        finally:
+            db.close()
+
+        snapshot = self._build(loans, emis, base)
+
+        unpaid = snapshot.unpaid.copy()
+        penalty = snapshot.penalty.copy()
+        existing = np.arange(len(unpaid)) < base.emi_count
+        due_rows = existing & unpaid & (snapshot.due <= _days(today))
+        unpaid[due_rows] = False
+
+        if still_unpaid:
+            ids = np.array([r[0] for r in still_unpaid], dtype=np.int64)
+            values = np.array([float(r[1] or 0) for r in still_unpaid])
+            pos = np.searchsorted(snapshot.emi_ids, ids)
+            found = pos < len(snapshot.emi_ids)
+            found[found] = snapshot.emi_ids[pos[found]] == ids[found]
+            unpaid[pos[found]] = True
+            penalty[pos[found]] = values[found]
+
+        snapshot.unpaid = unpaid
+        snapshot.penalty = penalty
+
+        self.snapshot = snapshot
+        self._refreshed_at = time.monotonic()
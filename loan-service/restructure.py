@@ -0,0 +1,252 @@
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models import Loan, EMISchedule
+from schedule import amortisation, calculate_emi, emi_due_dates, insert_schedule, monthly_rate
+
+logger = logging.getLogger("loan-service.restructure")
+
+# Recompute modes
+KEEP_TENURE = "EMI"       # new EMI over the same number of instalments
+KEEP_EMI = "TENURE"       # same EMI, fewer/more instalments
+MODES = (KEEP_TENURE, KEEP_EMI)
+
+# Only open loans can be restructured, and only floating-rate ones repriced
+OPEN_STATUSES = ("ACTIVE", "OVERDUE")
+FLOATING = "FLOATING"
+
+# Differences below half a paisa are rounding noise, not changes
+TOLERANCE = 0.005
+
+MAX_REPORTED_ERRORS = 100
+
+
+class RestructureError(Exception):
+    pass
+
+
+def tenure_for(principal, annual_rate, emi):
+    """Instalments needed to repay `principal` at a fixed `emi`."""
+    r = monthly_rate(annual_rate)
+    if r == 0:
+        return math.ceil(principal / emi)
+    if emi <= principal * r:
+        raise RestructureError("EMI does not cover monthly interest")
+    return math.ceil(-math.log(1 - principal * r / emi) / math.log(1 + r))
+
+
+def remaining_schedule(principal, annual_rate, emi, count):
+    """Per-instalment emi/principal/interest for the remaining balance.
+
+    The last instalment absorbs the rounding residue so the balance closes
+    at exactly zero.
+    """
+    interest, principal_part, outstanding = amortisation(principal, annual_rate, count, emi)
+    principal_part[-1] = round(principal_part[-1] + outstanding[-1], 2)
+    emi_amounts = np.full(count, float(emi))
+    emi_amounts[-1] = round(principal_part[-1] + interest[-1], 2)
+    return emi_amounts, principal_part, interest
+
+
+def recompute_remaining(db, loan_id, as_of, prepayment=0.0, new_rate=None, mode=KEEP_TENURE):
+    """Re-amortise the unpaid, not-yet-due instalments of one loan.
+
+    Only PENDING instalments due after `as_of` are touched; arrears and
+    paid rows are left as they are. The new schedule is diffed against the
+    stored rows and written as one bulk update of changed rows, one INSERT
+    for added instalments and one UPDATE cancelling surplus ones. The
+    caller commits.
+    """
+    if mode not in MODES:
+        raise RestructureError(f"mode must be one of {', '.join(MODES)}")
+
+    loan = db.query(Loan).filter(Loan.loan_id == loan_id).with_for_update().first()
+    if not loan:
+        raise LookupError(loan_id)
+    if loan.loan_status not in OPEN_STATUSES:
+        raise RestructureError(f"Loan is {loan.loan_status}")
+    if new_rate is not None and loan.rate_type != FLOATING:
+        raise RestructureError("Only floating-rate loans can be repriced")
+
+    stored = (
+        db.query(
+            EMISchedule.emi_id,
+            EMISchedule.emi_number,
+            EMISchedule.emi_amount,
+            EMISchedule.principal_component,
+            EMISchedule.interest_component
+        )
+        .filter(
+            EMISchedule.loan_id == loan_id,
+            EMISchedule.status == "PENDING",
+            EMISchedule.due_date > as_of
+        )
+        .order_by(EMISchedule.emi_number)
+        .all()
+    )
+    if not stored:
+        raise RestructureError("Loan has no remaining instalments")
+
+    rate = float(new_rate) if new_rate is not None else float(loan.interest_rate)
+    outstanding = round(sum(float(row.principal_component) for row in stored), 2)
+    principal = round(outstanding - float(prepayment), 2)
+
+    if principal < 0:
+        raise RestructureError("Prepayment exceeds outstanding principal")
+
+    first_number = stored[0].emi_number
+    current_count = len(stored)
+
+    if principal == 0:
+        count = 0
+        emi = 0.0
+    elif mode == KEEP_TENURE:
+        count = current_count
+        emi = calculate_emi(principal, rate, count)
+    else:
+        emi = float(loan.emi_amount)
+        count = tenure_for(principal, rate, emi)
+
+    overlap = min(count, current_count)
+    updates = []
+    new_rows = []
+
+    if count:
+        emi_amounts, principal_part, interest = remaining_schedule(principal, rate, emi, count)
+
+        old = np.array(
+            [(float(r.emi_amount), float(r.principal_component), float(r.interest_component)) for r in stored[:overlap]],
+            dtype=np.float64
+        ).reshape(-1, 3)
+        new = np.column_stack([emi_amounts[:overlap], principal_part[:overlap], interest[:overlap]])
+        changed = np.nonzero(np.any(np.abs(old - new) >= TOLERANCE, axis=1))[0]
+
+        updates = [
+            {
+                "emi_id": stored[i].emi_id,
+                "emi_amount": float(emi_amounts[i]),
+                "principal_component": float(principal_part[i]),
+                "interest_component": float(interest[i])
+            }
+            for i in changed.tolist()
+        ]
+
+        if count > current_count:
+            extra = count - current_count
+            start_number = first_number + current_count
+            due_dates = emi_due_dates(loan.start_date, extra, first_instalment=start_number).tolist()
+            new_rows = [
+                {
+                    "loan_id": loan_id,
+                    "emi_number": start_number + j,
+                    "due_date": due_dates[j],
+                    "emi_amount": float(emi_amounts[current_count + j]),
+                    "principal_component": float(principal_part[current_count + j]),
+                    "interest_component": float(interest[current_count + j]),
+                    "status": "PENDING",
+                    "overdue_days": 0,
+                    "penalty_amount": 0
+                }
+                for j in range(extra)
+            ]
+
+    if updates:
+        db.bulk_update_mappings(EMISchedule, updates)
+
+    if new_rows:
+        insert_schedule(db, new_rows)
+
+    cancelled = 0
+    if count < current_count:
+        cancelled = db.query(EMISchedule).filter(
+            EMISchedule.emi_id.in_([row.emi_id for row in stored[count:]])
+        ).update(
+            {EMISchedule.status: "CANCELLED"},
+            synchronize_session=False
+        )
+
+    last_number = first_number + count - 1 if count else first_number - 1
+    loan.interest_rate = rate
+    if count:
+        loan.emi_amount = emi
+    loan.tenure_months = last_number
+    loan.end_date = emi_due_dates(loan.start_date, 1, first_instalment=max(last_number, 1)).tolist()[0]
+    if principal == 0 and loan.loan_status == "ACTIVE":
+        loan.loan_status = "CLOSED"
+
+    return {
+        "loan_id": loan_id,
+        "outstanding_before": outstanding,
+        "outstanding_after": principal,
+        "interest_rate": rate,
+        "emi_amount": float(loan.emi_amount),
+        "remaining_instalments": count,
+        "tenure_months": loan.tenure_months,
+        "rows_updated": len(updates),
+        "rows_inserted": len(new_rows),
+        "rows_cancelled": cancelled
+    }
+
+
+# -------------------------------
+# MASS REPRICING
+# -------------------------------
+def reprice_batch(session_factory, loan_ids, as_of, new_rate=None, rate_delta=None,
+                  mode=KEEP_TENURE, workers=8, chunk_size=200):
+    """Reprice many loans in parallel, one transaction per loan.
+
+    Loans are split into chunks handled by a worker pool; each worker uses
+    its own session. A failing loan is rolled back and reported without
+    stopping the batch.
+    """
+    if (new_rate is None) == (rate_delta is None):
+        raise RestructureError("Give exactly one of new_rate or rate_delta")
+
+    def run_chunk(chunk):
+        results, errors = [], []
+        db = session_factory()
+        try:
+            for loan_id in chunk:
+                try:
+                    rate = new_rate
+                    if rate_delta is not None:
+                        current = db.query(Loan.interest_rate).filter(Loan.loan_id == loan_id).scalar()
+                        if current is None:
+                            raise LookupError(loan_id)
+                        rate = float(current) + float(rate_delta)
+                    results.append(recompute_remaining(db, loan_id, as_of, new_rate=rate, mode=mode))
+                    db.commit()
+                except (RestructureError, LookupError) as e:
+                    db.rollback()
+                    errors.append({
+                        "loan_id": loan_id,
+                        "error": "Loan not found" if isinstance(e, LookupError) else str(e)
+                    })
+                except Exception:
+                    db.rollback()
+                    logger.exception("Repricing loan %s failed", loan_id)
+                    errors.append({"loan_id": loan_id, "error": "Repricing failed"})
+        finally:
+            db.close()
+        return results, errors
+
+    chunks = [loan_ids[i:i + chunk_size] for i in range(0, len(loan_ids), chunk_size)]
+    repriced, errors = [], []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reprice") as pool:
+        for results, chunk_errors in pool.map(run_chunk, chunks):
+            repriced.extend(results)
+            errors.extend(chunk_errors)
+
+    return {
+        "requested": len(loan_ids),
+        "repriced": len(repriced),
+        "failed": len(errors),
+        "rows_updated": sum(r["rows_updated"] for r in repriced),
+        "rows_inserted": sum(r["rows_inserted"] for r in repriced),
+        "rows_cancelled": sum(r["rows_cancelled"] for r in repriced),
+        "errors": errors[:MAX_REPORTED_ERRORS]
+    }
@@ -0,0 +1,99 @@
+from math import pow
+
+import numpy as np
+from sqlalchemy import insert
+
+from models import EMISchedule
+
+# Rows per multi-row INSERT when writing schedules
+INSERT_CHUNK_SIZE = 5000
+
+
+def monthly_rate(annual_rate):
+    return float(annual_rate) / (12 * 100)
+
+
+def calculate_emi(P, R, N):
+    r = float(R) / (12 * 100)
+    if r == 0:
+        return round(float(P) / N, 2)
+    return round(float(P) * r * pow(1 + r, N) / (pow(1 + r, N) - 1), 2)
+
+
+def emi_due_dates(start_date, tenure_months, first_instalment=1):
+    """Same dates as start_date + relativedelta(months=i), computed in one go.
+
+    Days past the end of a short month clip to its last day, e.g. a loan
+    started on Jan 31 falls due on Feb 28/29.
+    """
+    months = np.datetime64(start_date, "M") + np.arange(
+        first_instalment, first_instalment + tenure_months
+    )
+    first_day = months.astype("datetime64[D]")
+    days_in_month = ((months + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+    day = np.minimum(start_date.day, days_in_month)
+    return first_day + (day - 1)
+
+
+def amortisation(principal, annual_rate, tenure_months, emi):
+    """Interest, principal and closing outstanding for every instalment.
+
+    Each instalment's interest is charged on the balance left after the
+    rounded principal of the ones before it, rounded exactly as the original
+    row-by-row schedule did, so existing schedules come out identical. The
+    rounding makes this a recurrence, so it is carried row by row; it costs
+    a few microseconds per instalment, next to the vectorised dates and the
+    bulk insert.
+    """
+    r = monthly_rate(annual_rate)
+    emi = float(emi)
+    balance = float(principal)
+
+    interest = [0.0] * tenure_months
+    principal_part = [0.0] * tenure_months
+    closing = [0.0] * tenure_months
+    for k in range(tenure_months):
+        i = round(balance * r, 2)
+        p = round(emi - i, 2)
+        balance -= p
+        interest[k] = i
+        principal_part[k] = p
+        closing[k] = balance
+
+    return (
+        np.array(interest, dtype=np.float64),
+        np.array(principal_part, dtype=np.float64),
+        np.round(np.array(closing, dtype=np.float64), 2)
+    )
+
+
+def schedule_rows(loan_id, principal, annual_rate, tenure_months, start_date, emi):
+    interest, principal_part, _ = amortisation(principal, annual_rate, tenure_months, emi)
+    due_dates = emi_due_dates(start_date, tenure_months)
+    emi = float(emi)
+
+    return [
+        {
+            "loan_id": loan_id,
+            "emi_number": number,
+            "due_date": due_date,
+            "emi_amount": emi,
+            "principal_component": p,
+            "interest_component": i,
+            "status": "PENDING",
+            "overdue_days": 0,
+            "penalty_amount": 0
+        }
+        for number, due_date, p, i in zip(
+            range(1, tenure_months + 1),
+            due_dates.tolist(),
+            principal_part.tolist(),
+            interest.tolist()
+        )
+    ]
+
+
+def insert_schedule(db, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Write EMI rows with multi-row INSERTs; the caller commits."""
+    for start in range(0, len(rows), chunk_size):
+        db.execute(insert(EMISchedule).values(rows[start:start + chunk_size]))
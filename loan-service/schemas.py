@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import List
-from datetime import date
+from typing import List, Optional
+from datetime import date, datetime
 
 class LoanCreate(BaseModel):
     customer_id: int
@@ -11,6 +11,7 @@ class LoanCreate(BaseModel):
     interest_rate: float
     tenure_months: int
     start_date: date
+    rate_type: str = "FIXED"
 
 class LoanResponse(BaseModel):
     loan_id: int
@@ -18,6 +19,14 @@ class LoanResponse(BaseModel):
     emi_amount: float
 
 
+class LoanBulkCreate(BaseModel):
+    loans: List[LoanCreate]
+
+class LoanBulkCreateResponse(BaseModel):
+    created: int
+    loans: List[LoanResponse]
+
+
 class EMIResult(BaseModel):
     loan_id: int
     customer_id: int | None = None
@@ -28,6 +37,54 @@ class EMIResult(BaseModel):
 
 class EMIProcessResponse(BaseModel):
     processed_emis: int
+    paid: int = 0
+    overdue: int = 0
+    failed: int = 0
+    in_doubt: int = 0
+    chunks: int = 0
+    elapsed_seconds: float = 0.0
+    throughput_per_sec: float = 0.0
     details: List[EMIResult]
 
 
+class EMIJobCreate(BaseModel):
+    business_date: Optional[date] = None
+
+class EMIJobResponse(BaseModel):
+    job_id: str
+    business_date: date
+    status: str
+    last_emi_id: int
+    processed_emis: int
+    paid: int
+    overdue: int
+    failed: int
+    in_doubt: int
+    chunks: int
+    error: Optional[str] = None
+    created_at: datetime
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LoanPrepayRequest(BaseModel):
+    amount: float
+    mode: str = "TENURE"   # TENURE: keep EMI, shorten loan / EMI: keep tenure, lower EMI
+    as_of: Optional[date] = None
+    reference: Optional[str] = None   # idempotency key for the debit; resend it on retry
+
+class LoanRepriceRequest(BaseModel):
+    new_rate: float
+    mode: str = "EMI"
+    as_of: Optional[date] = None
+
+class LoanBatchRepriceRequest(BaseModel):
+    loan_ids: Optional[List[int]] = None   # default: all active FLOATING loans
+    loan_type: Optional[str] = None
+    new_rate: Optional[float] = None
+    rate_delta: Optional[float] = None
+    mode: str = "EMI"
+    as_of: Optional[date] = None
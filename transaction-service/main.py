@@ -5,16 +5,24 @@ from schemas import (
     DebitRequest,
     CreditRequest,
     TransferRequest,
-    TransactionResponse
+    TransactionResponse,
+    CardSettlementRequest
 )
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from migrations import migrate
 import requests
 
 ACCOUNT_SERVICE_URL = "http://127.0.0.1:8001"
 LEDGER_SERVICE_URL = "http://127.0.0.1:8003"
 FRAUD_SERVICE_URL = "http://127.0.0.1:8007"
 
+# Upper bound on holds settled by one request (one capture call, one INSERT)
+MAX_SETTLEMENT_BATCH = 5000
+
 app = FastAPI(title="Transaction Service")
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -69,24 +77,52 @@ def debit_account(data: DebitRequest):
     db = SessionLocal()
     channel = data.channel or "SYSTEM"
 
+    # 🔁 a repeated reference never debits twice
+    txn = None
+    if data.reference:
+        txn = db.query(Transaction).filter(Transaction.reference == data.reference).first()
+        if txn is not None and txn.status == "COMPLETED":
+            db.close()
+            return txn
+        if txn is not None and txn.status != "FAILED":
+            db.close()
+            raise HTTPException(status_code=409, detail="Debit with this reference is in progress")
+
     account = get_account_and_branch(data.account_id)
 
     if account["balance"] < data.amount:
         db.close()
         raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    txn = Transaction(
-    account_id=data.account_id,
-    customer_id=account["customer_id"],   # 🔥 ADD
-    branch_id=account["branch_id"],
-    amount=data.amount,
-    transaction_type="DEBIT",
-    channel=channel,
-    status="INITIATED"
-)
+    if txn is not None:
+        # an earlier attempt failed before money moved; retry on the same row
+        reclaimed = db.query(Transaction).filter(
+            Transaction.transaction_id == txn.transaction_id,
+            Transaction.status == "FAILED"
+        ).update({Transaction.status: "INITIATED"}, synchronize_session=False)
+        if not reclaimed:
+            db.close()
+            raise HTTPException(status_code=409, detail="Debit with this reference is in progress")
+    else:
+        txn = Transaction(
+        account_id=data.account_id,
+        customer_id=account["customer_id"],   # 🔥 ADD
+        branch_id=account["branch_id"],
+        amount=data.amount,
+        transaction_type="DEBIT",
+        channel=channel,
+        status="INITIATED",
+        reference=data.reference
+    )
+        db.add(txn)
 
-    db.add(txn)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # a concurrent call with the same reference got there first
+        db.rollback()
+        db.close()
+        raise HTTPException(status_code=409, detail="Debit with this reference is in progress")
     db.refresh(txn)
 
     debit = requests.post(
@@ -246,3 +282,87 @@ def transfer_money(data: TransferRequest):
     db.close()
     return txn
 
+
+# -------------------------------------------------
+# CARD SETTLEMENT (BATCH CAPTURE OF AUTHORISATION HOLDS)
+# -------------------------------------------------
+@app.post("/transactions/card-settlement")
+def settle_card_holds(data: CardSettlementRequest):
+    if len(data.items) > MAX_SETTLEMENT_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_SETTLEMENT_BATCH} holds per request"
+        )
+
+    items = {item.hold_id: item for item in data.items}
+    if not items:
+        return {"settled": [], "failed": []}
+
+    # one call captures every hold in the batch
+    try:
+        capture = requests.post(
+            f"{ACCOUNT_SERVICE_URL}/accounts/holds/capture",
+            json={"hold_ids": list(items)},
+            timeout=30
+        )
+    except requests.exceptions.RequestException:
+        raise HTTPException(status_code=503, detail="Account service unavailable")
+    if capture.status_code != 200:
+        raise HTTPException(status_code=502, detail="Hold capture failed")
+
+    result = capture.json()
+    # a retried batch finds its holds already captured; those still need
+    # a transaction if the earlier attempt never recorded one
+    captured = result["captured"] + result["already_captured"]
+
+    db = SessionLocal()
+    try:
+        recorded = {
+            hold_id: txn_id
+            for hold_id, txn_id in db.query(Transaction.hold_id, Transaction.transaction_id)
+            .filter(Transaction.hold_id.in_(captured))
+        } if captured else {}
+
+        rows = [
+            {
+                "account_id": items[hold_id].account_id,
+                "customer_id": items[hold_id].customer_id,
+                "branch_id": items[hold_id].branch_id,
+                "amount": items[hold_id].amount,
+                "transaction_type": "DEBIT",
+                "channel": items[hold_id].channel or "CARD",
+                "status": "COMPLETED",
+                "hold_id": hold_id
+            }
+            for hold_id in captured
+            if hold_id not in recorded
+        ]
+        if rows:
+            db.execute(insert(Transaction).values(rows))
+            db.commit()
+
+        new_ids = [row["hold_id"] for row in rows]
+        created = {
+            hold_id: txn_id
+            for hold_id, txn_id in db.query(Transaction.hold_id, Transaction.transaction_id)
+            .filter(Transaction.hold_id.in_(new_ids))
+        } if new_ids else {}
+    finally:
+        db.close()
+
+    for hold_id, txn_id in created.items():
+        send_to_fraud_service(
+            txn_id=txn_id,
+            amount=items[hold_id].amount,
+            channel=items[hold_id].channel or "CARD",
+            branch_id=items[hold_id].branch_id
+        )
+
+    settled = {**recorded, **created}
+    return {
+        "settled": [
+            {"hold_id": hold_id, "transaction_id": settled[hold_id]}
+            for hold_id in captured
+        ],
+        "failed": result["failed"]
+    }
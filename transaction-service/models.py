@@ -14,5 +14,7 @@ class Transaction(Base):
     transaction_type = Column(String(20), nullable=False)
     channel = Column(String(30), nullable=False)
     status = Column(String(20), nullable=False)
+    hold_id = Column(Integer, unique=True)   # account hold captured by a card settlement
+    reference = Column(String(64), unique=True)   # caller's idempotency key for debits
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
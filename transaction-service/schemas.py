@@ -1,11 +1,12 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class DebitRequest(BaseModel):
     account_id: int
     amount: float
     channel: Optional[str] = "SYSTEM"
+    reference: Optional[str] = None   # idempotency key; a repeat returns the first debit
 
 
 class CreditRequest(BaseModel):
@@ -21,6 +22,19 @@ class TransferRequest(BaseModel):
     channel: Optional[str] = "SYSTEM"
 
 
+class CardSettlementItem(BaseModel):
+    hold_id: int
+    account_id: int
+    customer_id: int
+    branch_id: int
+    amount: float
+    channel: Optional[str] = "CARD"
+
+
+class CardSettlementRequest(BaseModel):
+    items: List[CardSettlementItem]
+
+
 class TransactionResponse(BaseModel):
     transaction_id: int
     account_id: int